@@ -7,6 +7,7 @@ from .utils.pdf import generate_invoice_pdf_bytes
 from .models_medical_records import (
     MedicalRecord, 
     MedicalRecordAttachment, 
+    AttachmentUpload,
     MedicalCertificate, 
     PatientTransfer,
     HMISClassification
@@ -17,6 +18,10 @@ from .models_financial import (
     FixedAsset,
     ConsumableInventory,
     ConsumableUsage,
+    ConsumableMovement,
+    ConsumableSnapshot,
+    StockTakeSession,
+    StockTakeCount,
     FinancialPeriod,
     StockAlert
 )
@@ -185,9 +190,11 @@ class NotificationLogAdmin(admin.ModelAdmin):
 # register/rest of models
 models_list = [PatientCard, Triage, WaitingQueueEntry,
                TariffAct, BillingItem, Invoice, Payment, Refund, Prescription, PrescriptionItem, InventoryItem, PharmacyStock,
-               PharmacyDispense, StockMovement, MedicalRecord, MedicalRecordAttachment, 
+               PharmacyDispense, StockReservation, StockMovement, MedicalRecord, MedicalRecordAttachment, AttachmentUpload,
                MedicalCertificate, PatientTransfer, HMISClassification,
-               Expense, Purchase, FixedAsset, ConsumableInventory, ConsumableUsage, FinancialPeriod, StockAlert]
+               Expense, Purchase, FixedAsset, ConsumableInventory, ConsumableUsage, ConsumableMovement, ConsumableSnapshot,
+               StockTakeSession, StockTakeCount, FinancialPeriod, StockAlert,
+               DoctorDailyStats, DoctorDiagnosisMonthly, PharmacyDailyDispense]
 for m in models_list:
     try:
         if m is Invoice:
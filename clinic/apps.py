@@ -11,9 +11,11 @@ class ClinicConfig(AppConfig):
 
 # clinic/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
     def ready(self):
         import clinic.signals
+        post_migrate.connect(clinic.signals.create_missing_stock_after_migrate, sender=self)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+from clinic.models import DoctorDiagnosisMonthly, MedicalRecord
+from clinic.utils.diagnosis import diagnosis_key, diagnosis_label
+
+
+class Command(BaseCommand):
+    help = 'Recompute normalized diagnosis keys and rebuild the per-doctor monthly diagnosis rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # 1. Normalized keys (bulk_update skips save(), so compute them here)
+        changed = []
+        updated = 0
+        records = MedicalRecord.objects.only('id', 'diagnosis', 'hmis_classification', 'diagnosis_key')
+        for record in records.iterator(chunk_size=batch_size):
+            key = diagnosis_key(record.diagnosis, record.hmis_classification)
+            if key != record.diagnosis_key:
+                record.diagnosis_key = key
+                changed.append(record)
+            if len(changed) >= batch_size:
+                MedicalRecord.objects.bulk_update(changed, ['diagnosis_key'])
+                updated += len(changed)
+                changed = []
+        if changed:
+            MedicalRecord.objects.bulk_update(changed, ['diagnosis_key'])
+            updated += len(changed)
+
+        # 2. Rollup rows, one grouped query
+        groups = (
+            MedicalRecord.objects.filter(visit__doctor__isnull=False)
+            .exclude(diagnosis_key='')
+            .annotate(month=TruncMonth('created_at', output_field=DateField()))
+            .values('visit__doctor_id', 'month', 'diagnosis_key')
+            .annotate(count=Count('id'))
+        )
+        labels = {}
+        for record in MedicalRecord.objects.exclude(diagnosis_key='').order_by('created_at').values(
+            'diagnosis_key', 'diagnosis', 'hmis_classification'
+        ).iterator(chunk_size=batch_size):
+            labels[record['diagnosis_key']] = (record['diagnosis'], record['hmis_classification'])
+
+        rows = [
+            DoctorDiagnosisMonthly(
+                doctor_id=group['visit__doctor_id'],
+                month=group['month'],
+                diagnosis_key=group['diagnosis_key'],
+                label=diagnosis_label(*labels[group['diagnosis_key']]),
+                count=group['count'],
+            )
+            for group in groups
+        ]
+        with transaction.atomic():
+            DoctorDiagnosisMonthly.objects.all().delete()
+            DoctorDiagnosisMonthly.objects.bulk_create(rows, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} diagnosis keys, rebuilt {len(rows)} monthly diagnosis rows"
+        ))
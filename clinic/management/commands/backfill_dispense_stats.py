@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+from clinic.models import PharmacyDailyDispense, PharmacyDispense, PharmacyStock
+
+
+class Command(BaseCommand):
+    help = 'Fill missing dispense ledger columns and rebuild the per-item daily dispense rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # 1. Ledger rows written before item/price were recorded
+        stock = PharmacyStock.objects.filter(pk=OuterRef('pharmacy_stock_id'))
+        filled = PharmacyDispense.objects.filter(item__isnull=True).update(
+            item_id=Subquery(stock.values('item_id')[:1]),
+            unit_price=Subquery(stock.values('unit_price')[:1]),
+        )
+
+        # 2. Rollup rows, one grouped query
+        groups = (
+            PharmacyDispense.objects.filter(item__isnull=False)
+            .annotate(date=TruncDate('dispensed_at'))
+            .values('item_id', 'date')
+            .annotate(
+                quantity=Sum('qty'),
+                value=Sum(F('qty') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+                dispenses=Count('id'),
+            )
+        )
+        rows = [PharmacyDailyDispense(**group) for group in groups]
+        with transaction.atomic():
+            PharmacyDailyDispense.objects.all().delete()
+            PharmacyDailyDispense.objects.bulk_create(rows, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Filled {filled} ledger rows, rebuilt {len(rows)} daily dispense rows"
+        ))
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from clinic.models import DoctorDailyStats, Invoice, Visit
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-doctor daily KPI rollup (DoctorDailyStats) from visits and invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days (default: full history)')
+        parser.add_argument('--doctor', type=int, help='Only rebuild rows for this ClinicUser id')
+
+    def handle(self, *args, **options):
+        visits = Visit.objects.filter(doctor__isnull=False)
+        invoices = Invoice.objects.filter(visit__doctor__isnull=False)
+        stale = DoctorDailyStats.objects.all()
+
+        if options['days']:
+            since = timezone.localdate() - timedelta(days=options['days'])
+            visits = visits.filter(created_at__date__gte=since)
+            invoices = invoices.filter(created_at__date__gte=since)
+            stale = stale.filter(date__gte=since)
+        if options['doctor']:
+            visits = visits.filter(doctor_id=options['doctor'])
+            invoices = invoices.filter(visit__doctor_id=options['doctor'])
+            stale = stale.filter(doctor_id=options['doctor'])
+
+        keys = set(
+            visits.annotate(day=TruncDate('created_at')).values_list('doctor_id', 'day').distinct()
+        )
+        keys.update(
+            invoices.annotate(day=TruncDate('created_at')).values_list('visit__doctor_id', 'day').distinct()
+        )
+
+        with transaction.atomic():
+            # Rows whose source data disappeared are removed by refresh(); rows
+            # outside ``keys`` have no source data left at all.
+            stale_ids = [row.id for row in stale.only('id', 'doctor_id', 'date') if (row.doctor_id, row.date) not in keys]
+            DoctorDailyStats.objects.filter(id__in=stale_ids).delete()
+
+            for doctor_id, day in sorted(keys):
+                DoctorDailyStats.refresh(doctor_id, day)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(keys)} doctor-day rows, removed {len(stale_ids)} stale rows"
+        ))
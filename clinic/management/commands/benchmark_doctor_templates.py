@@ -0,0 +1,108 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+
+from clinic import views_doctor
+from clinic.models import ClinicUser, Visit
+from clinic.views_doctor_enhanced import doctor_dashboard_enhanced
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how much of the doctor dashboard and visit page latency is query '
+        'time versus template time, with and without template fragment caching'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', help='Username of the doctor to render as (default: first doctor)')
+        parser.add_argument('--visit', type=int, help='Visit id for the visit page (default: latest visit of the doctor)')
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        doctors = ClinicUser.objects.filter(role='doctor').select_related('user')
+        if options['doctor']:
+            doctors = doctors.filter(user__username=options['doctor'])
+        doctor = doctors.first()
+        if not doctor:
+            raise CommandError('No matching doctor found.')
+
+        visit = Visit.objects.filter(pk=options['visit']) if options['visit'] else Visit.objects.filter(doctor=doctor)
+        visit = visit.order_by('-created_at').first()
+
+        targets = [('doctor dashboard', '/doctor/dashboard/', doctor_dashboard_enhanced, {})]
+        if visit:
+            targets.append(('visit detail', f'/doctor/visit/{visit.id}/', views_doctor.visit_detail, {'visit_id': visit.id}))
+        else:
+            self.stdout.write(self.style.WARNING('No visit found; skipping the visit page.'))
+
+        # Instrumented rendering lets us capture the context each view renders with.
+        setup_test_environment()
+        try:
+            for label, path, view, kwargs in targets:
+                self._benchmark(label, path, view, kwargs, doctor, options['iterations'])
+        finally:
+            teardown_test_environment()
+
+    def _request(self, path, doctor):
+        request = RequestFactory().get(path)
+        request.user = doctor.user if doctor else AnonymousUser()
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    def _benchmark(self, label, path, view, kwargs, doctor, iterations):
+        rendered = []
+
+        def capture(sender, template, context, **extra):
+            if not rendered:
+                rendered.append((template.name, context.flatten()))
+
+        template_rendered.connect(capture)
+        try:
+            response = view(self._request(path, doctor), **kwargs)
+        finally:
+            template_rendered.disconnect(capture)
+        if response.status_code != 200 or not rendered:
+            self.stderr.write(self.style.ERROR(f"{label}: view returned {response.status_code}"))
+            return
+
+        view_ms, query_ms, query_count = [], [], []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                view(self._request(path, doctor), **kwargs)
+                view_ms.append((time.perf_counter() - started) * 1000)
+            query_ms.append(sum(float(query['time']) for query in queries.captured_queries) * 1000)
+            query_count.append(len(queries))
+
+        template_name, context = rendered[0]
+        template = get_template(template_name)
+        request = self._request(path, doctor)
+
+        def render_ms():
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                template.render(context, request)
+                timings.append((time.perf_counter() - started) * 1000)
+            return timings
+
+        fragments_warm = render_ms()
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            fragments_off = render_ms()
+
+        def avg(values):
+            return sum(values) / len(values)
+
+        self.stdout.write(self.style.SUCCESS(f"{label} ({template_name}, {iterations} runs)"))
+        self.stdout.write(f"  full view:                  {avg(view_ms):8.2f} ms")
+        self.stdout.write(f"  queries:                    {avg(query_ms):8.2f} ms ({avg(query_count):.0f} queries)")
+        self.stdout.write(f"  template, fragments cached: {avg(fragments_warm):8.2f} ms")
+        self.stdout.write(f"  template, no fragment cache:{avg(fragments_off):8.2f} ms")
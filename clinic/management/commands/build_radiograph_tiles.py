@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from clinic.models import MedicalRecordAttachment
+from clinic.utils.tiles import TILED_FILE_TYPES, tile_now, wants_tiles
+
+
+class Command(BaseCommand):
+    help = 'Build missing deep-zoom tile pyramids for X-ray attachments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild pyramids that already exist (under new tile URLs)')
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        attachments = MedicalRecordAttachment.objects.filter(file_type__in=TILED_FILE_TYPES)
+        for attachment in attachments.iterator():
+            if not wants_tiles(attachment, options['force']):
+                continue
+            if tile_now(attachment.pk, options['force']) is None:
+                failed += 1
+            else:
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} tile pyramids, {failed} failed"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from clinic.utils.stock import create_missing_stock
+
+
+class Command(BaseCommand):
+    help = 'Create an empty pharmacy stock batch for every medicine that has none'
+
+    def handle(self, *args, **options):
+        created = create_missing_stock()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} pharmacy stock rows"))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.utils.forecast import (
+    DEFAULT_HISTORY_DAYS, DEFAULT_LEAD_TIME, DEFAULT_REVIEW_DAYS, DEFAULT_SERVICE_LEVEL, DEFAULT_WINDOW, METHODS,
+    apply_minimum_levels, reorder_report,
+)
+
+
+class Command(BaseCommand):
+    help = 'Forecast consumable and medicine demand and suggest reorder points and order quantities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_HISTORY_DAYS, help='Days of usage history to read')
+        parser.add_argument('--method', choices=METHODS, default='ewm', help='Moving average or exponential smoothing')
+        parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='Averaging window / smoothing span in days')
+        parser.add_argument('--lead-time', type=int, default=DEFAULT_LEAD_TIME, help='Supplier lead time in days')
+        parser.add_argument('--review-days', type=int, default=DEFAULT_REVIEW_DAYS, help='Days of demand to order beyond the reorder point')
+        parser.add_argument('--service-level', type=float, default=DEFAULT_SERVICE_LEVEL, help='Chance of not running out during lead time')
+        parser.add_argument('--csv', help='Write the full report to this CSV file')
+        parser.add_argument('--all', action='store_true', help='List every item, not only those to reorder')
+        parser.add_argument('--update-minimums', action='store_true', help='Set consumable minimum stock levels to the reorder points')
+
+    def handle(self, *args, **options):
+        if not 0 < options['service_level'] < 1:
+            raise CommandError('--service-level must be between 0 and 1')
+        report = reorder_report(
+            history_days=options['days'],
+            method=options['method'],
+            window=options['window'],
+            lead_time=options['lead_time'],
+            review_days=options['review_days'],
+            service_level=options['service_level'],
+        )
+
+        if options['csv']:
+            report.to_csv(options['csv'], index=False)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(report)} rows to {options['csv']}"))
+
+        rows = report if options['all'] else report[report['suggested_order'] > 0]
+        for row in rows.itertuples(index=False):
+            self.stdout.write(
+                f"{row.kind:<10} {row.name[:40]:<40} on hand {row.on_hand:>8g}  "
+                f"demand/day {row.daily_demand:>7g}  reorder at {row.reorder_point:>6g}  "
+                f"order {row.suggested_order:>6g} {row.unit or ''}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(report)} items forecast, {int((report['suggested_order'] > 0).sum())} to reorder"
+        ))
+
+        if options['update_minimums']:
+            updated = apply_minimum_levels(report)
+            self.stdout.write(self.style.SUCCESS(f"Updated the minimum stock level of {updated} consumables"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from clinic.models import ClinicUser, FixedAsset, MedicalRecordAttachment
+from clinic.utils.images import derive_now, needs_derivatives
+
+IMAGE_MODELS = [
+    (ClinicUser, 'profile_picture'),
+    (FixedAsset, 'photo'),
+    (MedicalRecordAttachment, 'file'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnails and previews for profile pictures, asset photos and image attachments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render derivatives that already exist')
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_MODELS:
+            rendered = failed = 0
+            instances = model.objects.exclude(**{field_name: ''}).exclude(**{f"{field_name}__isnull": True})
+            for instance in instances.only('pk', field_name, 'image_derivatives').iterator():
+                if not options['force'] and not needs_derivatives(instance, field_name):
+                    continue
+                if derive_now(model._meta.label, instance.pk, field_name) is None:
+                    failed += 1
+                else:
+                    rendered += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: rendered {rendered}, failed {failed}"
+            ))
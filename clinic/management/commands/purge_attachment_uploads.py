@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from clinic.models import AttachmentUpload
+from clinic.utils.attachments import delete_part
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked attachment uploads and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help='Remove unfinished uploads idle for this long')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = AttachmentUpload.objects.filter(attachment__isnull=True, updated_at__lt=cutoff)
+        removed = 0
+        for upload in stale.iterator():
+            delete_part(upload)
+            upload.delete()
+            removed += 1
+        # Finished sessions only matter while a client may still poll them.
+        finished, _ = AttachmentUpload.objects.filter(attachment__isnull=False, updated_at__lt=cutoff).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} abandoned uploads and {finished} finished upload sessions"
+        ))
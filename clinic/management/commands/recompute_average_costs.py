@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from clinic.utils.costing import recompute_average_costs
+
+
+class Command(BaseCommand):
+    help = 'Reset consumable and medicine average costs to the weighted average of their purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', help='Only weigh purchases made on or after this date (YYYY-MM-DD)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+        updated = recompute_average_costs(since)
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated['consumable']} consumable and {updated['inventory_item']} medicine costs"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from clinic.utils.stock_alerts import reconcile_alerts
+
+
+class Command(BaseCommand):
+    help = 'Open stock alerts for low, empty and expiring consumables and resolve alerts that no longer apply'
+
+    def handle(self, *args, **options):
+        created, resolved = reconcile_alerts()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} stock alerts, resolved {resolved}"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from clinic.utils.stock import refresh_qty_reserved, release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Release stock reservations whose prescriptions were not dispensed in time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true', help='Also rebuild every qty_reserved counter from active reservations'
+        )
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        if options['recount']:
+            refresh_qty_reserved()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired stock reservations"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from clinic.utils.ledger import build_snapshots, ledger_discrepancies
+
+
+class Command(BaseCommand):
+    help = 'Store month-end consumable stock snapshots from the stock ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true', help='Also list items whose on-hand quantity differs from the ledger'
+        )
+
+    def handle(self, *args, **options):
+        created = build_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} stock snapshots"))
+        if options['verify']:
+            mismatched = ledger_discrepancies()
+            for item in mismatched:
+                self.stdout.write(self.style.WARNING(
+                    f"{item.item_name}: on hand {item.quantity_in_stock}, ledger {item.ledger_quantity}"
+                ))
+            if not mismatched:
+                self.stdout.write(self.style.SUCCESS("On-hand quantities match the ledger"))
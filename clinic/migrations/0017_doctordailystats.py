@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 22:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0016_prescriptionitem_dosage_prescriptionitem_duration_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('completed_visits', models.PositiveIntegerField(default=0)),
+                ('patients', models.PositiveIntegerField(default=0, help_text='Distinct patients seen')),
+                ('billed_acts', models.PositiveIntegerField(default=0, help_text='Billed tariff acts (sum of quantities)')),
+                ('revenue_private', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue_insurance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='clinic.clinicuser')),
+            ],
+            options={
+                'verbose_name_plural': 'Doctor Daily Stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_daily_stats')],
+            },
+        ),
+    ]
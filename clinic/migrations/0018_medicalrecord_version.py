@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0017_doctordailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
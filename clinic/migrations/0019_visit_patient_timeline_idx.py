@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 22:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0018_medicalrecord_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='visit_patient_timeline_idx'),
+        ),
+    ]
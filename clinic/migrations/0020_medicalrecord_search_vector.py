@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 22:24
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+
+    MedicalRecord = apps.get_model('clinic', 'MedicalRecord')
+    weights = [
+        ('diagnosis', 'A'),
+        ('chief_complaint', 'B'),
+        ('treatment_plan', 'C'),
+        ('investigations', 'C'),
+        ('history_presenting_illness', 'D'),
+        ('specialty_examination', 'D'),
+        ('oral_examination', 'D'),
+    ]
+    vector = None
+    for field, weight in weights:
+        part = SearchVector(field, weight=weight, config='english')
+        vector = part if vector is None else vector + part
+    MedicalRecord.objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0019_visit_patient_timeline_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='medicalrecord_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['-created_at'], name='medicalrecord_created_idx'),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
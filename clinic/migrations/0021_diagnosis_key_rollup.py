@@ -0,0 +1,37 @@
+# Generated by Django 5.1 on 2026-10-18 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0020_medicalrecord_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='diagnosis_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=120),
+        ),
+        migrations.CreateModel(
+            name='DoctorDiagnosisMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the (local) month')),
+                ('diagnosis_key', models.CharField(max_length=120)),
+                ('label', models.CharField(blank=True, max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diagnosis_stats', to='clinic.clinicuser')),
+            ],
+            options={
+                'verbose_name_plural': 'Doctor Diagnosis Monthly Stats',
+                'ordering': ['-month', '-count'],
+                'indexes': [models.Index(fields=['doctor', 'month'], name='diagnosis_stats_doctor_month')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'month', 'diagnosis_key'), name='unique_doctor_diagnosis_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 22:31
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0021_diagnosis_key_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecordattachment',
+            name='checksum',
+            field=models.CharField(blank=True, help_text='SHA-256 of the file contents', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='medicalrecordattachment',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AttachmentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('file_type', models.CharField(choices=[('photo', 'Photo'), ('xray', 'X-Ray'), ('lab_result', 'Lab Result'), ('document', 'Document'), ('other', 'Other')], default='document', max_length=50)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('checksum', models.CharField(help_text='Expected SHA-256 of the whole file', max_length=64)),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attachment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='clinic.medicalrecordattachment')),
+                ('medical_record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_uploads', to='clinic.medicalrecord')),
+                ('uploaded_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='clinic.clinicuser')),
+            ],
+        ),
+    ]
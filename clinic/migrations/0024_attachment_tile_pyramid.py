@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0023_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecordattachment',
+            name='tile_pyramid',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0024_attachment_tile_pyramid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalcertificate',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='medicalcertificate',
+            name='pdf_file',
+            field=models.FileField(blank=True, editable=False, upload_to='certificates/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='medicalcertificate',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
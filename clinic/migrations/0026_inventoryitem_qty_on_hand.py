@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-18 22:46
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_qty_on_hand(apps, schema_editor):
+    InventoryItem = apps.get_model('clinic', 'InventoryItem')
+    PharmacyStock = apps.get_model('clinic', 'PharmacyStock')
+    batch_total = (
+        PharmacyStock.objects.filter(item=OuterRef('pk'))
+        .values('item')
+        .annotate(total=Sum('qty_available'))
+        .values('total')
+    )
+    InventoryItem.objects.update(qty_on_hand=Coalesce(Subquery(batch_total), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0025_certificate_pdf_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='qty_on_hand',
+            field=models.IntegerField(default=0, editable=False, help_text='Sum of qty_available over all pharmacy batches'),
+        ),
+        migrations.RunPython(populate_qty_on_hand, migrations.RunPython.noop),
+    ]
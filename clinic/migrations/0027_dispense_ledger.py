@@ -0,0 +1,70 @@
+# Generated by Django 5.1 on 2026-10-18 22:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0026_inventoryitem_qty_on_hand'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PharmacyDailyDispense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('dispenses', models.PositiveIntegerField(default=0, help_text='Ledger rows (batches issued)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Pharmacy Daily Dispenses',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pharmacydispense',
+            name='dispensed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dispenses', to='clinic.clinicuser'),
+        ),
+        migrations.AddField(
+            model_name='pharmacydispense',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dispenses', to='clinic.inventoryitem'),
+        ),
+        migrations.AddField(
+            model_name='pharmacydispense',
+            name='prescribed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prescribed_dispenses', to='clinic.clinicuser'),
+        ),
+        migrations.AddField(
+            model_name='pharmacydispense',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacydispense',
+            index=models.Index(fields=['dispensed_at'], name='dispense_dispensed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacydispense',
+            index=models.Index(fields=['item', 'dispensed_at'], name='dispense_item_dispensed_idx'),
+        ),
+        migrations.AddField(
+            model_name='pharmacydailydispense',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_dispenses', to='clinic.inventoryitem'),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacydailydispense',
+            index=models.Index(fields=['date'], name='daily_dispense_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pharmacydailydispense',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='unique_item_daily_dispense'),
+        ),
+    ]
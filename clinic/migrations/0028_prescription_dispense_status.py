@@ -0,0 +1,57 @@
+# Generated by Django 5.1 on 2026-10-18 22:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+
+
+def populate_dispense_status(apps, schema_editor):
+    Prescription = apps.get_model('clinic', 'Prescription')
+    PharmacyDispense = apps.get_model('clinic', 'PharmacyDispense')
+    # The pharmacy used to mark a dispensed prescription by flipping it to 'written'
+    dispensed = PharmacyDispense.objects.filter(prescription=OuterRef('pk'))
+    written = Prescription.objects.filter(prescription_type='written')
+    written.filter(Exists(dispensed)).update(
+        prescription_type='clinic',
+        dispense_status='dispensed',
+        dispensed_at=F('updated_at'),
+    )
+    written.update(dispense_status='external')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0027_dispense_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='dispense_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('dispensed', 'Dispensed'), ('external', 'Filled outside the clinic')], default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='dispensed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='dispensed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dispensed_prescriptions', to='clinic.clinicuser'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['dispense_status', 'created_at', 'id'], name='prescription_status_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['dispense_status', '-dispensed_at', '-id'], name='prescription_dispensed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['-created_at', '-id'], name='prescription_created_idx'),
+        ),
+        migrations.RunPython(populate_dispense_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1 on 2026-10-18 22:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    ConsumableInventory = apps.get_model('clinic', 'ConsumableInventory')
+    ConsumableMovement = apps.get_model('clinic', 'ConsumableMovement')
+    # Existing stock enters the ledger as one opening movement per item
+    ConsumableMovement.objects.bulk_create([
+        ConsumableMovement(
+            consumable=item,
+            movement_type='in',
+            quantity=item.quantity_in_stock,
+            unit_cost=item.average_unit_cost,
+            value=round(item.quantity_in_stock * item.average_unit_cost, 2),
+            occurred_at=item.created_at,
+            notes='Opening balance',
+        )
+        for item in ConsumableInventory.objects.exclude(quantity_in_stock=0)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0029_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumableMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('in', 'Stock In'), ('out', 'Stock Out'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unit_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('consumable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='clinic.consumableinventory')),
+                ('performed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consumable_movements', to='clinic.clinicuser')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='clinic.purchase')),
+                ('usage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='clinic.consumableusage')),
+            ],
+            options={
+                'ordering': ['-occurred_at', '-id'],
+                'indexes': [models.Index(fields=['occurred_at'], name='movement_occurred_idx'), models.Index(fields=['consumable', 'occurred_at'], name='movement_consumable_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsumableSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('consumable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='clinic.consumableinventory')),
+            ],
+            options={
+                'ordering': ['-period_end'],
+                'indexes': [models.Index(fields=['period_end'], name='snapshot_period_end_idx')],
+                'unique_together': {('consumable', 'period_end')},
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
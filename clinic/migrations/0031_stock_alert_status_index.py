@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0030_consumable_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['status', 'alert_type'], name='stock_alert_status_idx'),
+        ),
+    ]
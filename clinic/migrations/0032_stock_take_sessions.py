@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 23:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0031_stock_alert_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTakeSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('applied', 'Applied'), ('cancelled', 'Cancelled')], default='open', max_length=20)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('applied_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_takes_applied', to='clinic.clinicuser')),
+                ('started_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_takes_started', to='clinic.clinicuser')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockTakeCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expected_quantity', models.DecimalField(decimal_places=2, help_text='System quantity when counted', max_digits=10)),
+                ('counted_quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('notes', models.CharField(blank=True, default='', max_length=255)),
+                ('counted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('consumable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_take_counts', to='clinic.consumableinventory')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counts', to='clinic.stocktakesession')),
+            ],
+            options={
+                'unique_together': {('session', 'consumable')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-18 23:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef, Subquery
+
+
+def link_purchased_consumables(apps, schema_editor):
+    Purchase = apps.get_model('clinic', 'Purchase')
+    ConsumableInventory = apps.get_model('clinic', 'ConsumableInventory')
+    ConsumableMovement = apps.get_model('clinic', 'ConsumableMovement')
+    InventoryItem = apps.get_model('clinic', 'InventoryItem')
+    stock_types = ['consumable', 'medicine', 'supplies']
+    # Receipts already in the stock ledger name their consumable
+    receipts = ConsumableMovement.objects.filter(purchase=OuterRef('pk')).order_by('id')
+    Purchase.objects.filter(Exists(receipts)).update(consumable=Subquery(receipts.values('consumable')[:1]))
+    # Older purchases stored the consumable's id in inventory_item by mistake
+    same_consumable = ConsumableInventory.objects.filter(pk=OuterRef('inventory_item_id'), item_name=OuterRef('item_name'))
+    misfiled = Purchase.objects.filter(purchase_type__in=stock_types, consumable__isnull=True).filter(Exists(same_consumable))
+    misfiled.update(consumable=F('inventory_item_id'))
+    same_medicine = InventoryItem.objects.filter(pk=OuterRef('inventory_item_id'), name=OuterRef('item_name'))
+    Purchase.objects.filter(
+        purchase_type__in=stock_types, consumable_id=F('inventory_item_id')
+    ).exclude(Exists(same_medicine)).update(inventory_item=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0032_stock_take_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='consumable',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to='clinic.consumableinventory'),
+        ),
+        migrations.RunPython(link_purchased_consumables, migrations.RunPython.noop),
+    ]
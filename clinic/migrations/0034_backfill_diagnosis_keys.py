@@ -0,0 +1,60 @@
+from django.db import migrations
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+from clinic.utils.diagnosis import DIAGNOSIS_LABEL_LENGTH, diagnosis_key
+
+
+def backfill_diagnosis_keys(apps, schema_editor):
+    MedicalRecord = apps.get_model('clinic', 'MedicalRecord')
+    DoctorDiagnosisMonthly = apps.get_model('clinic', 'DoctorDiagnosisMonthly')
+    HMISClassification = apps.get_model('clinic', 'HMISClassification')
+    # Records written before 0021 have an empty key; bulk_update skips save()
+    changed = []
+    for record in MedicalRecord.objects.only('id', 'diagnosis', 'hmis_classification', 'diagnosis_key').iterator(chunk_size=500):
+        key = diagnosis_key(record.diagnosis, record.hmis_classification)
+        if key != record.diagnosis_key:
+            record.diagnosis_key = key
+            changed.append(record)
+    MedicalRecord.objects.bulk_update(changed, ['diagnosis_key'], batch_size=500)
+
+    # Rebuild the monthly rollup over every record, as backfill_diagnosis_stats does
+    names = dict(HMISClassification.objects.values_list('code', 'name'))
+    labels = {}
+    for key, diagnosis, hmis_code in MedicalRecord.objects.exclude(diagnosis_key='').order_by('created_at').values_list(
+        'diagnosis_key', 'diagnosis', 'hmis_classification'
+    ).iterator(chunk_size=500):
+        if hmis_code:
+            label = f"{hmis_code} - {names[hmis_code]}" if names.get(hmis_code) else hmis_code
+        else:
+            label = (diagnosis or '').strip().splitlines()[0] if (diagnosis or '').strip() else ''
+        labels[key] = label[:DIAGNOSIS_LABEL_LENGTH]
+    groups = (
+        MedicalRecord.objects.filter(visit__doctor__isnull=False)
+        .exclude(diagnosis_key='')
+        .annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('visit__doctor_id', 'month', 'diagnosis_key')
+        .annotate(count=Count('id'))
+    )
+    DoctorDiagnosisMonthly.objects.all().delete()
+    DoctorDiagnosisMonthly.objects.bulk_create([
+        DoctorDiagnosisMonthly(
+            doctor_id=group['visit__doctor_id'],
+            month=group['month'],
+            diagnosis_key=group['diagnosis_key'],
+            label=labels[group['diagnosis_key']],
+            count=group['count'],
+        )
+        for group in groups
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0033_purchase_consumable_link'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_diagnosis_keys, migrations.RunPython.noop),
+    ]
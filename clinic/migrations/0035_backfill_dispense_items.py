@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_dispense_items(apps, schema_editor):
+    PharmacyDispense = apps.get_model('clinic', 'PharmacyDispense')
+    PharmacyDailyDispense = apps.get_model('clinic', 'PharmacyDailyDispense')
+    PharmacyStock = apps.get_model('clinic', 'PharmacyStock')
+    # Ledger rows written before 0027 have no item or price
+    stock = PharmacyStock.objects.filter(pk=OuterRef('pharmacy_stock_id'))
+    PharmacyDispense.objects.filter(item__isnull=True).update(
+        item_id=Subquery(stock.values('item_id')[:1]),
+        unit_price=Subquery(stock.values('unit_price')[:1]),
+    )
+
+    # Rebuild the daily rollup over the whole ledger, as backfill_dispense_stats does
+    groups = (
+        PharmacyDispense.objects.filter(item__isnull=False)
+        .annotate(date=TruncDate('dispensed_at'))
+        .values('item_id', 'date')
+        .annotate(
+            quantity=Sum('qty'),
+            value=Sum(F('qty') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            dispenses=Count('id'),
+        )
+    )
+    PharmacyDailyDispense.objects.all().delete()
+    PharmacyDailyDispense.objects.bulk_create([PharmacyDailyDispense(**group) for group in groups], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0034_backfill_diagnosis_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_dispense_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0035_backfill_dispense_items'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attachmentupload',
+            name='checksum',
+            field=models.CharField(blank=True, help_text='Expected SHA-256 of the whole file; blank when only chunks are checksummed', max_length=64),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+# DoctorDailyStats.COMPLETED_STATUSES; historical models carry no class attributes
+COMPLETED_STATUSES = ['completed', 'awaiting_payment']
+
+
+def backfill_doctor_daily_stats(apps, schema_editor):
+    Visit = apps.get_model('clinic', 'Visit')
+    BillingItem = apps.get_model('clinic', 'BillingItem')
+    Invoice = apps.get_model('clinic', 'Invoice')
+    DoctorDailyStats = apps.get_model('clinic', 'DoctorDailyStats')
+
+    # Same figures as DoctorDailyStats.refresh, one grouped query per source table
+    rows = defaultdict(lambda: {
+        'visits': 0,
+        'completed_visits': 0,
+        'patients': 0,
+        'billed_acts': 0,
+        'revenue_private': Decimal('0'),
+        'revenue_insurance': Decimal('0'),
+    })
+    visits = (
+        Visit.objects.filter(doctor__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('doctor_id', 'day')
+        .annotate(
+            visits=Count('id'),
+            completed_visits=Count('id', filter=Q(status__in=COMPLETED_STATUSES)),
+            patients=Count('patient_id', distinct=True),
+        )
+        .order_by()
+    )
+    for group in visits:
+        row = rows[group['doctor_id'], group['day']]
+        row['visits'] = group['visits']
+        row['completed_visits'] = group['completed_visits']
+        row['patients'] = group['patients']
+    acts = (
+        BillingItem.objects.filter(visit__doctor__isnull=False)
+        .annotate(day=TruncDate('visit__created_at'))
+        .values('visit__doctor_id', 'day')
+        .annotate(total=Sum('qty'))
+        .order_by()
+    )
+    for group in acts:
+        rows[group['visit__doctor_id'], group['day']]['billed_acts'] = group['total'] or 0
+    revenue = (
+        Invoice.objects.filter(visit__doctor__isnull=False, paid=True)
+        .annotate(day=TruncDate('created_at'))
+        .values('visit__doctor_id', 'day')
+        .annotate(private=Sum('total_private'), insurance=Sum('total_insurance'))
+        .order_by()
+    )
+    for group in revenue:
+        row = rows[group['visit__doctor_id'], group['day']]
+        row['revenue_private'] = group['private'] or Decimal('0')
+        row['revenue_insurance'] = group['insurance'] or Decimal('0')
+
+    DoctorDailyStats.objects.all().delete()
+    DoctorDailyStats.objects.bulk_create([
+        DoctorDailyStats(doctor_id=doctor_id, date=day, **values)
+        for (doctor_id, day), values in rows.items()
+        if values['visits'] or values['revenue_private'] or values['revenue_insurance']
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0036_attachmentupload_optional_checksum'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_doctor_daily_stats, migrations.RunPython.noop),
+    ]
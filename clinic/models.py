@@ -24,6 +24,8 @@ class ClinicUser(models.Model):
     role = models.CharField(max_length=32, choices=ROLE_CHOICES)
     department = models.ForeignKey(Department, null=True, blank=True, on_delete=models.SET_NULL)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
+    # Thumbnail/preview names rendered by utils.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     phone = models.CharField(max_length=20, null=True, blank=True)
     def __str__(self): return f"{self.user.username} ({self.role})"
 
@@ -112,6 +114,13 @@ class Visit(models.Model):
     weight_kg = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)  # requested
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=32, default='open')  # open, billed, closed
+
+    class Meta:
+        indexes = [
+            # Patient timeline keyset pagination
+            models.Index(fields=['patient', '-created_at', '-id'], name='visit_patient_timeline_idx'),
+        ]
+
     def __str__(self): return f"Visit {self.id} - {self.patient}"
 
 # --- Triage & WaitingQueueEntry ---
@@ -235,11 +244,37 @@ class Prescription(models.Model):
         limit_choices_to={'role': 'doctor'},
         related_name='issued_prescriptions'
     )
+    STATUS_PENDING = 'pending'
+    STATUS_DISPENSED = 'dispensed'
+    STATUS_EXTERNAL = 'external'
+    DISPENSE_STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DISPENSED, 'Dispensed'),
+        (STATUS_EXTERNAL, 'Filled outside the clinic'),
+    ]
+
     prescription_type = models.CharField(max_length=20, choices=PRESCRIPTION_TYPES)
     instructions = models.TextField(blank=True, null=True)
+    dispense_status = models.CharField(max_length=16, choices=DISPENSE_STATUS_CHOICES, default=STATUS_PENDING)
+    dispensed_at = models.DateTimeField(null=True, blank=True)
+    dispensed_by = models.ForeignKey(
+        ClinicUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='dispensed_prescriptions'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Pharmacy queues: pending by age, history by dispense time, all by date
+            models.Index(fields=['dispense_status', 'created_at', 'id'], name='prescription_status_queue_idx'),
+            models.Index(fields=['dispense_status', '-dispensed_at', '-id'], name='prescription_dispensed_idx'),
+            models.Index(fields=['-created_at', '-id'], name='prescription_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.get_prescription_type_display()} - Visit {self.visit_id}"
 
@@ -277,10 +312,16 @@ class InventoryItem(models.Model):
     description = models.TextField(blank=True, null=True)
     unit = models.CharField(max_length=32, blank=True, null=True, default='units')
     unit_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    qty_on_hand = models.IntegerField(default=0, editable=False, help_text="Sum of qty_available over all pharmacy batches")
+    qty_reserved = models.IntegerField(default=0, editable=False, help_text="Held by active stock reservations")
     
     def __str__(self):
         return self.name
 
+    @property
+    def qty_free(self):
+        return self.qty_on_hand - self.qty_reserved
+
 class PharmacyStock(models.Model):
     item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='pharmacy_stocks')
     qty_available = models.IntegerField(default=0)
@@ -294,11 +335,65 @@ class PharmacyStock(models.Model):
         return f"{self.item.name} - Stock: {self.qty_available}"
 
 class PharmacyDispense(models.Model):
+    """Append-only ledger: one row per batch issued; corrections are new rows with negative qty"""
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE)
     pharmacy_stock = models.ForeignKey(PharmacyStock, on_delete=models.CASCADE)
+    item = models.ForeignKey(InventoryItem, null=True, on_delete=models.CASCADE, related_name='dispenses')
     qty = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    prescribed_by = models.ForeignKey(
+        ClinicUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='prescribed_dispenses'
+    )
+    dispensed_by = models.ForeignKey(
+        ClinicUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='dispenses'
+    )
     dispensed_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['dispensed_at'], name='dispense_dispensed_at_idx'),
+            models.Index(fields=['item', 'dispensed_at'], name='dispense_item_dispensed_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Dispense ledger rows cannot be changed; record a correcting row instead")
+        if self.item_id is None:
+            self.item_id = PharmacyStock.objects.filter(pk=self.pharmacy_stock_id).values_list('item_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+    @property
+    def value(self):
+        return self.qty * self.unit_price
+
+class StockReservation(models.Model):
+    """Stock held for a clinic prescription until the pharmacy issues it or the hold expires"""
+    STATUS_ACTIVE = 'active'
+    STATUS_ISSUED = 'issued'
+    STATUS_RELEASED = 'released'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_ISSUED, 'Issued'),
+        (STATUS_RELEASED, 'Released'),
+    ]
+
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='reservations')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='reservations')
+    qty = models.PositiveIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+            models.Index(fields=['prescription', 'status'], name='reservation_prescription_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item} x {self.qty} ({self.status})"
+
 class StockMovement(models.Model):
     inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE)
     movement_type = models.CharField(max_length=32, choices=[('in','In'),('out','Out')])
@@ -345,6 +440,7 @@ class NotificationLog(models.Model):
 from .models_medical_records import (
     MedicalRecord, 
     MedicalRecordAttachment, 
+    AttachmentUpload,
     MedicalCertificate, 
     PatientTransfer,
     HMISClassification
@@ -357,6 +453,17 @@ from .models_financial import (
     FixedAsset,
     ConsumableInventory,
     ConsumableUsage,
+    ConsumableMovement,
+    ConsumableSnapshot,
+    StockTakeSession,
+    StockTakeCount,
     FinancialPeriod,
     StockAlert
 )
+
+# Import reporting rollups
+from .models_analytics import (
+    DoctorDailyStats,
+    DoctorDiagnosisMonthly,
+    PharmacyDailyDispense,
+)
@@ -0,0 +1,264 @@
+# clinic/models_analytics.py
+"""
+Reporting rollups derived from operational data.
+Rows here are recomputed from visits, billing items, invoices, medical
+records and the dispense ledger and can be rebuilt at any time with
+``backfill_doctor_stats``, ``backfill_diagnosis_stats`` and
+``backfill_dispense_stats``.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+
+class DoctorDailyStats(models.Model):
+    """Per-doctor KPIs for a single (local) calendar day"""
+    COMPLETED_STATUSES = ['completed', 'awaiting_payment']
+
+    doctor = models.ForeignKey(
+        'ClinicUser',
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    date = models.DateField()
+
+    # Visits created on this day
+    visits = models.PositiveIntegerField(default=0)
+    completed_visits = models.PositiveIntegerField(default=0)
+    patients = models.PositiveIntegerField(default=0, help_text="Distinct patients seen")
+    billed_acts = models.PositiveIntegerField(default=0, help_text="Billed tariff acts (sum of quantities)")
+
+    # Paid invoices created on this day
+    revenue_private = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue_insurance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Doctor Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='unique_doctor_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} - {self.date}"
+
+    @property
+    def total_revenue(self):
+        return self.revenue_private + self.revenue_insurance
+
+    @classmethod
+    def refresh(cls, doctor_id, date):
+        """Recompute the row for ``doctor_id`` on ``date`` from the source tables."""
+        from .models import BillingItem, Invoice, Visit
+
+        visit_stats = Visit.objects.filter(doctor_id=doctor_id, created_at__date=date).aggregate(
+            visits=Count('id'),
+            completed_visits=Count('id', filter=Q(status__in=cls.COMPLETED_STATUSES)),
+            patients=Count('patient_id', distinct=True),
+        )
+        billed_acts = BillingItem.objects.filter(
+            visit__doctor_id=doctor_id,
+            visit__created_at__date=date,
+        ).aggregate(total=Sum('qty'))['total'] or 0
+        revenue = Invoice.objects.filter(
+            visit__doctor_id=doctor_id,
+            created_at__date=date,
+            paid=True,
+        ).aggregate(private=Sum('total_private'), insurance=Sum('total_insurance'))
+
+        values = {
+            **visit_stats,
+            'billed_acts': billed_acts,
+            'revenue_private': revenue['private'] or Decimal('0'),
+            'revenue_insurance': revenue['insurance'] or Decimal('0'),
+        }
+        if not (values['visits'] or values['revenue_private'] or values['revenue_insurance']):
+            cls.objects.filter(doctor_id=doctor_id, date=date).delete()
+            return None
+        stats, _ = cls.objects.update_or_create(doctor_id=doctor_id, date=date, defaults=values)
+        return stats
+
+    @classmethod
+    def summarize(cls, doctor, start=None, end=None):
+        """Sum the rollup rows for ``doctor`` between ``start`` and ``end`` (inclusive).
+
+        ``patients`` is summed per day, so a patient seen on two days counts twice.
+        """
+        rows = cls.objects.filter(doctor=doctor)
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+        totals = rows.aggregate(
+            visits=Sum('visits'),
+            completed_visits=Sum('completed_visits'),
+            patients=Sum('patients'),
+            billed_acts=Sum('billed_acts'),
+            revenue_private=Sum('revenue_private'),
+            revenue_insurance=Sum('revenue_insurance'),
+        )
+        totals = {key: value or 0 for key, value in totals.items()}
+        totals['revenue'] = totals['revenue_private'] + totals['revenue_insurance']
+        return totals
+
+
+class DoctorDiagnosisMonthly(models.Model):
+    """Medical records per doctor, month and normalized diagnosis key"""
+    doctor = models.ForeignKey(
+        'ClinicUser',
+        on_delete=models.CASCADE,
+        related_name='diagnosis_stats'
+    )
+    month = models.DateField(help_text="First day of the (local) month")
+    diagnosis_key = models.CharField(max_length=120)
+    label = models.CharField(max_length=200, blank=True)
+    count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', '-count']
+        verbose_name_plural = 'Doctor Diagnosis Monthly Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'month', 'diagnosis_key'], name='unique_doctor_diagnosis_month'),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'month'], name='diagnosis_stats_doctor_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} - {self.month:%Y-%m} - {self.label or self.diagnosis_key}"
+
+    @classmethod
+    def refresh(cls, doctor_id, month, diagnosis_key):
+        """Recount the row for ``doctor_id``/``month``/``diagnosis_key`` from medical records."""
+        from .models_medical_records import MedicalRecord
+        from .utils.diagnosis import diagnosis_label
+
+        month = month.replace(day=1)
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        records = MedicalRecord.objects.filter(
+            visit__doctor_id=doctor_id,
+            diagnosis_key=diagnosis_key,
+            created_at__date__gte=month,
+            created_at__date__lt=next_month,
+        )
+        count = records.count()
+        if not count:
+            cls.objects.filter(doctor_id=doctor_id, month=month, diagnosis_key=diagnosis_key).delete()
+            return None
+        latest = records.order_by('-created_at').values('diagnosis', 'hmis_classification').first()
+        stats, _ = cls.objects.update_or_create(
+            doctor_id=doctor_id,
+            month=month,
+            diagnosis_key=diagnosis_key,
+            defaults={
+                'count': count,
+                'label': diagnosis_label(latest['diagnosis'], latest['hmis_classification']),
+            },
+        )
+        return stats
+
+    @classmethod
+    def top(cls, doctor, start=None, end=None, limit=10):
+        """Most frequent diagnoses for ``doctor`` in the months between ``start`` and ``end``."""
+        rows = cls.objects.filter(doctor=doctor)
+        if start:
+            rows = rows.filter(month__gte=start.replace(day=1))
+        if end:
+            rows = rows.filter(month__lte=end)
+        return list(
+            rows.values('diagnosis_key')
+            .annotate(count=Sum('count'), diagnosis=Max('label'))
+            .order_by('-count', 'diagnosis_key')[:limit]
+        )
+
+
+class PharmacyDailyDispense(models.Model):
+    """Quantity and value issued per inventory item and (local) calendar day"""
+    item = models.ForeignKey(
+        'InventoryItem',
+        on_delete=models.CASCADE,
+        related_name='daily_dispenses'
+    )
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dispenses = models.PositiveIntegerField(default=0, help_text="Ledger rows (batches issued)")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Pharmacy Daily Dispenses'
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'date'], name='unique_item_daily_dispense'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_dispense_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item} - {self.date}: {self.quantity}"
+
+    @classmethod
+    def record(cls, dispenses):
+        """Add newly created ledger rows to their (item, day) totals with F() increments."""
+        totals = defaultdict(lambda: [0, Decimal('0'), 0])
+        for dispense in dispenses:
+            key = (dispense.item_id, timezone.localdate(dispense.dispensed_at))
+            totals[key][0] += dispense.qty
+            totals[key][1] += dispense.qty * dispense.unit_price
+            totals[key][2] += 1
+        for (item_id, date), (quantity, value, count) in totals.items():
+            increments = {
+                'quantity': F('quantity') + quantity,
+                'value': F('value') + value,
+                'dispenses': F('dispenses') + count,
+                'updated_at': timezone.now(),
+            }
+            if cls.objects.filter(item_id=item_id, date=date).update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(item_id=item_id, date=date, quantity=quantity, value=value, dispenses=count)
+            except IntegrityError:
+                # Another transaction created the row first
+                cls.objects.filter(item_id=item_id, date=date).update(**increments)
+
+    @classmethod
+    def refresh(cls, item_id, date):
+        """Recompute the row for ``item_id`` on ``date`` from the dispense ledger."""
+        from .models import PharmacyDispense
+
+        totals = PharmacyDispense.objects.filter(item_id=item_id, dispensed_at__date=date).aggregate(
+            quantity=Sum('qty'),
+            value=Sum(F('qty') * F('unit_price'), output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+            dispenses=Count('id'),
+        )
+        if not totals['dispenses']:
+            cls.objects.filter(item_id=item_id, date=date).delete()
+            return None
+        stats, _ = cls.objects.update_or_create(item_id=item_id, date=date, defaults=totals)
+        return stats
+
+    @classmethod
+    def top_items(cls, start=None, end=None, limit=10):
+        """Items with the most units issued between ``start`` and ``end`` (inclusive)."""
+        rows = cls.objects.all()
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+        return list(
+            rows.values('item_id', 'item__name')
+            .annotate(total=Sum('quantity'), value=Sum('value'))
+            .order_by('-total', 'item__name')[:limit]
+        )
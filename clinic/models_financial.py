@@ -126,6 +126,13 @@ class Purchase(models.Model):
         blank=True,
         related_name='purchases'
     )
+    consumable = models.ForeignKey(
+        'ConsumableInventory',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purchases'
+    )
     
     # Link to fixed asset if applicable
     fixed_asset = models.ForeignKey(
@@ -212,6 +219,8 @@ class FixedAsset(models.Model):
     warranty_expiry = models.DateField(null=True, blank=True)
     invoice_file = models.FileField(upload_to='assets/invoices/', null=True, blank=True)
     photo = models.ImageField(upload_to='assets/photos/', null=True, blank=True)
+    # Thumbnail/preview names rendered by utils.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -348,6 +357,151 @@ class ConsumableUsage(models.Model):
         return f"{self.consumable.item_name} - {self.quantity_used} {self.consumable.unit} - {self.usage_date}"
 
 
+class ConsumableMovement(models.Model):
+    """Append-only stock ledger: every receipt, issue and count correction of a consumable.
+
+    ``quantity`` and ``value`` are signed (issues are negative), so the stock
+    of an item at any moment is the sum of its movements up to that moment.
+    """
+    MOVEMENT_IN = 'in'
+    MOVEMENT_OUT = 'out'
+    MOVEMENT_ADJUSTMENT = 'adjustment'
+    MOVEMENT_TYPE_CHOICES = [
+        (MOVEMENT_IN, 'Stock In'),
+        (MOVEMENT_OUT, 'Stock Out'),
+        (MOVEMENT_ADJUSTMENT, 'Adjustment'),
+    ]
+
+    consumable = models.ForeignKey(
+        ConsumableInventory,
+        on_delete=models.CASCADE,
+        related_name='movements'
+    )
+    movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPE_CHOICES)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    occurred_at = models.DateTimeField(default=timezone.now)
+
+    purchase = models.ForeignKey(
+        Purchase,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    usage = models.ForeignKey(
+        ConsumableUsage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    performed_by = models.ForeignKey(
+        'ClinicUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='consumable_movements'
+    )
+    notes = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-occurred_at', '-id']
+        indexes = [
+            models.Index(fields=['occurred_at'], name='movement_occurred_idx'),
+            models.Index(fields=['consumable', 'occurred_at'], name='movement_consumable_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_movement_type_display()} {self.quantity} - {self.consumable.item_name}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements cannot be changed; record a correcting movement instead")
+        super().save(*args, **kwargs)
+
+
+class ConsumableSnapshot(models.Model):
+    """Quantity and value of a consumable at the end of a month, summed from the ledger"""
+    consumable = models.ForeignKey(
+        ConsumableInventory,
+        on_delete=models.CASCADE,
+        related_name='snapshots'
+    )
+    period_end = models.DateField()
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-period_end']
+        unique_together = ['consumable', 'period_end']
+        indexes = [
+            models.Index(fields=['period_end'], name='snapshot_period_end_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.consumable.item_name} - {self.period_end}: {self.quantity}"
+
+
+class StockTakeSession(models.Model):
+    """A physical count of consumables, applied to the stock in one go once reviewed"""
+    STATUS_OPEN = 'open'
+    STATUS_APPLIED = 'applied'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_APPLIED, 'Applied'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    started_by = models.ForeignKey(
+        'ClinicUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_takes_started'
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    applied_by = models.ForeignKey(
+        'ClinicUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_takes_applied'
+    )
+    applied_at = models.DateTimeField(null=True, blank=True)
+    notes = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Stock take #{self.pk} ({self.get_status_display()})"
+
+
+class StockTakeCount(models.Model):
+    """The counted quantity of one consumable in a stock take"""
+    session = models.ForeignKey(StockTakeSession, on_delete=models.CASCADE, related_name='counts')
+    consumable = models.ForeignKey(
+        ConsumableInventory,
+        on_delete=models.CASCADE,
+        related_name='stock_take_counts'
+    )
+    expected_quantity = models.DecimalField(max_digits=10, decimal_places=2, help_text="System quantity when counted")
+    counted_quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    notes = models.CharField(max_length=255, blank=True, default='')
+    counted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['session', 'consumable']
+
+    def __str__(self):
+        return f"{self.consumable.item_name}: {self.counted_quantity}"
+
+
 class FinancialPeriod(models.Model):
     """Track financial reporting periods"""
     PERIOD_TYPE_CHOICES = [
@@ -464,6 +618,9 @@ class StockAlert(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'alert_type'], name='stock_alert_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_alert_type_display()} - {self.created_at.date()}"
@@ -1,4 +1,8 @@
 # clinic/models_medical_records.py
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from .models import Visit, Patient, ClinicUser, Department
 
@@ -7,6 +11,8 @@ class MedicalRecord(models.Model):
     visit = models.OneToOneField(Visit, on_delete=models.CASCADE, related_name='medical_record')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on every save; autosave clients send it back for optimistic concurrency
+    version = models.PositiveIntegerField(default=1)
     
     # 1. Chief Complaint
     chief_complaint = models.TextField(blank=True, null=True, help_text="Main reason for visit")
@@ -80,30 +86,121 @@ class MedicalRecord(models.Model):
         ]
     )
     
+    # HMIS code or folded diagnosis text, set on save (see utils.diagnosis)
+    diagnosis_key = models.CharField(max_length=120, blank=True, default='', db_index=True, editable=False)
+
+    # Full-text search document, maintained by clinic.signals (see utils.clinical_search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='medicalrecord_search_gin'),
+            models.Index(fields=['-created_at'], name='medicalrecord_created_idx'),
+        ]
+
+    # Fields doctors edit in the record forms (and may autosave individually)
+    EDITABLE_FIELDS = (
+        'chief_complaint', 'history_presenting_illness', 'past_medical_history',
+        'past_dental_history', 'current_medications', 'allergies', 'social_history',
+        'family_history', 'review_of_systems', 'general_examination', 'oral_examination',
+        'specialty_examination', 'investigations', 'diagnosis', 'treatment_plan',
+        'hmis_classification', 'idsr_disease',
+    )
+
     def __str__(self):
         return f"Medical Record - Visit {self.visit.id} - {self.visit.patient}"
 
+    def save(self, *args, **kwargs):
+        from .utils.diagnosis import diagnosis_key
+
+        self.diagnosis_key = diagnosis_key(self.diagnosis, self.hmis_classification)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'diagnosis', 'hmis_classification'} & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['diagnosis_key']
+        super().save(*args, **kwargs)
+
+    def apply_changes(self, values):
+        """Write only the fields in ``values`` that differ and bump ``version``.
+
+        Returns the list of changed fields; nothing is written when it is empty.
+        """
+        changed = []
+        for field, value in values.items():
+            if field not in self.EDITABLE_FIELDS:
+                continue
+            if (getattr(self, field) or '') != (value or ''):
+                setattr(self, field, value)
+                changed.append(field)
+        if not self.pk:
+            self.save()
+        elif changed:
+            self.version += 1
+            self.save(update_fields=changed + ['version', 'updated_at'])
+        return changed
+
+
+ATTACHMENT_FILE_TYPES = [
+    ('photo', 'Photo'),
+    ('xray', 'X-Ray'),
+    ('lab_result', 'Lab Result'),
+    ('document', 'Document'),
+    ('other', 'Other'),
+]
+
 
 class MedicalRecordAttachment(models.Model):
     """Attachments for medical records (photos, documents)"""
     medical_record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, 
         related_name='attachments')
     file = models.FileField(upload_to='medical_records/%Y/%m/')
-    file_type = models.CharField(max_length=50, choices=[
-        ('photo', 'Photo'),
-        ('xray', 'X-Ray'),
-        ('lab_result', 'Lab Result'),
-        ('document', 'Document'),
-        ('other', 'Other'),
-    ])
+    file_type = models.CharField(max_length=50, choices=ATTACHMENT_FILE_TYPES)
     description = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(ClinicUser, on_delete=models.SET_NULL, null=True)
+    # Filled by the chunked upload endpoint; used as the download ETag
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    checksum = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the file contents")
+    # Thumbnail/preview names rendered by utils.images (image files only)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Deep-zoom tile layout for X-ray images (see utils.tiles)
+    tile_pyramid = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.file_type} - {self.medical_record.visit.patient}"
 
 
+class AttachmentUpload(models.Model):
+    """Resumable chunked upload of a medical record attachment.
+
+    Chunks are appended to a part file (see ``utils.attachments``); once
+    ``received`` reaches ``size`` (and the SHA-256 matches ``checksum`` when
+    the client announced one) the file is moved to storage as a
+    ``MedicalRecordAttachment``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    medical_record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE,
+        related_name='pending_uploads')
+    uploaded_by = models.ForeignKey(ClinicUser, on_delete=models.SET_NULL, null=True)
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=50, choices=ATTACHMENT_FILE_TYPES, default='document')
+    description = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64, blank=True,
+        help_text="Expected SHA-256 of the whole file; blank when only chunks are checksummed")
+    received = models.PositiveBigIntegerField(default=0)
+    attachment = models.OneToOneField(MedicalRecordAttachment, on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+    @property
+    def completed(self):
+        return self.attachment_id is not None
+
+
 class MedicalCertificate(models.Model):
     """Medical certificates issued by doctors"""
     visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name='certificates')
@@ -131,6 +228,11 @@ class MedicalCertificate(models.Model):
     printed = models.BooleanField(default=False)
     printed_at = models.DateTimeField(blank=True, null=True)
     
+    # Stored PDF and the hash of the content it was rendered from (see utils.certificates)
+    pdf_file = models.FileField(upload_to='certificates/%Y/%m/', blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    rendered_at = models.DateTimeField(blank=True, null=True, editable=False)
+    
     def __str__(self):
         return f"{self.certificate_type} - {self.patient} - {self.issue_date}"
 
@@ -1,14 +1,34 @@
+import logging
+from decimal import Decimal
+
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
-from django.db.models.signals import post_save, pre_save
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
-from .models import Appointment, BillingItem, ClinicUser, Invoice, Payment, Visit, InventoryItem, PharmacyStock
+from .models import (
+    Appointment, BillingItem, ClinicUser, Department, Invoice, Payment, Visit, InventoryItem, PharmacyDispense,
+    PharmacyStock, StockReservation, TariffAct,
+)
+from .models_analytics import DoctorDailyStats, DoctorDiagnosisMonthly, PharmacyDailyDispense
+from .models_financial import ConsumableInventory, ConsumableMovement, ConsumableUsage, FixedAsset
+from .models_medical_records import HMISClassification, MedicalRecord, MedicalRecordAttachment
 from .utils import generate_invoice_pdf
+from .utils.clinical_search import SEARCH_WEIGHTS, refresh_search_vectors
+from .utils.dashboard_cache import invalidate_doctor_dashboard
+from .utils.images import delete_derivatives, needs_derivatives, schedule_derivatives
+from .utils.ledger import record_movement
+from .utils.reference_data import invalidate_reference_data
+from .utils.stock import adjust_reserved, create_missing_stock, refresh_qty_on_hand
+from .utils.tiles import delete_pyramid, schedule_tiles, wants_tiles
 from .utils.notifications import NotificationCategory, notify_patient, notify_staff
 
+logger = logging.getLogger(__name__)
+
 
 ROLE_LABELS = dict(ClinicUser.ROLE_CHOICES)
 
@@ -146,3 +166,300 @@ def create_pharmacy_stock_for_medicine(sender, instance, created, **kwargs):
                 qty_available=0,
                 unit_price=instance.unit_cost
             )
+
+
+def create_missing_stock_after_migrate(sender, **kwargs):
+    """post_migrate hook (connected in ``ClinicConfig.ready``) covering medicines imported in bulk."""
+    apps = kwargs.get('apps')
+    if apps is None:
+        return
+    try:
+        apps.get_model('clinic', 'PharmacyStock')
+    except LookupError:
+        # Migrating backwards past the pharmacy tables
+        return
+    created = create_missing_stock(apps=apps, using=kwargs.get('using', DEFAULT_DB_ALIAS))
+    if created:
+        logger.info("Created %s missing pharmacy stock rows", created)
+
+
+# --- Doctor dashboard snapshot invalidation ---
+
+def _visit_doctor_id(visit_id):
+    return Visit.objects.filter(pk=visit_id).values_list('doctor_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Visit)
+@receiver(pre_save, sender=Appointment)
+def cache_previous_doctor(sender, instance, **kwargs):
+    if not instance.pk:
+        instance._previous_doctor_id = None
+        return
+    instance._previous_doctor_id = (
+        sender.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_dashboard_for_doctor(sender, instance, **kwargs):
+    invalidate_doctor_dashboard(instance.doctor_id, getattr(instance, '_previous_doctor_id', None))
+
+
+@receiver(post_save, sender=BillingItem)
+@receiver(post_delete, sender=BillingItem)
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invalidate_dashboard_for_visit(sender, instance, **kwargs):
+    invalidate_doctor_dashboard(_visit_doctor_id(instance.visit_id))
+
+
+# --- Doctor daily KPI rollup ---
+
+def _local_date(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _refresh_doctor_stats(doctor_ids, *dates):
+    for doctor_id in {doctor_id for doctor_id in doctor_ids if doctor_id}:
+        for day in {_local_date(value) for value in dates if value}:
+            DoctorDailyStats.refresh(doctor_id, day)
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+def refresh_stats_for_visit(sender, instance, **kwargs):
+    doctor_ids = [instance.doctor_id, getattr(instance, '_previous_doctor_id', None)]
+    invoice_created_at = Invoice.objects.filter(visit_id=instance.pk).values_list('created_at', flat=True).first()
+    _refresh_doctor_stats(doctor_ids, instance.created_at, invoice_created_at)
+
+
+@receiver(post_save, sender=BillingItem)
+@receiver(post_delete, sender=BillingItem)
+def refresh_stats_for_billing_item(sender, instance, **kwargs):
+    visit = Visit.objects.filter(pk=instance.visit_id).values('doctor_id', 'created_at').first()
+    if visit:
+        _refresh_doctor_stats([visit['doctor_id']], visit['created_at'])
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_stats_for_invoice(sender, instance, **kwargs):
+    _refresh_doctor_stats([_visit_doctor_id(instance.visit_id)], instance.created_at)
+
+
+# --- Reference data cache invalidation ---
+
+@receiver(post_save, sender=HMISClassification)
+@receiver(post_delete, sender=HMISClassification)
+def invalidate_hmis_reference(sender, instance, **kwargs):
+    invalidate_reference_data('hmis')
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_department_reference(sender, instance, **kwargs):
+    # Doctor lists carry the department name as well.
+    invalidate_reference_data('departments', 'doctors')
+
+
+@receiver(post_save, sender=ClinicUser)
+@receiver(post_delete, sender=ClinicUser)
+def invalidate_doctor_reference(sender, instance, **kwargs):
+    invalidate_reference_data('doctors')
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_names(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login; skip those to keep the doctor list warm.
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_reference_data('doctors')
+
+
+@receiver(post_save, sender=TariffAct)
+@receiver(post_delete, sender=TariffAct)
+def invalidate_tariff_reference(sender, instance, **kwargs):
+    invalidate_reference_data('tariffs')
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_delete, sender=PharmacyStock)
+def invalidate_stock_reference(sender, instance, **kwargs):
+    invalidate_reference_data('pharmacy_stock')
+
+
+@receiver(post_save, sender=PharmacyStock)
+def invalidate_stock_reference_on_create(sender, instance, created, **kwargs):
+    # Quantity changes are covered by the short stock TTL.
+    if created:
+        invalidate_reference_data('pharmacy_stock')
+
+
+# --- Dispense ledger rollup ---
+
+@receiver(post_save, sender=PharmacyDispense)
+def record_daily_dispense(sender, instance, created, **kwargs):
+    # Ledger rows are append-only, so only inserts change the totals.
+    if created and instance.item_id:
+        PharmacyDailyDispense.record([instance])
+
+
+@receiver(post_delete, sender=PharmacyDispense)
+def refresh_daily_dispense_on_delete(sender, instance, **kwargs):
+    if instance.item_id:
+        PharmacyDailyDispense.refresh(instance.item_id, _local_date(instance.dispensed_at))
+
+
+# --- Quantity on hand ---
+
+@receiver(post_save, sender=PharmacyStock)
+@receiver(post_delete, sender=PharmacyStock)
+def refresh_item_qty_on_hand(sender, instance, **kwargs):
+    # Bulk updates skip signals; callers refresh explicitly (see utils.stock).
+    refresh_qty_on_hand([instance.item_id])
+
+
+# --- Stock reservations ---
+
+@receiver(post_delete, sender=StockReservation)
+def release_deleted_reservation(sender, instance, **kwargs):
+    # Deleting a prescription cascades here; give its held stock back.
+    if instance.status == StockReservation.STATUS_ACTIVE:
+        adjust_reserved({instance.item_id: -instance.qty})
+
+
+# --- Consumable stock ledger ---
+
+@receiver(post_save, sender=ConsumableInventory)
+def record_opening_balance(sender, instance, created, **kwargs):
+    # Items created with stock already on hand open the ledger with it.
+    # Values may still be the strings a view passed to create().
+    if not created:
+        return
+    quantity = Decimal(str(instance.quantity_in_stock or 0))
+    if quantity:
+        unit_cost = Decimal(str(instance.average_unit_cost or 0))
+        ConsumableMovement.objects.create(
+            consumable=instance,
+            movement_type=ConsumableMovement.MOVEMENT_IN,
+            quantity=quantity,
+            unit_cost=unit_cost,
+            value=(quantity * unit_cost).quantize(Decimal('0.01')),
+            notes='Opening balance',
+        )
+
+
+@receiver(post_save, sender=ConsumableUsage)
+def record_consumable_usage(sender, instance, created, **kwargs):
+    if created:
+        record_movement(
+            instance.consumable,
+            -Decimal(str(instance.quantity_used)),
+            ConsumableMovement.MOVEMENT_OUT,
+            usage=instance,
+            performed_by=instance.used_by,
+        )
+
+
+# --- Medical record full-text search ---
+
+@receiver(post_save, sender=MedicalRecord)
+def refresh_medical_record_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SEARCH_WEIGHTS):
+        return
+    refresh_search_vectors(MedicalRecord.objects.filter(pk=instance.pk))
+
+
+# --- Diagnosis frequency rollup ---
+
+DIAGNOSIS_FIELDS = {'diagnosis', 'hmis_classification'}
+
+
+def _refresh_diagnosis_stats(doctor_ids, created_at, *keys):
+    month = _local_date(created_at).replace(day=1)
+    for doctor_id in {doctor_id for doctor_id in doctor_ids if doctor_id}:
+        for key in {key for key in keys if key}:
+            DoctorDiagnosisMonthly.refresh(doctor_id, month, key)
+
+
+@receiver(pre_save, sender=MedicalRecord)
+def cache_previous_diagnosis_key(sender, instance, update_fields=None, **kwargs):
+    instance._previous_diagnosis_key = None
+    if instance.pk and (update_fields is None or DIAGNOSIS_FIELDS & set(update_fields)):
+        instance._previous_diagnosis_key = (
+            MedicalRecord.objects.filter(pk=instance.pk).values_list('diagnosis_key', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=MedicalRecord)
+def refresh_diagnosis_stats_for_record(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and not DIAGNOSIS_FIELDS & set(update_fields):
+        return
+    previous_key = getattr(instance, '_previous_diagnosis_key', None)
+    if not created and previous_key == instance.diagnosis_key:
+        return
+    _refresh_diagnosis_stats(
+        [_visit_doctor_id(instance.visit_id)], instance.created_at, instance.diagnosis_key, previous_key
+    )
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def refresh_diagnosis_stats_on_delete(sender, instance, **kwargs):
+    _refresh_diagnosis_stats([_visit_doctor_id(instance.visit_id)], instance.created_at, instance.diagnosis_key)
+
+
+@receiver(post_save, sender=Visit)
+def refresh_diagnosis_stats_for_reassigned_visit(sender, instance, **kwargs):
+    previous_doctor_id = getattr(instance, '_previous_doctor_id', None)
+    if not previous_doctor_id or previous_doctor_id == instance.doctor_id:
+        return
+    record = MedicalRecord.objects.filter(visit_id=instance.pk).values('created_at', 'diagnosis_key').first()
+    if record:
+        _refresh_diagnosis_stats(
+            [previous_doctor_id, instance.doctor_id], record['created_at'], record['diagnosis_key']
+        )
+
+
+# --- Image thumbnails and previews ---
+
+IMAGE_FIELDS = {
+    ClinicUser: 'profile_picture',
+    FixedAsset: 'photo',
+    MedicalRecordAttachment: 'file',
+}
+
+
+@receiver(post_save, sender=ClinicUser)
+@receiver(post_save, sender=FixedAsset)
+@receiver(post_save, sender=MedicalRecordAttachment)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if needs_derivatives(instance, IMAGE_FIELDS[sender]):
+        schedule_derivatives(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(post_delete, sender=ClinicUser)
+@receiver(post_delete, sender=FixedAsset)
+@receiver(post_delete, sender=MedicalRecordAttachment)
+def delete_image_derivatives(sender, instance, **kwargs):
+    delete_derivatives(instance.image_derivatives, getattr(instance, IMAGE_FIELDS[sender]).storage)
+
+
+# --- Radiograph deep-zoom tiles ---
+
+@receiver(post_save, sender=MedicalRecordAttachment)
+def schedule_radiograph_tiles(sender, instance, raw=False, **kwargs):
+    if not raw and wants_tiles(instance):
+        schedule_tiles(instance)
+
+
+@receiver(post_delete, sender=MedicalRecordAttachment)
+def delete_radiograph_tiles(sender, instance, **kwargs):
+    delete_pyramid(instance.tile_pyramid, instance.file.storage)
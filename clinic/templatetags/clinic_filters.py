@@ -1,6 +1,8 @@
 from django import template
 from datetime import date
 
+from clinic.utils.images import derived_url
+
 register = template.Library()
 
 @register.filter
@@ -11,3 +13,9 @@ def calculate_age(birth_date):
     today = date.today()
     age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
     return age
+
+
+@register.filter
+def derived(fieldfile, size):
+    """URL of a thumbnail/preview size of an uploaded image (falls back to the original)"""
+    return derived_url(fieldfile, size)
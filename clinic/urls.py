@@ -6,6 +6,7 @@ from . import views_patient_workflow
 from . import views_cashier
 from . import views_pharmacy
 from . import views_inventory
+from . import views_timeline
 
 router = DefaultRouter()
 router.register(r'patients', PatientViewSet, basename='patient')
@@ -32,6 +33,7 @@ workflow_urls = [
     path('api/add-billing-item/', views_patient_workflow.api_add_billing_item, name='api_add_billing_item'),
     path('api/remove-billing-item/', views_patient_workflow.api_remove_billing_item, name='api_remove_billing_item'),
     path('api/invoice/<int:invoice_id>/', views_patient_workflow.api_get_invoice_data, name='api_invoice_data'),
+    path('api/patient/<int:patient_id>/timeline/', views_timeline.patient_timeline, name='api_patient_timeline'),
 ]
 
 urlpatterns += workflow_urls
@@ -60,6 +62,7 @@ urlpatterns += [
     path('cashier/dashboard/', views_cashier.cashier_dashboard, name='cashier_dashboard'),
     path('cashier/invoice/<int:visit_id>/', views_cashier.view_invoice, name='view_invoice'),
     path('cashier/print/<int:visit_id>/', views_cashier.print_invoice, name='print_invoice'),
+    path('cashier/receipt/<int:visit_id>/thermal/', views_cashier.thermal_receipt, name='thermal_receipt'),
     path('cashier/mark-paid/<int:visit_id>/', views_cashier.mark_paid, name='mark_paid'),
     path('cashier/payments/', views_cashier.cashier_payments, name='cashier_payments'),
     path('cashier/reconciliation/', views_cashier.cashier_daily_reconciliation, name='cashier_reconciliation'),
@@ -68,6 +71,7 @@ urlpatterns += [
     path('cashier/refund/<int:refund_id>/process/', views_cashier.process_refund, name='process_refund'),
     path('cashier/receipts/', views_cashier.view_receipts, name='view_receipts'),
     path('cashier/prescription/<int:prescription_id>/print/', views_cashier.cashier_print_prescription, name='cashier_print_prescription'),
+    path('cashier/print-queue/', views_cashier.print_queue, name='cashier_print_queue'),
     
     # Pharmacy Dashboard
     path('pharmacy/login/', views_pharmacy.pharmacy_login, name='pharmacy_login'),
@@ -99,6 +103,7 @@ urlpatterns += [
     path('inventory/add-item/', views_inventory.inventory_add_item_view, name='inventory_add_item'),
     path('inventory/add-equipment/', views_inventory.inventory_add_equipment_view, name='inventory_add_equipment'),
     path('inventory/stock-take/', views_inventory.inventory_stock_take_view, name='inventory_stock_take'),
+    path('inventory/stock-take/<int:session_id>/preview/', views_inventory.inventory_stock_take_preview, name='inventory_stock_take_preview'),
     path('inventory/maintenance-log/', views_inventory.inventory_maintenance_log_view, name='inventory_maintenance_log'),
     
     # Financial Dashboard
@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views_doctor
+from . import views_attachments, views_doctor
 from .views_doctor_enhanced import (
     doctor_dashboard_enhanced,
     medical_record_form,
     billing_sheet,
     delete_billing_item,
     generate_medical_certificate,
+    certificate_pdf,
     transfer_patient,
     create_followup_appointment,
     send_to_cashier,
@@ -13,6 +14,7 @@ from .views_doctor_enhanced import (
     waiting_queue,
     in_consultation_list,
     medical_records_list,
+    clinical_search,
     my_statistics,
     prescriptions_list,
     print_prescription,
@@ -42,6 +44,7 @@ urlpatterns = [
     
     # Certificates
     path('certificate/<int:visit_id>/', generate_medical_certificate, name='generate_medical_certificate'),
+    path('certificate/<int:certificate_id>/pdf/', certificate_pdf, name='certificate_pdf'),
     
     # Patient Transfer
     path('transfer/<int:visit_id>/', transfer_patient, name='transfer_patient'),
@@ -54,6 +57,7 @@ urlpatterns = [
     path('waiting-queue/', waiting_queue, name='waiting_queue'),
     path('in-consultation/', in_consultation_list, name='in_consultation_list'),
     path('medical-records/', medical_records_list, name='medical_records_list'),
+    path('clinical-search/', clinical_search, name='clinical_search'),
     path('my-statistics/', my_statistics, name='my_statistics'),
     path('prescriptions/', prescriptions_list, name='prescriptions_list'),    path('prescriptions/<int:prescription_id>/print/', print_prescription, name='print_prescription'),    path('certificates/', medical_certificates_list, name='medical_certificates_list'),
     path('transfers/', patient_transfers_list, name='patient_transfers_list'),
@@ -65,6 +69,12 @@ urlpatterns = [
     
     # Original URLs (kept for compatibility)
     path('visit/<int:visit_id>/', views_doctor.visit_detail, name='doctor-visit-detail'),
+    path('visit/<int:visit_id>/medical-record/autosave/', views_doctor.autosave_medical_record, name='doctor-autosave-medical-record'),
+    path('visit/<int:visit_id>/attachments/uploads/', views_attachments.start_attachment_upload, name='doctor-attachment-upload-start'),
+    path('attachments/uploads/<uuid:upload_id>/', views_attachments.attachment_upload, name='doctor-attachment-upload'),
+    path('attachments/<int:attachment_id>/download/', views_attachments.download_attachment, name='doctor-attachment-download'),
+    path('attachments/<int:attachment_id>/viewer/', views_attachments.radiograph_viewer, name='doctor-attachment-viewer'),
+    path('attachments/<int:attachment_id>/tiles/<slug:version>/<int:level>/<int:col>_<int:row>.jpg', views_attachments.radiograph_tile, name='doctor-attachment-tile'),
     path('visit/<int:visit_id>/save-triage/', views_doctor.save_triage, name='doctor-save-triage'),
     path('visit/<int:visit_id>/add-act/', views_doctor.add_act, name='doctor-add-act'),
     path('visit/<int:visit_id>/prescription/', views_doctor.save_prescription, name='doctor-save-prescription'),
@@ -0,0 +1,247 @@
+"""Chunked uploads and ranged downloads for medical record attachments.
+
+Radiographs and scanned lab reports are large enough that buffering a whole
+multipart body (or a whole file on download) ties up a worker and restarts
+from zero on every network hiccup. Uploads are appended chunk by chunk to a
+part file under ``ATTACHMENT_UPLOAD_DIR``; each chunk is checked against the
+SHA-256 the client sent with it, and the finished file against the whole-file
+SHA-256 when one was announced, before it reaches storage. Downloads honour
+``Range``, ``If-Range``, ``If-None-Match`` and ``If-Modified-Since``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+READ_BLOCK_SIZE = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadError(Exception):
+    """A chunk or upload the server refuses; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def chunk_size():
+    return getattr(settings, 'ATTACHMENT_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def max_size():
+    return getattr(settings, 'ATTACHMENT_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def part_path(upload):
+    directory = Path(getattr(settings, 'ATTACHMENT_UPLOAD_DIR', Path(settings.MEDIA_ROOT) / 'uploads' / 'partial'))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{upload.id}.part"
+
+
+def delete_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def file_sha256(fileobj):
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(READ_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_content_range(header, size):
+    """``Content-Range: bytes start-end/total`` of a chunk, as ``(start, end)`` inclusive."""
+    match = _CONTENT_RANGE.match((header or '').strip())
+    if not match:
+        raise UploadError('Content-Range header "bytes <start>-<end>/<total>" is required')
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= size:
+        raise UploadError('Content-Range does not match the upload size')
+    if end - start + 1 > chunk_size():
+        raise UploadError(f"Chunks are limited to {chunk_size()} bytes", status=413)
+    return start, end
+
+
+def append_chunk(upload, stream, start, end, chunk_checksum=None):
+    """Append ``stream`` (``start``..``end`` inclusive) to the part file of ``upload``.
+
+    The caller holds a row lock on ``upload``. Resent chunks that were
+    already stored are acknowledged without rewriting them; a gap answers
+    409 with the offset the client must resume from. Returns the new
+    ``received`` offset (not saved).
+    """
+    path = part_path(upload)
+    on_disk = path.stat().st_size if path.exists() else 0
+    if on_disk < upload.received:
+        # The part file lost data (cleanup, disk swap): resume from what is there.
+        upload.received = on_disk
+    if end < upload.received:
+        return upload.received
+    if start != upload.received:
+        raise UploadError(f"Expected chunk at offset {upload.received}", status=409)
+
+    length = end - start + 1
+    digest = hashlib.sha256()
+    with open(path, 'ab') as part:
+        # Drop anything a previous, interrupted request left past ``received``.
+        part.truncate(upload.received)
+        written = 0
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            written += len(block)
+        if stream.read(1):
+            written += 1
+        if written != length or (chunk_checksum and digest.hexdigest() != chunk_checksum.lower()):
+            part.truncate(upload.received)
+            raise UploadError('Chunk body does not match Content-Range or its checksum', status=422)
+    return upload.received + length
+
+
+def complete_upload(upload):
+    """Verify the finished part file and move it to storage as an attachment.
+
+    The checksum stored on the attachment is computed here, so uploads that
+    only checksummed their chunks still get one for ETags.
+    """
+    from clinic.models_medical_records import MedicalRecordAttachment
+
+    path = part_path(upload)
+    with open(path, 'rb') as part:
+        checksum = file_sha256(part)
+        if upload.checksum and checksum != upload.checksum.lower():
+            part.close()
+            delete_part(upload)
+            upload.received = 0
+            raise UploadError('Checksum mismatch; the upload has been reset', status=422)
+        part.seek(0)
+        attachment = MedicalRecordAttachment(
+            medical_record=upload.medical_record,
+            file_type=upload.file_type,
+            description=upload.description,
+            uploaded_by=upload.uploaded_by,
+            size=upload.size,
+            checksum=checksum,
+        )
+        attachment.file.save(os.path.basename(upload.filename), File(part), save=False)
+    attachment.save()
+    delete_part(upload)
+    return attachment
+
+
+def attachment_etag(attachment):
+    if attachment.checksum:
+        return f'"{attachment.checksum}"'
+    try:
+        stat = os.stat(attachment.file.path)
+        return f'"{attachment.pk}-{stat.st_size}-{int(stat.st_mtime)}"'
+    except (NotImplementedError, ValueError, OSError):
+        return f'"{attachment.pk}-{int(attachment.uploaded_at.timestamp())}"'
+
+
+def _requested_range(request, size, etag, last_modified):
+    header = request.headers.get('Range')
+    if not header or size == 0:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range:
+        if_range_date = parse_http_date_safe(if_range)
+        if if_range != etag and (if_range_date is None or if_range_date < int(last_modified)):
+            return None
+    match = _RANGE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: serve the whole file.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            block = fileobj.read(min(READ_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        fileobj.close()
+
+
+def ranged_file_response(request, fieldfile, etag, last_modified, filename=None, as_attachment=False):
+    """Serve ``fieldfile`` with conditional GET and single byte-range support.
+
+    ``last_modified`` is a POSIX timestamp. Returns 304/412 when the
+    validators say so, 206 for a satisfiable ``Range`` and 416 otherwise.
+    """
+    last_modified = int(last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        size = fieldfile.size
+        requested = _requested_range(request, size, etag, last_modified)
+        content_type = mimetypes.guess_type(filename or fieldfile.name)[0] or 'application/octet-stream'
+        if requested is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+        elif requested:
+            start, end = requested
+            response = StreamingHttpResponse(
+                _iter_range(fieldfile.open('rb'), start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        else:
+            response = FileResponse(
+                fieldfile.open('rb'),
+                as_attachment=as_attachment,
+                filename=os.path.basename(filename or fieldfile.name),
+                content_type=content_type,
+            )
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+__all__ = [
+    'UploadError',
+    'append_chunk',
+    'attachment_etag',
+    'chunk_size',
+    'complete_upload',
+    'delete_part',
+    'file_sha256',
+    'max_size',
+    'parse_content_range',
+    'part_path',
+    'ranged_file_response',
+]
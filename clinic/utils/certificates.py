@@ -0,0 +1,285 @@
+"""Rendered medical certificate PDFs.
+
+A certificate used to be redrawn with ReportLab every time it was printed.
+It is now rendered once, stored in ``MedicalCertificate.pdf_file`` together
+with a SHA-256 of everything printed on it (``content_hash``), and re-rendered
+only when that hash changes, e.g. after a correction to the patient record.
+"""
+import hashlib
+import io
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+
+# Bump when the layout below changes so stored PDFs are redrawn.
+LAYOUT_VERSION = 1
+
+
+def certificate_content(certificate):
+    """Everything that ends up on the page, as a JSON-serializable dict."""
+    patient = certificate.patient
+    return {
+        'layout': LAYOUT_VERSION,
+        'id': certificate.id,
+        'type': certificate.get_certificate_type_display(),
+        'issue_date': certificate.issue_date.isoformat(),
+        'diagnosis': certificate.diagnosis,
+        'recommendations': certificate.recommendations or '',
+        'duration_days': certificate.duration_days,
+        'valid_until': certificate.valid_until.isoformat() if certificate.valid_until else None,
+        'patient': [patient.first_name, patient.last_name, patient.age, patient.gender, patient.national_id],
+        'doctor': certificate.doctor.user.get_full_name() if certificate.doctor else '',
+    }
+
+
+def certificate_content_hash(certificate):
+    payload = json.dumps(certificate_content(certificate), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_certificate_pdf(certificate):
+    """Draw the certificate and return the PDF bytes."""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    # Add decorative border
+    p.setStrokeColorRGB(0.48, 0.23, 0.93)  # Purple color
+    p.setLineWidth(3)
+    p.rect(0.5*inch, 0.5*inch, width - 1*inch, height - 1*inch, stroke=1, fill=0)
+    
+    # Inner border
+    p.setStrokeColorRGB(0.48, 0.23, 0.93)
+    p.setLineWidth(1)
+    p.rect(0.6*inch, 0.6*inch, width - 1.2*inch, height - 1.2*inch, stroke=1, fill=0)
+    
+    # Try to add logo (if exists)
+    try:
+        logo_path = Path(settings.BASE_DIR) / 'static' / 'images' / 'logo.png'
+        if logo_path.exists():
+            p.drawImage(str(logo_path), 1*inch, height - 1.5*inch, width=1*inch, height=1*inch, preserveAspectRatio=True, mask='auto')
+    except:
+        pass
+    
+    # Header with clinic name
+    p.setFillColorRGB(0.48, 0.23, 0.93)  # Purple color
+    p.setFont("Helvetica-Bold", 24)
+    p.drawCentredString(width/2, height - 1*inch, "NORA DENTAL CLINIC")
+    
+    # Tagline
+    p.setFillColorRGB(0.4, 0.4, 0.4)
+    p.setFont("Helvetica-Oblique", 11)
+    p.drawCentredString(width/2, height - 1.3*inch, "Excellence in Dental Care")
+    
+    # Address and contact info
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont("Helvetica", 10)
+    p.drawCentredString(width/2, height - 1.6*inch, "KG 123 Street, Kigali, Rwanda")
+    p.drawCentredString(width/2, height - 1.8*inch, "Tel: +250 788 123 456 | Email: info@noradental.rw | www.noradental.rw")
+    
+    # Horizontal line
+    p.setStrokeColorRGB(0.48, 0.23, 0.93)
+    p.setLineWidth(2)
+    p.line(1*inch, height - 2*inch, width - 1*inch, height - 2*inch)
+    
+    # Certificate Title with background
+    p.setFillColorRGB(0.48, 0.23, 0.93)
+    p.rect(1.5*inch, height - 2.5*inch, width - 3*inch, 0.4*inch, stroke=0, fill=1)
+    
+    p.setFillColorRGB(1, 1, 1)  # White text
+    p.setFont("Helvetica-Bold", 16)
+    cert_title = certificate.get_certificate_type_display().upper()
+    p.drawCentredString(width/2, height - 2.4*inch, cert_title)
+    
+    # Certificate Number
+    p.setFillColorRGB(0.4, 0.4, 0.4)
+    p.setFont("Helvetica", 9)
+    p.drawCentredString(width/2, height - 2.7*inch, f"Certificate No: CERT-{certificate.id:06d}")
+    
+    # Date
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont("Helvetica", 11)
+    p.drawString(1*inch, height - 3.1*inch, f"Issue Date: {certificate.issue_date.strftime('%d %B %Y')}")
+    
+    # Patient details section
+    y = height - 3.6*inch
+    p.setFillColorRGB(0.48, 0.23, 0.93)
+    p.setFont("Helvetica-Bold", 13)
+    p.drawString(1*inch, y, "PATIENT INFORMATION")
+    
+    # Underline
+    p.setStrokeColorRGB(0.48, 0.23, 0.93)
+    p.setLineWidth(1)
+    p.line(1*inch, y - 0.05*inch, 3*inch, y - 0.05*inch)
+    
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont("Helvetica", 11)
+    y -= 0.35*inch
+    p.drawString(1*inch, y, f"Full Name:")
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2.2*inch, y, f"{certificate.patient.first_name} {certificate.patient.last_name}")
+    
+    p.setFont("Helvetica", 11)
+    y -= 0.25*inch
+    p.drawString(1*inch, y, f"Age:")
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2.2*inch, y, f"{certificate.patient.age} years")
+    
+    p.setFont("Helvetica", 11)
+    y -= 0.25*inch
+    p.drawString(1*inch, y, f"Gender:")
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2.2*inch, y, f"{certificate.patient.gender or 'N/A'}")
+    
+    p.setFont("Helvetica", 11)
+    y -= 0.25*inch
+    p.drawString(1*inch, y, f"ID/Passport:")
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2.2*inch, y, f"{certificate.patient.national_id or 'N/A'}")
+    
+    # Medical information section
+    y -= 0.5*inch
+    p.setFillColorRGB(0.48, 0.23, 0.93)
+    p.setFont("Helvetica-Bold", 13)
+    p.drawString(1*inch, y, "MEDICAL INFORMATION")
+    
+    # Underline
+    p.setStrokeColorRGB(0.48, 0.23, 0.93)
+    p.setLineWidth(1)
+    p.line(1*inch, y - 0.05*inch, 3.2*inch, y - 0.05*inch)
+    
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont("Helvetica-Bold", 11)
+    y -= 0.35*inch
+    p.drawString(1*inch, y, "Diagnosis:")
+    
+    p.setFont("Helvetica", 11)
+    y -= 0.25*inch
+    # Word wrap diagnosis
+    lines = []
+    current_line = ""
+    for word in certificate.diagnosis.split():
+        if len(current_line + word) < 75:
+            current_line += word + " "
+        else:
+            lines.append(current_line)
+            current_line = word + " "
+    if current_line:
+        lines.append(current_line)
+    
+    for line in lines:
+        p.drawString(1.2*inch, y, line.strip())
+        y -= 0.2*inch
+    
+    if certificate.recommendations:
+        y -= 0.1*inch
+        p.setFont("Helvetica-Bold", 11)
+        p.drawString(1*inch, y, "Recommendations:")
+        
+        p.setFont("Helvetica", 11)
+        y -= 0.25*inch
+        # Word wrap recommendations
+        lines = certificate.recommendations.split('\n')
+        for line in lines:
+            if len(line) > 75:
+                words = line.split()
+                current_line = ""
+                for word in words:
+                    if len(current_line + word) < 75:
+                        current_line += word + " "
+                    else:
+                        p.drawString(1.2*inch, y, current_line.strip())
+                        y -= 0.2*inch
+                        current_line = word + " "
+                if current_line:
+                    p.drawString(1.2*inch, y, current_line.strip())
+                    y -= 0.2*inch
+            else:
+                p.drawString(1.2*inch, y, line)
+                y -= 0.2*inch
+    
+    if certificate.duration_days:
+        y -= 0.1*inch
+        p.setFont("Helvetica-Bold", 11)
+        p.drawString(1*inch, y, f"Duration of Leave: {certificate.duration_days} days")
+        y -= 0.25*inch
+        p.setFont("Helvetica", 11)
+        p.drawString(1*inch, y, f"Valid Until: {certificate.valid_until.strftime('%d %B %Y')}")
+    
+    # Doctor signature section
+    y = 2.5*inch
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(4.5*inch, y, "Authorized By:")
+    
+    y -= 0.5*inch
+    p.setStrokeColorRGB(0, 0, 0)
+    p.setLineWidth(1)
+    p.line(4.5*inch, y, 7*inch, y)
+    
+    y -= 0.25*inch
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(4.5*inch, y, f"Dr. {certificate.doctor.user.get_full_name()}")
+    
+    y -= 0.2*inch
+    p.setFont("Helvetica", 10)
+    p.drawString(4.5*inch, y, f"Medical License No: [License]")
+    
+    y -= 0.2*inch
+    p.drawString(4.5*inch, y, f"Signature & Official Stamp")
+    
+    # QR Code placeholder (optional)
+    p.setStrokeColorRGB(0.7, 0.7, 0.7)
+    p.setLineWidth(1)
+    p.rect(1*inch, 1.5*inch, 0.8*inch, 0.8*inch, stroke=1, fill=0)
+    p.setFont("Helvetica", 7)
+    p.drawString(1*inch, 1.35*inch, "QR Code")
+    
+    # Footer with verification info
+    p.setFillColorRGB(0.48, 0.23, 0.93)
+    p.setFont("Helvetica-Bold", 9)
+    p.drawCentredString(width/2, 1*inch, "CERTIFICATE VERIFICATION")
+    
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont("Helvetica-Oblique", 8)
+    p.drawCentredString(width/2, 0.85*inch, "This is an official medical document issued by Nora Dental Clinic")
+    p.drawCentredString(width/2, 0.7*inch, f"Verify online at: www.noradental.rw/verify/{certificate.id}")
+    
+    p.showPage()
+    p.save()
+
+    return buffer.getvalue()
+
+
+def ensure_certificate_pdf(certificate):
+    """Render and store the PDF unless the stored one still matches the certificate content."""
+    content_hash = certificate_content_hash(certificate)
+    if certificate.pdf_file and certificate.content_hash == content_hash and certificate.pdf_file.storage.exists(certificate.pdf_file.name):
+        return certificate
+
+    previous = certificate.pdf_file.name if certificate.pdf_file else None
+    certificate.pdf_file.save(
+        f"medical_certificate_{certificate.id}.pdf",
+        ContentFile(render_certificate_pdf(certificate)),
+        save=False,
+    )
+    certificate.content_hash = content_hash
+    certificate.rendered_at = timezone.now()
+    certificate.save(update_fields=['pdf_file', 'content_hash', 'rendered_at'])
+    if previous and previous != certificate.pdf_file.name:
+        certificate.pdf_file.storage.delete(previous)
+    return certificate
+
+
+__all__ = [
+    'LAYOUT_VERSION',
+    'certificate_content',
+    'certificate_content_hash',
+    'ensure_certificate_pdf',
+    'render_certificate_pdf',
+]
@@ -0,0 +1,78 @@
+"""Full-text search over medical records.
+
+On PostgreSQL each ``MedicalRecord`` carries a weighted ``tsvector``
+(``search_vector``) backed by a GIN index, so ranked searches stay fast across
+years of records. Other databases fall back to ``icontains`` matching.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Q
+
+SEARCH_CONFIG = 'english'
+
+# Field -> tsvector weight (A ranks highest)
+SEARCH_WEIGHTS = {
+    'diagnosis': 'A',
+    'chief_complaint': 'B',
+    'treatment_plan': 'C',
+    'investigations': 'C',
+    'history_presenting_illness': 'D',
+    'specialty_examination': 'D',
+    'oral_examination': 'D',
+}
+
+
+def search_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression():
+    vector = None
+    for field, weight in SEARCH_WEIGHTS.items():
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def refresh_search_vectors(queryset):
+    """Recompute ``search_vector`` for every record in ``queryset`` in one UPDATE."""
+    if search_enabled():
+        queryset.update(search_vector=search_vector_expression())
+
+
+def search_medical_records(queryset, query='', doctor=None, date_from=None, date_to=None, hmis_code=None):
+    """Filter ``queryset`` by the search form values, best matches first when ``query`` is set."""
+    if doctor:
+        queryset = queryset.filter(visit__doctor=doctor)
+    if date_from:
+        queryset = queryset.filter(created_at__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(created_at__date__lte=date_to)
+    if hmis_code:
+        queryset = queryset.filter(hmis_classification=hmis_code)
+
+    query = (query or '').strip()
+    if not query:
+        return queryset.order_by('-created_at')
+
+    if search_enabled():
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        return (
+            queryset.filter(search_vector=search_query)
+            .annotate(rank=SearchRank('search_vector', search_query))
+            .order_by('-rank', '-created_at')
+        )
+
+    matches = Q()
+    for field in SEARCH_WEIGHTS:
+        matches |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(matches).order_by('-created_at')
+
+
+__all__ = [
+    'SEARCH_WEIGHTS',
+    'refresh_search_vectors',
+    'search_enabled',
+    'search_medical_records',
+    'search_vector_expression',
+]
@@ -0,0 +1,54 @@
+"""Recompute stored average costs from purchase history.
+
+Purchases keep ``ConsumableInventory.average_unit_cost`` and
+``InventoryItem.unit_cost`` current as they are entered (see
+``ledger.record_movement`` and ``stock.receive_batch``), so valuation and
+COGS read a stored cost. This rebuilds those costs when history was
+imported or corrected: each item's cost becomes the quantity-weighted
+average price of its purchases, computed by the database with one grouped
+subquery and written with one UPDATE per model. Items without purchases
+keep their cost.
+"""
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum
+
+PURCHASE_LINKS = ('consumable', 'inventory_item')
+
+
+def weighted_purchase_cost(link, since=None):
+    """Subquery of the weighted average purchase price for the row ``link`` points at."""
+    from clinic.models_financial import Purchase
+
+    purchases = Purchase.objects.filter(**{link: OuterRef('pk')}, quantity__gt=0)
+    if since is not None:
+        purchases = purchases.filter(purchase_date__gte=since)
+    cost = DecimalField(max_digits=12, decimal_places=2)
+    return purchases, Subquery(
+        purchases.order_by()
+        .values(link)
+        .annotate(average=Sum('total_cost') / Sum('quantity'))
+        .values('average'),
+        output_field=cost,
+    )
+
+
+def recompute_average_costs(since=None):
+    """Reset costs from purchases made on or after ``since``; returns ``{link: rows updated}``."""
+    from clinic.models import InventoryItem
+    from clinic.models_financial import ConsumableInventory
+
+    targets = {
+        'consumable': (ConsumableInventory, 'average_unit_cost'),
+        'inventory_item': (InventoryItem, 'unit_cost'),
+    }
+    updated = {}
+    for link in PURCHASE_LINKS:
+        model, field = targets[link]
+        purchases, average = weighted_purchase_cost(link, since)
+        updated[link] = model.objects.filter(Exists(purchases)).update(**{field: average})
+    return updated
+
+
+__all__ = [
+    'recompute_average_costs',
+    'weighted_purchase_cost',
+]
@@ -0,0 +1,67 @@
+"""Per-doctor dashboard snapshot cache.
+
+The enhanced doctor dashboard is rebuilt from a dozen aggregate queries. The
+result is stored once per doctor and day and reused until one of the doctor's
+visits, billing items, appointments, medical records or invoices changes
+(see ``clinic.signals``). Invalidation bumps a per-doctor version number rather
+than deleting keys, so a snapshot that was being rebuilt while the data changed
+is written under a stale version and never served.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Upper bound for changes that bypass model signals (queryset.update, raw SQL).
+DASHBOARD_SNAPSHOT_TIMEOUT = 60 * 60
+
+
+def _version_key(doctor_id):
+    return f"doctor-dashboard:version:{doctor_id}"
+
+
+def _snapshot_key(doctor_id, day, version):
+    return f"doctor-dashboard:{doctor_id}:{day.isoformat()}:{version}"
+
+
+def _current_version(doctor_id):
+    # Seed with a timestamp so an evicted counter never resurrects old snapshots.
+    return cache.get_or_set(_version_key(doctor_id), time.time_ns(), None)
+
+
+def get_dashboard_version(doctor_id):
+    """Current data version for ``doctor_id``; use it in template fragment cache keys."""
+    return _current_version(doctor_id)
+
+
+def get_dashboard_snapshot(doctor_id, day, build):
+    """Return the cached snapshot for ``doctor_id`` on ``day``, building it on a miss."""
+    key = _snapshot_key(doctor_id, day, _current_version(doctor_id))
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build()
+        cache.set(key, snapshot, DASHBOARD_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def _bump_versions(doctor_ids):
+    for doctor_id in doctor_ids:
+        try:
+            cache.incr(_version_key(doctor_id))
+        except ValueError:
+            cache.set(_version_key(doctor_id), time.time_ns(), None)
+
+
+def invalidate_doctor_dashboard(*doctor_ids):
+    """Drop cached snapshots for the given doctors once the current transaction commits."""
+    doctor_ids = {doctor_id for doctor_id in doctor_ids if doctor_id}
+    if doctor_ids:
+        transaction.on_commit(lambda: _bump_versions(doctor_ids))
+
+
+__all__ = [
+    'DASHBOARD_SNAPSHOT_TIMEOUT',
+    'get_dashboard_snapshot',
+    'get_dashboard_version',
+    'invalidate_doctor_dashboard',
+]
@@ -0,0 +1,50 @@
+"""Normalized diagnosis keys.
+
+Free-text diagnoses are spelled many ways ("Dental caries", "dental  caries.",
+"Dental Caries"), which splits statistics. A record's key is its HMIS code
+when one is selected and otherwise the diagnosis text folded to lower case
+ASCII words, so variants group together and can be indexed.
+"""
+import re
+import unicodedata
+
+DIAGNOSIS_KEY_LENGTH = 120
+DIAGNOSIS_LABEL_LENGTH = 200
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def fold_diagnosis(text):
+    """Lower-case, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def diagnosis_key(diagnosis, hmis_code=None):
+    if hmis_code:
+        return f"hmis:{hmis_code.strip().upper()}"[:DIAGNOSIS_KEY_LENGTH]
+    folded = fold_diagnosis(diagnosis)
+    return f"text:{folded}"[:DIAGNOSIS_KEY_LENGTH] if folded else ''
+
+
+def diagnosis_label(diagnosis, hmis_code=None):
+    """Human readable label for a key: the HMIS name, else the first line of the text."""
+    if hmis_code:
+        from .reference_data import hmis_classifications
+
+        names = {classification.code: classification.name for classification in hmis_classifications()}
+        name = names.get(hmis_code)
+        label = f"{hmis_code} - {name}" if name else hmis_code
+    else:
+        label = (diagnosis or '').strip().splitlines()[0] if (diagnosis or '').strip() else ''
+    return label[:DIAGNOSIS_LABEL_LENGTH]
+
+
+__all__ = [
+    'DIAGNOSIS_KEY_LENGTH',
+    'DIAGNOSIS_LABEL_LENGTH',
+    'diagnosis_key',
+    'diagnosis_label',
+    'fold_diagnosis',
+]
@@ -0,0 +1,195 @@
+"""Demand forecasting and reorder points for consumables and medicines.
+
+Daily usage of every consumable (``ConsumableUsage``) and medicine (the
+``PharmacyDailyDispense`` rollup) is read in one UNION query and pivoted
+into a days x items matrix. All the statistics below are computed over the
+whole matrix at once with pandas, with no per-item loop:
+
+* daily demand: simple moving average over ``window`` days, or an
+  exponentially weighted average with the same span;
+* lead-time demand: daily demand x ``lead_time`` days;
+* safety stock: z(service level) x daily std. deviation x sqrt(lead time);
+* reorder point: lead-time demand + safety stock;
+* suggested order: enough to reach the reorder point plus ``review_days``
+  of demand.
+
+Days before an item's first recorded use are not counted as zero demand.
+"""
+import math
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+from django.db.models import F, Sum, Value
+from django.db.models.fields import CharField
+from django.utils import timezone
+
+CONSUMABLE = 'consumable'
+MEDICINE = 'medicine'
+METHODS = ('sma', 'ewm')
+
+DEFAULT_HISTORY_DAYS = 365
+DEFAULT_WINDOW = 28
+DEFAULT_LEAD_TIME = 7
+DEFAULT_REVIEW_DAYS = 7
+DEFAULT_SERVICE_LEVEL = 0.95
+
+REPORT_COLUMNS = [
+    'kind', 'item_id', 'name', 'unit', 'on_hand', 'daily_demand', 'lead_time_demand',
+    'safety_stock', 'reorder_point', 'suggested_order', 'minimum_stock_level',
+]
+
+
+def usage_history(start, end):
+    """Daily usage between ``start`` and ``end`` as one UNION queryset of ``(kind, sku, day, qty)``."""
+    from clinic.models_analytics import PharmacyDailyDispense
+    from clinic.models_financial import ConsumableUsage
+
+    consumables = (
+        ConsumableUsage.objects.filter(usage_date__gte=start, usage_date__lte=end)
+        .annotate(kind=Value(CONSUMABLE, output_field=CharField()), sku=F('consumable_id'), day=F('usage_date'))
+        .values('kind', 'sku', 'day')
+        .annotate(qty=Sum('quantity_used'))
+        .order_by()
+    )
+    medicines = (
+        PharmacyDailyDispense.objects.filter(date__gte=start, date__lte=end)
+        .annotate(kind=Value(MEDICINE, output_field=CharField()), sku=F('item_id'), day=F('date'))
+        .values('kind', 'sku', 'day')
+        .annotate(qty=Sum('quantity'))
+        .order_by()
+    )
+    return consumables.union(medicines, all=True)
+
+
+def load_usage(start, end):
+    """Usage rows as a DataFrame, fetched with a plain cursor.
+
+    Years of history are hundreds of thousands of rows, so the rows skip
+    Django's per-value conversion and go straight into columns.
+    """
+    sql, params = usage_history(start, end).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return pd.DataFrame.from_records(rows, columns=['kind', 'item_id', 'day', 'qty'])
+
+
+def demand_matrix(frame, start, end):
+    """Usage as a float matrix indexed by day, one ``(kind, item_id)`` column per item."""
+    days = pd.date_range(start, end, freq='D')
+    if frame.empty:
+        return pd.DataFrame(index=days, columns=pd.MultiIndex.from_tuples([], names=['kind', 'item_id']))
+    items = frame.groupby(['kind', 'item_id'], sort=True)
+    codes = items.ngroup().to_numpy()
+    offsets = (pd.to_datetime(frame['day']).to_numpy() - np.datetime64(start, 'D')).astype('timedelta64[D]').astype(int)
+    values = np.zeros((len(days), items.ngroups))
+    np.add.at(values, (offsets, codes), frame['qty'].astype(float).to_numpy())
+    return pd.DataFrame(values, index=days, columns=items.size().index)
+
+
+def forecast(matrix, method='ewm', window=DEFAULT_WINDOW, lead_time=DEFAULT_LEAD_TIME,
+             review_days=DEFAULT_REVIEW_DAYS, service_level=DEFAULT_SERVICE_LEVEL):
+    """Demand statistics and reorder points for every column of ``matrix``."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown forecasting method {method!r}; use one of {', '.join(METHODS)}")
+    started = matrix.cumsum() > 0
+    usage = matrix.where(started)
+
+    if method == 'sma':
+        recent = usage.tail(window)
+        demand = recent.mean()
+        spread = recent.std(ddof=0)
+    else:
+        weighted = usage.ewm(span=window, ignore_na=True)
+        demand = weighted.mean().iloc[-1]
+        spread = weighted.std().iloc[-1]
+
+    demand = demand.fillna(0.0)
+    spread = spread.fillna(0.0)
+    z = NormalDist().inv_cdf(service_level)
+    lead_time_demand = demand * lead_time
+    safety_stock = z * spread * math.sqrt(lead_time)
+    reorder_point = np.ceil(lead_time_demand + safety_stock)
+
+    result = pd.DataFrame({
+        'daily_demand': demand.round(3),
+        'lead_time_demand': lead_time_demand.round(2),
+        'safety_stock': safety_stock.round(2),
+        'reorder_point': reorder_point,
+        'order_up_to': np.ceil(reorder_point + demand * review_days),
+    })
+    result.index.names = ['kind', 'item_id']
+    return result.reset_index()
+
+
+def stock_levels(kinds_and_ids):
+    """On-hand quantities, names and minimum levels for the forecast items; two queries."""
+    from clinic.models import InventoryItem
+    from clinic.models_financial import ConsumableInventory
+
+    consumable_ids = [item_id for kind, item_id in kinds_and_ids if kind == CONSUMABLE]
+    medicine_ids = [item_id for kind, item_id in kinds_and_ids if kind == MEDICINE]
+    records = [
+        (CONSUMABLE, pk, name, unit, float(qty), float(minimum))
+        for pk, name, unit, qty, minimum in ConsumableInventory.objects.filter(pk__in=consumable_ids).values_list(
+            'id', 'item_name', 'unit', 'quantity_in_stock', 'minimum_stock_level'
+        )
+    ]
+    records += [
+        (MEDICINE, pk, name, unit, float(on_hand - reserved), np.nan)
+        for pk, name, unit, on_hand, reserved in InventoryItem.objects.filter(pk__in=medicine_ids).values_list(
+            'id', 'name', 'unit', 'qty_on_hand', 'qty_reserved'
+        )
+    ]
+    return pd.DataFrame.from_records(
+        records, columns=['kind', 'item_id', 'name', 'unit', 'on_hand', 'minimum_stock_level']
+    )
+
+
+def reorder_report(history_days=DEFAULT_HISTORY_DAYS, today=None, **options):
+    """One row per item with usage history, most urgent first; see ``REPORT_COLUMNS``."""
+    today = today or timezone.localdate()
+    start = today - timedelta(days=history_days - 1)
+    matrix = demand_matrix(load_usage(start, today), start, today)
+    if matrix.empty or not len(matrix.columns):
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+
+    result = forecast(matrix, **options)
+    levels = stock_levels(list(matrix.columns))
+    report = result.merge(levels, on=['kind', 'item_id'], how='inner')
+    report['suggested_order'] = np.maximum(report['order_up_to'] - report['on_hand'], 0.0)
+    report.loc[report['on_hand'] > report['reorder_point'], 'suggested_order'] = 0.0
+    report = report.sort_values(
+        ['suggested_order', 'reorder_point'], ascending=False, kind='stable'
+    ).reset_index(drop=True)
+    return report[REPORT_COLUMNS]
+
+
+def apply_minimum_levels(report):
+    """Set each consumable's ``minimum_stock_level`` to its reorder point in one ``bulk_update``."""
+    from clinic.models_financial import ConsumableInventory
+
+    consumables = report[report['kind'] == CONSUMABLE]
+    changed = consumables[consumables['reorder_point'] != consumables['minimum_stock_level']]
+    items = [
+        ConsumableInventory(pk=int(item_id), minimum_stock_level=int(reorder_point))
+        for item_id, reorder_point in zip(changed['item_id'], changed['reorder_point'])
+    ]
+    ConsumableInventory.objects.bulk_update(items, ['minimum_stock_level'], batch_size=500)
+    return len(items)
+
+
+__all__ = [
+    'METHODS',
+    'REPORT_COLUMNS',
+    'apply_minimum_levels',
+    'demand_matrix',
+    'forecast',
+    'load_usage',
+    'reorder_report',
+    'stock_levels',
+    'usage_history',
+]
@@ -0,0 +1,168 @@
+"""Thumbnails and web previews for uploaded images.
+
+Profile pictures, asset photos and clinical image attachments are shown at a
+fraction of their size, but pages used to download the multi-megabyte
+originals. After an upload commits, a background thread renders every size
+in ``IMAGE_SIZES`` as WebP next to the original (``<dir>/derived/``) and
+records the names in the model's ``image_derivatives`` field. Until that is
+done (or when the file is not an image) URLs fall back to the original.
+"""
+import io
+import logging
+import mimetypes
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# name -> (max width, max height, crop to fill)
+IMAGE_SIZES = {
+    'thumb': (96, 96, True),
+    'small': (320, 320, False),
+    'preview': (1280, 1280, False),
+}
+WEBP_QUALITY = 80
+
+_executor = None
+
+
+def is_image(name):
+    mime_type = mimetypes.guess_type(name or '')[0] or ''
+    return mime_type.startswith('image/')
+
+
+def derivative_name(name, size):
+    directory, filename = posixpath.split(name)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(directory, 'derived', f"{stem}.{size}.webp")
+
+
+def derived_url(fieldfile, size):
+    """URL of ``size`` for ``fieldfile``, or of the original while it is not rendered yet."""
+    if not fieldfile:
+        return ''
+    derivatives = getattr(fieldfile.instance, 'image_derivatives', None) or {}
+    name = derivatives.get(size)
+    if name and derivatives.get('source') == fieldfile.name:
+        return fieldfile.storage.url(name)
+    return fieldfile.url
+
+
+def render_derivatives(fieldfile):
+    """Write every size of ``fieldfile`` to storage; returns the ``image_derivatives`` value."""
+    from PIL import Image, ImageOps
+
+    storage = fieldfile.storage
+    derivatives = {'source': fieldfile.name}
+    with storage.open(fieldfile.name, 'rb') as original:
+        with Image.open(original) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            for size, (width, height, crop) in IMAGE_SIZES.items():
+                if crop:
+                    derived = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+                else:
+                    derived = image.copy()
+                    derived.thumbnail((width, height), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                derived.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+                name = derivative_name(fieldfile.name, size)
+                if storage.exists(name):
+                    storage.delete(name)
+                derivatives[size] = storage.save(name, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def delete_derivatives(derivatives, storage=None):
+    from django.core.files.storage import default_storage
+
+    storage = storage or default_storage
+    for size in IMAGE_SIZES:
+        name = (derivatives or {}).get(size)
+        if name:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning("Could not delete image derivative %s", name)
+
+
+def derive_now(model_label, pk, field_name):
+    """Render the derivatives of one instance and store them unless the file changed meanwhile."""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    fieldfile = getattr(instance, field_name)
+    previous = instance.image_derivatives or {}
+    if not fieldfile or not is_image(fieldfile.name):
+        derivatives = {}
+    else:
+        try:
+            derivatives = render_derivatives(fieldfile)
+        except Exception:
+            logger.exception("Could not render derivatives for %s %s", model_label, pk)
+            return None
+    if fieldfile:
+        unchanged = Q(**{field_name: fieldfile.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{f"{field_name}__isnull": True})
+    updated = model.objects.filter(unchanged, pk=pk).update(image_derivatives=derivatives)
+    if updated and previous.get('source') != derivatives.get('source'):
+        delete_derivatives(previous, fieldfile.storage)
+    return derivatives
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """Run ``func(*args)`` on the image worker pool once the current transaction commits."""
+    global _executor
+    if getattr(settings, 'IMAGE_DERIVATIVES_SYNC', False):
+        transaction.on_commit(lambda: func(*args))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 1),
+            thread_name_prefix='image-derivatives',
+        )
+    transaction.on_commit(lambda: _executor.submit(_run, func, *args))
+
+
+def schedule_derivatives(instance, field_name):
+    """Render the derivatives of ``instance`` in the background once the transaction commits."""
+    run_in_background(derive_now, instance._meta.label, instance.pk, field_name)
+
+
+def needs_derivatives(instance, field_name):
+    fieldfile = getattr(instance, field_name)
+    source = (instance.image_derivatives or {}).get('source')
+    if not fieldfile:
+        return bool(source)
+    return source != fieldfile.name and (is_image(fieldfile.name) or bool(source))
+
+
+__all__ = [
+    'IMAGE_SIZES',
+    'delete_derivatives',
+    'derivative_name',
+    'derive_now',
+    'derived_url',
+    'is_image',
+    'needs_derivatives',
+    'render_derivatives',
+    'run_in_background',
+    'schedule_derivatives',
+]
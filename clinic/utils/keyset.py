@@ -0,0 +1,67 @@
+"""Keyset pagination over a timestamp column with the primary key as tie-breaker.
+
+An OFFSET page has to skip every row before it, so it slows down as tables
+grow. A keyset page instead starts after the ``(timestamp, id)`` of the last
+row already shown. With an index on ``(timestamp, id)`` every page costs the
+same. The cursor handed to the client is that pair as URL-safe base64 JSON.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    raw = json.dumps([timestamp.isoformat(), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        parsed = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, TypeError, json.JSONDecodeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+    if parsed is None:
+        raise InvalidCursor('Invalid cursor timestamp')
+    return parsed, pk
+
+
+def keyset_page(queryset, field, cursor=None, limit=25, descending=True):
+    """One page of ``queryset`` ordered by ``(field, id)``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is ``None`` on the last
+    page. Fetches ``limit + 1`` rows to know whether another page follows.
+    Raises ``InvalidCursor`` for a cursor that does not decode.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': timestamp}) | Q(**{field: timestamp, f'id__{op}': pk})
+        )
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
+__all__ = [
+    'InvalidCursor',
+    'decode_cursor',
+    'encode_cursor',
+    'keyset_page',
+]
@@ -0,0 +1,189 @@
+"""Consumable stock ledger and month-end snapshots.
+
+Every change to ``ConsumableInventory.quantity_in_stock`` goes through
+``record_movement``. It appends an immutable ``ConsumableMovement`` and
+moves the on-hand quantity by the same amount with an F() expression, in one
+transaction, so the stored quantity always equals the ledger total.
+Receipts also fold their cost into ``average_unit_cost`` in the same UPDATE,
+as a moving weighted average computed by the database from the row it
+updates, so concurrent receipts cannot lose each other's cost.
+
+``build_snapshots`` stores each item's quantity and value at every month
+end. The stock on a past date is then the latest snapshot before it plus the
+movements since. That reads at most a month of the ledger through the
+``occurred_at`` index, however long the history.
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Min, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+ZERO = Decimal('0')
+
+
+def day_end(date):
+    """The first instant after ``date`` in local time."""
+    return timezone.make_aware(datetime.combine(date + timedelta(days=1), time.min))
+
+
+def month_end(date):
+    return date.replace(day=calendar.monthrange(date.year, date.month)[1])
+
+
+def average_cost_after(quantity, unit_cost):
+    """Expression for ``average_unit_cost`` after receiving ``quantity`` at ``unit_cost``.
+
+    Stock already on hand keeps its weight; with none on hand (or a
+    negative balance) the receipt's cost becomes the average.
+    """
+    cost = DecimalField(max_digits=12, decimal_places=2)
+    return Case(
+        When(quantity_in_stock__lte=0, then=Value(unit_cost, output_field=cost)),
+        default=(
+            F('quantity_in_stock') * F('average_unit_cost') + Value(quantity * unit_cost)
+        ) / (F('quantity_in_stock') + Value(quantity)),
+        output_field=cost,
+    )
+
+
+def record_movement(consumable, quantity, movement_type, unit_cost=None, occurred_at=None, **fields):
+    """Append a movement of signed ``quantity`` and apply it to the on-hand stock.
+
+    ``unit_cost`` defaults to the item's average cost, which is how issues
+    and count corrections are valued. Receipts with a positive quantity move
+    the average cost too. A backdated movement drops the snapshots it falls
+    into so ``build_snapshots`` rebuilds them.
+    """
+    from clinic.models_financial import ConsumableInventory, ConsumableMovement, ConsumableSnapshot
+
+    quantity = Decimal(quantity)
+    if unit_cost is None:
+        unit_cost = consumable.average_unit_cost
+    unit_cost = Decimal(unit_cost)
+    with transaction.atomic():
+        movement = ConsumableMovement.objects.create(
+            consumable=consumable,
+            movement_type=movement_type,
+            quantity=quantity,
+            unit_cost=unit_cost,
+            value=(quantity * unit_cost).quantize(Decimal('0.01')),
+            occurred_at=occurred_at or timezone.now(),
+            **fields,
+        )
+        changes = {'quantity_in_stock': F('quantity_in_stock') + quantity}
+        receipt = movement_type == ConsumableMovement.MOVEMENT_IN and quantity > 0
+        if receipt:
+            changes['average_unit_cost'] = average_cost_after(quantity, unit_cost)
+        ConsumableInventory.objects.filter(pk=consumable.pk).update(**changes)
+        if occurred_at is not None:
+            ConsumableSnapshot.objects.filter(
+                period_end__gte=timezone.localdate(occurred_at)
+            ).delete()
+    if receipt:
+        consumable.refresh_from_db(fields=['quantity_in_stock', 'average_unit_cost'])
+    else:
+        consumable.quantity_in_stock += quantity
+    return movement
+
+
+def balances_as_of(date, consumable_ids=None):
+    """``{consumable_id: (quantity, value)}`` at the end of ``date``, from snapshot plus movements."""
+    from clinic.models_financial import ConsumableMovement, ConsumableSnapshot
+
+    snapshots = ConsumableSnapshot.objects.all()
+    movements = ConsumableMovement.objects.filter(occurred_at__lt=day_end(date))
+    if consumable_ids is not None:
+        snapshots = snapshots.filter(consumable_id__in=consumable_ids)
+        movements = movements.filter(consumable_id__in=consumable_ids)
+
+    balances = defaultdict(lambda: [ZERO, ZERO])
+    base = snapshots.filter(period_end__lte=date).aggregate(latest=Max('period_end'))['latest']
+    if base is not None:
+        for consumable_id, quantity, value in snapshots.filter(period_end=base).values_list(
+            'consumable_id', 'quantity', 'value'
+        ):
+            balances[consumable_id] = [quantity, value]
+        movements = movements.filter(occurred_at__gte=day_end(base))
+
+    for row in movements.values('consumable_id').annotate(quantity=Sum('quantity'), value=Sum('value')):
+        balance = balances[row['consumable_id']]
+        balance[0] += row['quantity']
+        balance[1] += row['value']
+    return {consumable_id: tuple(balance) for consumable_id, balance in balances.items()}
+
+
+def inventory_value_as_of(date):
+    """Total value of consumable stock at the end of ``date``, in at most three queries."""
+    from clinic.models_financial import ConsumableMovement, ConsumableSnapshot
+
+    money = DecimalField(max_digits=16, decimal_places=2)
+    movements = ConsumableMovement.objects.filter(occurred_at__lt=day_end(date))
+    total = ZERO
+    base = ConsumableSnapshot.objects.filter(period_end__lte=date).aggregate(latest=Max('period_end'))['latest']
+    if base is not None:
+        total += ConsumableSnapshot.objects.filter(period_end=base).aggregate(
+            total=Coalesce(Sum('value'), Value(0), output_field=money)
+        )['total']
+        movements = movements.filter(occurred_at__gte=day_end(base))
+    total += movements.aggregate(total=Coalesce(Sum('value'), Value(0), output_field=money))['total']
+    return total
+
+
+def build_snapshots(through=None):
+    """Store month-end snapshots for every month up to ``through``; returns rows created.
+
+    ``through`` defaults to the end of the previous month. Each month is
+    built from the one before it, so only that month's movements are read.
+    Items with nothing in stock and no value get no row.
+    """
+    from clinic.models_financial import ConsumableMovement, ConsumableSnapshot
+
+    if through is None:
+        through = timezone.localdate().replace(day=1) - timedelta(days=1)
+    latest = ConsumableSnapshot.objects.aggregate(latest=Max('period_end'))['latest']
+    if latest is not None:
+        period_end = month_end(latest + timedelta(days=1))
+    else:
+        first = ConsumableMovement.objects.aggregate(first=Min('occurred_at'))['first']
+        if first is None:
+            return 0
+        period_end = month_end(timezone.localdate(first))
+
+    created = 0
+    while period_end <= through:
+        with transaction.atomic():
+            rows = ConsumableSnapshot.objects.bulk_create([
+                ConsumableSnapshot(consumable_id=consumable_id, period_end=period_end, quantity=quantity, value=value)
+                for consumable_id, (quantity, value) in balances_as_of(period_end).items()
+                if quantity or value
+            ], ignore_conflicts=True)
+        created += len(rows)
+        period_end = month_end(period_end + timedelta(days=1))
+    return created
+
+
+def ledger_discrepancies():
+    """Consumables whose stored on-hand quantity differs from their ledger total."""
+    from clinic.models_financial import ConsumableInventory
+
+    return ConsumableInventory.objects.annotate(
+        ledger_quantity=Coalesce(
+            Sum('movements__quantity'), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)
+        )
+    ).exclude(ledger_quantity=F('quantity_in_stock'))
+
+
+__all__ = [
+    'average_cost_after',
+    'balances_as_of',
+    'build_snapshots',
+    'inventory_value_as_of',
+    'ledger_discrepancies',
+    'month_end',
+    'record_movement',
+]
@@ -36,35 +36,81 @@ def _make_barcode(data: str):
     from PIL import Image
     return Image.open(fp)
 
-def generate_invoice_pdf_bytes(invoice):
-    """
-    Returns PDF bytes for invoice (ReportLab). Adds logo, QR code (link or invoice id),
-    barcode with receipt number, clinic info footer, signature lines.
-    """
-    buffer = io.BytesIO()
-    # Use A4 landscape for a wider, premium look — change to A4 for portrait
-    width, height = A4  # portrait
-    c = canvas.Canvas(buffer, pagesize=A4)
+LETTERHEAD_FORM = 'clinic_letterhead'
+FOOTER_FORM = 'clinic_footer'
+PAGE_MARGIN = 20 * mm
 
-    # Margins
-    left_margin = 20 * mm
-    right_margin = 20 * mm
-    usable_width = width - left_margin - right_margin
 
-    # Header: logo (if exists) and clinic name
-    y = height - 20 * mm
+def _define_letterhead(c):
+    """Draw the static letterhead (logo, clinic name) and footer once as PDF forms.
+
+    Every document references them with ``doForm``, so a batch of fifty
+    invoices embeds the logo and header drawing a single time. The header
+    goes on a document's first page and the footer on its last.
+    """
+    width, height = A4
+    y = height - PAGE_MARGIN
+    c.beginForm(LETTERHEAD_FORM)
 
     # Try to load logo from settings.MEDIA_ROOT or static
     logo_path = getattr(settings, 'CLINIC_LOGO_PATH', None)  # set in settings for convenience
     if logo_path:
         try:
             logo = ImageReader(logo_path)
-            c.drawImage(logo, left_margin, y - 25*mm, width=40*mm, height=25*mm, preserveAspectRatio=True)
+            c.drawImage(logo, PAGE_MARGIN, y - 25*mm, width=40*mm, height=25*mm, preserveAspectRatio=True)
         except Exception:
             pass
 
     c.setFont("Helvetica-Bold", 16)
-    c.drawString(left_margin + 45*mm, y - 5*mm, CLINIC_INFO['name'])
+    c.drawString(PAGE_MARGIN + 45*mm, y - 5*mm, CLINIC_INFO['name'])
+    c.endForm()
+
+    # Footer with clinic info
+    c.beginForm(FOOTER_FORM)
+    footer_y = 20 * mm
+    c.setFont("Helvetica", 9)
+    c.setFillColor(colors.grey)
+    footer_text = f"{CLINIC_INFO['address']}   |   Email: {CLINIC_INFO['email']}   |   Tel: {CLINIC_INFO['phone']}"
+    c.drawCentredString(width / 2, footer_y, footer_text)
+    c.endForm()
+
+
+def new_document_canvas(buffer):
+    """A4 canvas with the letterhead form defined, ready for ``draw_invoice``/``draw_prescription``."""
+    c = canvas.Canvas(buffer, pagesize=A4)
+    _define_letterhead(c)
+    return c
+
+
+def generate_invoice_pdf_bytes(invoice):
+    """
+    Returns PDF bytes for invoice (ReportLab). Adds logo, QR code (link or invoice id),
+    barcode with receipt number, clinic info footer, signature lines.
+    """
+    buffer = io.BytesIO()
+    c = new_document_canvas(buffer)
+    draw_invoice(c, invoice)
+    c.save()
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def draw_invoice(c, invoice, billing_items=None):
+    """Draw ``invoice`` on ``c`` starting on a fresh page.
+
+    ``billing_items`` lets batch callers pass prefetched items.
+    """
+    width, height = A4  # portrait
+
+    # Margins
+    left_margin = PAGE_MARGIN
+    right_margin = PAGE_MARGIN
+    usable_width = width - left_margin - right_margin
+
+    # Header: static letterhead, then invoice meta
+    y = height - PAGE_MARGIN
+    c.doForm(LETTERHEAD_FORM)
 
     # Invoice meta
     c.setFont("Helvetica", 10)
@@ -104,7 +150,9 @@ def generate_invoice_pdf_bytes(invoice):
     # Billing lines
     y_line = y
     c.setFont("Helvetica", 10)
-    for bi in invoice.visit.billing_items.select_related('tariff').all():
+    if billing_items is None:
+        billing_items = invoice.visit.billing_items.select_related('tariff').all()
+    for bi in billing_items:
         y_line -= 14
         if y_line < 80*mm:  # simple page break handling
             c.showPage()
@@ -161,14 +209,99 @@ def generate_invoice_pdf_bytes(invoice):
     c.drawString(left_margin + 120*mm, sign_y - 25, "Date:")
     c.line(left_margin + 133*mm, sign_y - 25, left_margin + 180*mm, sign_y - 25)
 
-    # Footer with clinic info
-    footer_y = 20 * mm
-    c.setFont("Helvetica", 9)
-    c.setFillColor(colors.grey)
-    footer_text = f"{CLINIC_INFO['address']}   |   Email: {CLINIC_INFO['email']}   |   Tel: {CLINIC_INFO['phone']}"
-    c.drawCentredString(width / 2, footer_y, footer_text)
+    c.doForm(FOOTER_FORM)
+    c.showPage()
+
+
+def draw_prescription(c, prescription, items=None):
+    """Draw ``prescription`` on ``c`` starting on a fresh page.
+
+    ``items`` lets batch callers pass prefetched prescription items.
+    """
+    width, height = A4
+    left_margin = PAGE_MARGIN
+    right_margin = PAGE_MARGIN
+    usable_width = width - left_margin - right_margin
+
+    y = height - PAGE_MARGIN
+    c.doForm(LETTERHEAD_FORM)
+
+    c.setFont("Helvetica", 10)
+    c.drawRightString(width - right_margin, y, f"Prescription #{prescription.id}")
+    c.drawRightString(width - right_margin, y - 12, f"Date: {prescription.created_at.strftime('%Y-%m-%d %H:%M')}")
+    c.drawRightString(width - right_margin, y - 24, prescription.get_prescription_type_display())
+
+    # Patient and doctor box
+    y -= 40*mm
+    c.setStrokeColor(colors.grey)
+    c.roundRect(left_margin, y, usable_width, 24*mm, 4*mm, stroke=1, fill=0)
+    x = left_margin + 6*mm
+    inner_y = y + 16*mm
+    patient = prescription.patient
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(x, inner_y, f"Patient: {patient.first_name} {patient.last_name}")
+    c.setFont("Helvetica", 10)
+    c.drawString(x, inner_y - 12, f"Age: {patient.age if patient.age is not None else '-'}    Phone: {patient.phone or '-'}")
+    doctor = prescription.doctor.user.get_full_name() if prescription.doctor else '-'
+    c.drawString(x + 250, inner_y, f"Doctor: Dr. {doctor}")
+
+    # Medicines table
+    y -= 14*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(left_margin + 2, y, "Medicine")
+    c.drawString(left_margin + 200, y, "Dosage")
+    c.drawString(left_margin + 290, y, "Frequency")
+    c.drawString(left_margin + 390, y, "Duration")
+    c.drawRightString(width - right_margin, y, "Qty")
+    c.line(left_margin, y - 4, width - right_margin, y - 4)
 
+    if items is None:
+        items = prescription.items.select_related('inventory_item').all()
+    c.setFont("Helvetica", 10)
+    for item in items:
+        y -= 16
+        if y < 60*mm:
+            c.showPage()
+            y = height - 40*mm
+            c.setFont("Helvetica", 10)
+        c.drawString(left_margin + 2, y, item.display_name()[:38])
+        c.drawString(left_margin + 200, y, (item.dosage or '-')[:16])
+        c.drawString(left_margin + 290, y, (item.frequency or '-')[:18])
+        c.drawString(left_margin + 390, y, (item.duration or '-')[:14])
+        c.drawRightString(width - right_margin, y, str(item.quantity))
+        if item.instructions:
+            y -= 12
+            c.setFont("Helvetica-Oblique", 9)
+            c.drawString(left_margin + 12, y, item.instructions[:100])
+            c.setFont("Helvetica", 10)
+
+    if prescription.instructions:
+        y -= 24
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(left_margin, y, "Instructions:")
+        c.setFont("Helvetica", 10)
+        for line in prescription.instructions.splitlines()[:8]:
+            y -= 13
+            c.drawString(left_margin + 10, y, line[:100])
+
+    # Doctor signature
+    sign_y = 45*mm
+    c.setFont("Helvetica", 10)
+    c.drawString(width - right_margin - 70*mm, sign_y + 4, "Doctor signature & stamp:")
+    c.line(width - right_margin - 70*mm, sign_y - 12, width - right_margin, sign_y - 12)
+
+    c.doForm(FOOTER_FORM)
     c.showPage()
+
+
+def generate_batch_pdf_bytes(invoices=(), prescriptions=()):
+    """One PDF with every invoice, then every prescription, sharing the letterhead forms."""
+    buffer = io.BytesIO()
+    c = new_document_canvas(buffer)
+    for invoice in invoices:
+        draw_invoice(c, invoice, billing_items=invoice.visit.billing_items.all())
+    for prescription in prescriptions:
+        draw_prescription(c, prescription, items=prescription.items.all())
     c.save()
     pdf = buffer.getvalue()
     buffer.close()
@@ -0,0 +1,137 @@
+"""Fixed-width receipts for thermal printers.
+
+A receipt printer prints monospaced text, so the cashier receipt is laid out
+as plain lines from the invoice, its billing items and its payments, with no
+PDF engine involved. The same lines are emitted either as text or wrapped in
+ESC/POS commands (alignment, bold, paper cut) for printers attached directly.
+Output depends only on the data passed in, so identical invoices give
+identical bytes.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .pdf import CLINIC_INFO
+
+DEFAULT_COLUMNS = 42  # 80mm paper, font A; 58mm printers use 32
+PRINTER_COLUMNS = (32, 42, 48)
+ESCPOS_ENCODING = 'cp437'
+
+LEFT, CENTER = 'left', 'center'
+
+# ESC/POS command bytes
+ESC_INIT = b'\x1b@'
+ESC_CODEPAGE_437 = b'\x1bt\x00'
+ESC_ALIGN = {LEFT: b'\x1ba\x00', CENTER: b'\x1ba\x01'}
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+ESC_FEED_AND_CUT = b'\x1bd\x04\x1dV\x01'
+
+
+def receipt_columns():
+    return getattr(settings, 'RECEIPT_PRINTER_COLUMNS', DEFAULT_COLUMNS)
+
+
+def _money(amount):
+    return f"{Decimal(amount or 0):,.0f}"
+
+
+def _pair(left, right, width):
+    """``left`` and ``right`` on one line, truncating ``left`` to fit."""
+    room = width - len(right) - 1
+    return f"{left[:room]:<{room}} {right}"
+
+
+def receipt_lines(invoice, billing_items=None, payments=None, width=None):
+    """The receipt as ``(text, align, bold)`` rows, ``width`` characters wide."""
+    width = width or receipt_columns()
+    visit = invoice.visit
+    patient = visit.patient
+    if billing_items is None:
+        billing_items = visit.billing_items.select_related('tariff').all()
+    if payments is None:
+        payments = invoice.payment_set.order_by('paid_at', 'id')
+
+    rule = ('-' * width, LEFT, False)
+    rows = [
+        (CLINIC_INFO['name'], CENTER, True),
+        (CLINIC_INFO['address'], CENTER, False),
+        (f"Tel: {CLINIC_INFO['phone']}", CENTER, False),
+        rule,
+        (_pair('Receipt', invoice.receipt_number or str(invoice.id), width), LEFT, False),
+        (_pair('Date', timezone.localtime(invoice.created_at).strftime('%Y-%m-%d %H:%M'), width), LEFT, False),
+        (_pair('Patient', f"{patient.first_name} {patient.last_name}", width), LEFT, False),
+    ]
+    if patient.is_insured:
+        rows.append((_pair('Insurance', patient.get_insurer_display() or '-', width), LEFT, False))
+        rows.append((_pair('Member #', patient.membership_number or '-', width), LEFT, False))
+    rows.append(rule)
+
+    subtotal = Decimal(0)
+    for item in billing_items:
+        if patient.is_insured:
+            unit = item.price_insurance_snapshot or 0
+        else:
+            unit = item.price_private_snapshot or 0
+        line_total = item.qty * Decimal(unit)
+        subtotal += line_total
+        rows.append((item.tariff.name[:width], LEFT, False))
+        rows.append((_pair(f"  {item.qty} x {_money(unit)}", _money(line_total), width), LEFT, False))
+    rows.append(rule)
+
+    coverage_pct = patient.insurance_coverage_pct if patient.is_insured else 0
+    insurance_pays = subtotal * coverage_pct / 100
+    rows.append((_pair('Subtotal', f"{_money(subtotal)} RWF", width), LEFT, False))
+    if coverage_pct:
+        rows.append((_pair(f"Insurance ({coverage_pct}%)", f"-{_money(insurance_pays)} RWF", width), LEFT, False))
+    rows.append((_pair('TOTAL DUE', f"{_money(subtotal - insurance_pays)} RWF", width), LEFT, True))
+
+    payments = list(payments)
+    if payments:
+        rows.append(rule)
+        for payment in payments:
+            label = payment.get_method_display()
+            if payment.reference:
+                label = f"{label} {payment.reference}"
+            rows.append((_pair(label, f"{_money(payment.amount)} RWF", width), LEFT, False))
+    rows.append(rule)
+    rows.append(('PAID' if invoice.paid else 'PAYMENT PENDING', CENTER, True))
+    rows.append(('Thank you for visiting us', CENTER, False))
+    return rows
+
+
+def render_text(invoice, width=None, **kwargs):
+    """Plain-text receipt, one ``\\n``-terminated line per row."""
+    width = width or receipt_columns()
+    lines = []
+    for text, align, _bold in receipt_lines(invoice, width=width, **kwargs):
+        lines.append(text.center(width).rstrip() if align == CENTER else text)
+    return '\n'.join(lines) + '\n'
+
+
+def render_escpos(invoice, width=None, **kwargs):
+    """ESC/POS byte stream: initialise, print every row, feed and cut."""
+    width = width or receipt_columns()
+    out = [ESC_INIT, ESC_CODEPAGE_437]
+    align = bold = None
+    for text, row_align, row_bold in receipt_lines(invoice, width=width, **kwargs):
+        if row_align != align:
+            out.append(ESC_ALIGN[row_align])
+            align = row_align
+        if row_bold != bold:
+            out.append(ESC_BOLD_ON if row_bold else ESC_BOLD_OFF)
+            bold = row_bold
+        out.append(text.encode(ESCPOS_ENCODING, errors='replace') + b'\n')
+    out.append(ESC_FEED_AND_CUT)
+    return b''.join(out)
+
+
+__all__ = [
+    'DEFAULT_COLUMNS',
+    'PRINTER_COLUMNS',
+    'receipt_columns',
+    'receipt_lines',
+    'render_escpos',
+    'render_text',
+]
@@ -0,0 +1,119 @@
+"""Per-process cache of reference data used by the doctor workspace forms.
+
+HMIS classifications, departments, doctors and active tariffs change a few
+times a month, yet every dashboard and visit page used to reload them. Each
+group has a version counter in the shared Django cache that ``clinic.signals``
+bumps on post_save/post_delete; a process keeps its prebuilt list until the
+version moves. Stock-dependent lists also expire after a short TTL because
+quantities change on every dispense.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+STOCK_TTL = 60
+
+_local = {}
+_lock = threading.Lock()
+
+
+def _version_key(group):
+    return f"reference-data:version:{group}"
+
+
+def _current_version(group):
+    return cache.get_or_set(_version_key(group), time.time_ns(), None)
+
+
+def _cached(group, build, ttl=None):
+    version = _current_version(group)
+    now = time.monotonic()
+    entry = _local.get(group)
+    if entry and entry[0] == version and (entry[1] is None or entry[1] > now):
+        return entry[2]
+    with _lock:
+        value = build()
+        _local[group] = (version, now + ttl if ttl else None, value)
+    return value
+
+
+def versions():
+    """Version of every reference group, for template fragment cache keys.
+
+    The stock entry also rolls over every ``STOCK_TTL`` seconds.
+    """
+    data = {group: _current_version(group) for group in ('hmis', 'departments', 'doctors', 'tariffs')}
+    data['pharmacy_stock'] = f"{_current_version('pharmacy_stock')}-{int(time.time() // STOCK_TTL)}"
+    return data
+
+
+def _bump_versions(groups):
+    for group in groups:
+        try:
+            cache.incr(_version_key(group))
+        except ValueError:
+            cache.set(_version_key(group), time.time_ns(), None)
+
+
+def invalidate_reference_data(*groups):
+    """Bump the version of ``groups`` once the current transaction commits."""
+    groups = set(groups)
+    if groups:
+        transaction.on_commit(lambda: _bump_versions(groups))
+
+
+def hmis_classifications():
+    from clinic.models_medical_records import HMISClassification
+    return _cached('hmis', lambda: list(HMISClassification.objects.all()))
+
+
+def departments():
+    from clinic.models import Department
+    return _cached('departments', lambda: list(Department.objects.all().order_by('name')))
+
+
+def doctors():
+    from clinic.models import ClinicUser
+    return _cached('doctors', lambda: list(
+        ClinicUser.objects.filter(role='doctor')
+        .select_related('user', 'department')
+        .order_by('user__first_name', 'user__last_name')
+    ))
+
+
+def peer_doctors(clinic_user):
+    return [doctor for doctor in doctors() if doctor.id != clinic_user.id]
+
+
+def active_tariffs():
+    from clinic.models import TariffAct
+    return _cached('tariffs', lambda: list(TariffAct.objects.filter(active=True).order_by('name')))
+
+
+def idsr_choices():
+    from clinic.models_medical_records import MedicalRecord
+    return MedicalRecord._meta.get_field('idsr_disease').choices
+
+
+def pharmacy_stock(limit=None):
+    from clinic.models import PharmacyStock
+    stock = _cached('pharmacy_stock', lambda: list(
+        PharmacyStock.objects.select_related('item').filter(qty_available__gt=0).order_by('item__name')
+    ), ttl=STOCK_TTL)
+    return stock[:limit] if limit else stock
+
+
+__all__ = [
+    'STOCK_TTL',
+    'active_tariffs',
+    'departments',
+    'doctors',
+    'hmis_classifications',
+    'idsr_choices',
+    'invalidate_reference_data',
+    'peer_doctors',
+    'pharmacy_stock',
+    'versions',
+]
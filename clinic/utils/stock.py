@@ -0,0 +1,424 @@
+"""First-expired, first-out allocation of pharmacy batches.
+
+Each ``PharmacyStock`` row is one batch of an inventory item. A prescription
+line is split across the item's unexpired batches by earliest expiry
+(batches without an expiry date go last), so near-expiry stock leaves the
+shelf first. All batches needed by a prescription are locked with a single
+``select_for_update`` ordered by primary key. Two concurrent dispenses lock
+rows in the same order and so cannot deadlock.
+
+``InventoryItem.qty_on_hand`` keeps the total over all batches so screens
+that list medicines need not sum batches themselves. ``receive_batch``
+books a purchased batch and folds its cost into ``InventoryItem.unit_cost``
+as a moving weighted average, in one UPDATE against the stock on hand.
+
+Saving a clinic prescription does not touch the batches: it reserves the
+quantities with an expiring ``StockReservation`` and raises the item's
+``qty_reserved`` counter in a conditional UPDATE, so a reservation only
+succeeds while the item's unexpired batches, less ``qty_reserved``, cover
+it. Dispensing turns
+the prescription's reservations into issues. Reservations nobody dispensed
+are released in bulk by ``release_expired_reservations``.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+LOW_STOCK_LEVEL = 10
+CRITICAL_STOCK_LEVEL = 5
+EXPIRY_WARNING_DAYS = 30
+DEFAULT_RESERVATION_MINUTES = 240
+
+
+class InsufficientStock(Exception):
+    """Raised when unexpired batches cannot cover a line; ``shortages`` lists ``(item, requested, available)``."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('Insufficient stock for: ' + ', '.join(
+            f"{item.name} (requested {requested}, available {available})"
+            for item, requested, available in shortages
+        ))
+
+
+def fefo_key(stock):
+    return (stock.expiry_date is None, stock.expiry_date, stock.id)
+
+
+def lock_batches(item_ids, today=None):
+    """Lock every unexpired batch of ``item_ids`` in primary-key order; one query."""
+    from clinic.models import PharmacyStock
+
+    today = today or timezone.localdate()
+    batches = (
+        PharmacyStock.objects.select_for_update(of=('self',))
+        .select_related('item')
+        .filter(item_id__in=item_ids, qty_available__gt=0)
+        .exclude(expiry_date__lt=today)
+        .order_by('id')
+    )
+    by_item = defaultdict(list)
+    for stock in batches:
+        by_item[stock.item_id].append(stock)
+    for stocks in by_item.values():
+        stocks.sort(key=fefo_key)
+    return by_item
+
+
+def allocate(lines, today=None):
+    """Split ``lines`` (``[(inventory_item, qty), ...]``) across batches.
+
+    Must run inside a transaction. Returns ``[(stock, qty), ...]`` with
+    ``qty_available`` already reduced on the returned ``stock`` objects but
+    not saved; raises ``InsufficientStock`` if any line cannot be covered.
+    """
+    wanted = defaultdict(int)
+    items = {}
+    for item, qty in lines:
+        if qty > 0:
+            wanted[item.id] += qty
+            items[item.id] = item
+
+    by_item = lock_batches(list(wanted), today=today)
+    allocations = []
+    shortages = []
+    for item_id, qty in wanted.items():
+        stocks = by_item.get(item_id, [])
+        available = sum(stock.qty_available for stock in stocks)
+        if available < qty:
+            shortages.append((items[item_id], qty, available))
+            continue
+        for stock in stocks:
+            if qty == 0:
+                break
+            take = min(qty, stock.qty_available)
+            stock.qty_available -= take
+            qty -= take
+            allocations.append((stock, take))
+    if shortages:
+        raise InsufficientStock(shortages)
+    return allocations
+
+
+def outstanding_lines(prescription, items=None):
+    """Quantities per item still to be issued for ``prescription``."""
+    from clinic.models import PharmacyDispense
+
+    if items is None:
+        items = prescription.items.select_related('inventory_item')
+    issued = dict(
+        PharmacyDispense.objects.filter(prescription=prescription)
+        .values('pharmacy_stock__item_id')
+        .annotate(total=Sum('qty'))
+        .values_list('pharmacy_stock__item_id', 'total')
+    )
+    lines = []
+    for line in items:
+        if line.inventory_item_id is None:
+            continue
+        already = min(issued.get(line.inventory_item_id, 0), line.quantity)
+        issued[line.inventory_item_id] = issued.get(line.inventory_item_id, 0) - already
+        if line.quantity - already > 0:
+            lines.append((line.inventory_item, line.quantity - already))
+    return lines
+
+
+def reservation_expiry(now=None):
+    minutes = getattr(settings, 'STOCK_RESERVATION_MINUTES', DEFAULT_RESERVATION_MINUTES)
+    return (now or timezone.now()) + timedelta(minutes=minutes)
+
+
+def adjust_reserved(deltas):
+    """Add ``{item_id: delta}`` to ``qty_reserved`` in one UPDATE."""
+    from clinic.models import InventoryItem
+
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return InventoryItem.objects.filter(pk__in=deltas).update(qty_reserved=F('qty_reserved') + Case(
+        *[When(pk=item_id, then=Value(delta)) for item_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def usable_stock(today=None):
+    """Subquery of an item's total in unexpired batches, the stock ``allocate`` can issue."""
+    from clinic.models import PharmacyStock
+
+    today = today or timezone.localdate()
+    unexpired = (
+        PharmacyStock.objects.filter(item=OuterRef('pk'), qty_available__gt=0)
+        .exclude(expiry_date__lt=today)
+        .values('item')
+        .annotate(total=Sum('qty_available'))
+        .values('total')
+    )
+    return Coalesce(Subquery(unexpired), 0)
+
+
+def claim_stock(wanted, today=None):
+    """Raise ``qty_reserved`` by ``{item_id: qty}`` where unexpired free stock covers it.
+
+    Each item is claimed with a conditional UPDATE in primary-key order that
+    compares the reserved total with the item's unexpired batches, so stock
+    that has expired cannot be promised. No batch rows are locked, but the
+    UPDATE holds the ``InventoryItem`` row lock until the caller's
+    transaction commits, serialising concurrent claims on the same item.
+    Must run inside a transaction; raises ``InsufficientStock`` (rolling
+    back the caller's transaction) if any item lacks free stock.
+    """
+    from clinic.models import InventoryItem
+
+    usable = usable_stock(today)
+    short = []
+    for item_id in sorted(wanted):
+        qty = wanted[item_id]
+        if qty <= 0:
+            continue
+        claimed = InventoryItem.objects.filter(
+            pk=item_id, qty_reserved__lte=usable - Value(qty)
+        ).update(qty_reserved=F('qty_reserved') + qty)
+        if not claimed:
+            short.append(item_id)
+    if short:
+        raise InsufficientStock([
+            (item, wanted[item.id], max(item.usable - item.qty_reserved, 0))
+            for item in InventoryItem.objects.filter(pk__in=short).annotate(usable=usable).order_by('id')
+        ])
+
+
+def reserve_prescription(prescription, items=None, expires_at=None):
+    """Hold stock for ``prescription`` until ``expires_at``; returns the reservations."""
+    from clinic.models import StockReservation
+
+    with transaction.atomic():
+        lines = outstanding_lines(prescription, items)
+        wanted = defaultdict(int)
+        for item, qty in lines:
+            wanted[item.id] += qty
+        claim_stock(wanted)
+        expires_at = expires_at or reservation_expiry()
+        return StockReservation.objects.bulk_create([
+            StockReservation(prescription=prescription, item_id=item_id, qty=qty, expires_at=expires_at)
+            for item_id, qty in wanted.items()
+        ])
+
+
+def release_expired_reservations(now=None):
+    """Release every active reservation past its expiry in one pass; returns how many.
+
+    Reservations locked by a dispense in progress are skipped and left for
+    the next run.
+    """
+    from clinic.models import StockReservation
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(status=StockReservation.STATUS_ACTIVE, expires_at__lte=now)
+            .values_list('id', 'item_id', 'qty')
+        )
+        if not expired:
+            return 0
+        StockReservation.objects.filter(pk__in=[row[0] for row in expired]).update(
+            status=StockReservation.STATUS_RELEASED, closed_at=now
+        )
+        released = defaultdict(int)
+        for _id, item_id, qty in expired:
+            released[item_id] -= qty
+        adjust_reserved(released)
+    return len(expired)
+
+
+def refresh_qty_reserved(item_ids=None):
+    """Recompute ``InventoryItem.qty_reserved`` from active reservations in one UPDATE."""
+    from clinic.models import InventoryItem, StockReservation
+
+    held = (
+        StockReservation.objects.filter(item=OuterRef('pk'), status=StockReservation.STATUS_ACTIVE)
+        .values('item')
+        .annotate(total=Sum('qty'))
+        .values('total')
+    )
+    items = InventoryItem.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+    return items.update(qty_reserved=Coalesce(Subquery(held), 0))
+
+
+def dispense_prescription(prescription, items=None, today=None, dispensed_by=None):
+    """Issue whatever ``prescription`` still needs from stock, FEFO across batches.
+
+    The prescription's active reservations are consumed; any quantity they
+    do not cover must come out of free stock. Locks the batches, decrements
+    them and appends one ``PharmacyDispense`` ledger row per batch used
+    (with its price, prescriber and pharmacist); returns those rows. Lines
+    already covered by earlier dispenses are skipped, so calling this twice
+    never issues stock twice.
+    """
+    from clinic.models import PharmacyDailyDispense, PharmacyDispense, PharmacyStock, StockReservation
+
+    with transaction.atomic():
+        lines = outstanding_lines(prescription, items)
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(prescription=prescription, status=StockReservation.STATUS_ACTIVE)
+            .order_by('id')
+        )
+        held = defaultdict(int)
+        for reservation in reservations:
+            held[reservation.item_id] += reservation.qty
+        wanted = defaultdict(int)
+        for item, qty in lines:
+            wanted[item.id] += qty
+        claim_stock({item_id: qty - held[item_id] for item_id, qty in wanted.items()}, today=today)
+
+        allocations = allocate(lines, today=today)
+        now = timezone.now()
+        if reservations:
+            StockReservation.objects.filter(pk__in=[r.id for r in reservations]).update(
+                status=StockReservation.STATUS_ISSUED, closed_at=now
+            )
+        # Drop the hold on everything issued or no longer needed
+        adjust_reserved({
+            item_id: -max(held[item_id], wanted[item_id])
+            for item_id in set(held) | set(wanted)
+        })
+        if not allocations:
+            return []
+        stocks = {stock.id: stock for stock, _qty in allocations}
+        for stock in stocks.values():
+            stock.updated_at = now
+        PharmacyStock.objects.bulk_update(stocks.values(), ['qty_available', 'updated_at'])
+        refresh_qty_on_hand({stock.item_id for stock in stocks.values()})
+        # bulk_create skips the post_save rollup signal, so roll up here
+        dispenses = PharmacyDispense.objects.bulk_create([
+            PharmacyDispense(
+                prescription=prescription,
+                pharmacy_stock=stock,
+                item_id=stock.item_id,
+                qty=qty,
+                unit_price=stock.unit_price,
+                prescribed_by_id=prescription.doctor_id,
+                dispensed_by=dispensed_by,
+            )
+            for stock, qty in allocations
+        ])
+        PharmacyDailyDispense.record(dispenses)
+        return dispenses
+
+
+def refresh_qty_on_hand(item_ids=None):
+    """Recompute ``InventoryItem.qty_on_hand`` from the batches in one UPDATE."""
+    from clinic.models import InventoryItem, PharmacyStock
+
+    batch_total = (
+        PharmacyStock.objects.filter(item=OuterRef('pk'))
+        .values('item')
+        .annotate(total=Sum('qty_available'))
+        .values('total')
+    )
+    items = InventoryItem.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+    return items.update(qty_on_hand=Coalesce(Subquery(batch_total), 0))
+
+
+def receive_batch(item, qty, unit_cost, expiry_date=None, batch_number=None):
+    """Add a purchased batch of ``item`` and move its average ``unit_cost``; returns the batch."""
+    from clinic.models import InventoryItem, PharmacyStock
+
+    cost = DecimalField(max_digits=12, decimal_places=2)
+    with transaction.atomic():
+        InventoryItem.objects.filter(pk=item.pk).update(unit_cost=Case(
+            When(qty_on_hand__lte=0, then=Value(unit_cost, output_field=cost)),
+            default=(F('qty_on_hand') * F('unit_cost') + Value(qty * unit_cost)) / (F('qty_on_hand') + Value(qty)),
+            output_field=cost,
+        ))
+        # Saving the batch refreshes qty_on_hand (see signals)
+        batch = PharmacyStock.objects.create(
+            item=item,
+            qty_available=qty,
+            unit_price=unit_cost,
+            expiry_date=expiry_date,
+            batch_number=batch_number,
+        )
+    item.refresh_from_db(fields=['unit_cost', 'qty_on_hand'])
+    return batch
+
+
+def stock_summary(queryset=None, today=None):
+    """Counts and value of pharmacy batches, computed in a single aggregate query."""
+    from clinic.models import PharmacyStock
+
+    if queryset is None:
+        queryset = PharmacyStock.objects.all()
+    today = today or timezone.localdate()
+    expiry_threshold = today + timedelta(days=EXPIRY_WARNING_DAYS)
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return queryset.aggregate(
+        total_items=Count('id'),
+        in_stock_count=Count('id', filter=Q(qty_available__gt=LOW_STOCK_LEVEL)),
+        low_stock_count=Count('id', filter=Q(qty_available__lte=LOW_STOCK_LEVEL)),
+        critical_count=Count('id', filter=Q(qty_available__lte=CRITICAL_STOCK_LEVEL)),
+        out_of_stock_count=Count('id', filter=Q(qty_available=0)),
+        expiring_count=Count('id', filter=Q(expiry_date__gte=today, expiry_date__lte=expiry_threshold)),
+        expired_count=Count('id', filter=Q(expiry_date__lt=today)),
+        total_value=Coalesce(
+            Sum(F('qty_available') * F('unit_price'), output_field=money), Value(0), output_field=money
+        ),
+    )
+
+
+def create_missing_stock(apps=None, using=DEFAULT_DB_ALIAS):
+    """Give every medicine without a pharmacy batch an empty one, in one ``bulk_create``.
+
+    ``apps`` is the historical app registry when called from ``post_migrate``,
+    so the query matches the migrated schema rather than the current models.
+    """
+    if apps is None:
+        from clinic.models import InventoryItem, PharmacyStock
+    else:
+        InventoryItem = apps.get_model('clinic', 'InventoryItem')
+        PharmacyStock = apps.get_model('clinic', 'PharmacyStock')
+
+    missing = (
+        InventoryItem.objects.using(using)
+        .filter(category='medicine', pharmacy_stocks__isnull=True)
+        .only('id', 'unit_cost')
+    )
+    created = PharmacyStock.objects.using(using).bulk_create([
+        PharmacyStock(item=item, qty_available=0, unit_price=item.unit_cost)
+        for item in missing
+    ])
+    return len(created)
+
+
+__all__ = [
+    'CRITICAL_STOCK_LEVEL',
+    'EXPIRY_WARNING_DAYS',
+    'InsufficientStock',
+    'LOW_STOCK_LEVEL',
+    'adjust_reserved',
+    'allocate',
+    'claim_stock',
+    'create_missing_stock',
+    'dispense_prescription',
+    'lock_batches',
+    'outstanding_lines',
+    'receive_batch',
+    'refresh_qty_on_hand',
+    'refresh_qty_reserved',
+    'release_expired_reservations',
+    'reservation_expiry',
+    'reserve_prescription',
+    'stock_summary',
+    'usable_stock',
+]
@@ -0,0 +1,84 @@
+"""Reconcile consumable stock alerts against current stock.
+
+The alerts that should be open are worked out with one query per alert
+type. They are compared in memory with the open ``StockAlert`` rows (active
+or acknowledged). Missing alerts are created with a single ``bulk_create``,
+and alerts whose condition has cleared are resolved with a single UPDATE.
+Running it again without stock changes writes nothing.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .stock import EXPIRY_WARNING_DAYS
+
+OPEN_STATUSES = ('active', 'acknowledged')
+
+
+def _number(value):
+    return f"{value:g}"
+
+
+def desired_alerts(today=None):
+    """``{(consumable_id, alert_type): message}`` for every alert that should be open."""
+    from clinic.models_financial import ConsumableInventory
+
+    today = today or timezone.localdate()
+    items = ConsumableInventory.objects.all()
+    fields = ('id', 'item_name', 'quantity_in_stock', 'unit', 'expiry_date')
+    desired = {}
+
+    for pk, name, _qty, _unit, _expiry in items.filter(quantity_in_stock__lte=0).values_list(*fields):
+        desired[(pk, 'out_of_stock')] = f"{name} is OUT OF STOCK"
+    for pk, name, qty, unit, _expiry in items.filter(
+        quantity_in_stock__gt=0, quantity_in_stock__lte=F('minimum_stock_level')
+    ).values_list(*fields):
+        desired[(pk, 'low_stock')] = f"{name} is below minimum stock level. Current: {_number(qty)} {unit}"
+    for pk, name, _qty, _unit, expiry in items.filter(
+        expiry_date__gte=today, expiry_date__lte=today + timedelta(days=EXPIRY_WARNING_DAYS)
+    ).values_list(*fields):
+        desired[(pk, 'expiring_soon')] = f"{name} expires in {(expiry - today).days} days ({expiry})"
+    for pk, name, _qty, _unit, expiry in items.filter(expiry_date__lt=today).values_list(*fields):
+        desired[(pk, 'expired')] = f"{name} has EXPIRED (Expiry: {expiry})"
+    return desired
+
+
+def reconcile_alerts(today=None):
+    """Open missing alerts and resolve cleared ones; returns ``(created, resolved)``."""
+    from clinic.models_financial import StockAlert
+
+    desired = desired_alerts(today)
+    with transaction.atomic():
+        open_alerts = StockAlert.objects.select_for_update().filter(
+            status__in=OPEN_STATUSES, consumable__isnull=False
+        ).order_by('id').values_list('id', 'consumable_id', 'alert_type')
+
+        seen = set()
+        to_resolve = []
+        for pk, consumable_id, alert_type in open_alerts:
+            key = (consumable_id, alert_type)
+            if key in desired and key not in seen:
+                seen.add(key)
+            else:
+                # Condition cleared, or a duplicate of an alert already kept
+                to_resolve.append(pk)
+
+        created = StockAlert.objects.bulk_create([
+            StockAlert(consumable_id=consumable_id, alert_type=alert_type, message=message)
+            for (consumable_id, alert_type), message in desired.items()
+            if (consumable_id, alert_type) not in seen
+        ])
+        resolved = 0
+        if to_resolve:
+            resolved = StockAlert.objects.filter(pk__in=to_resolve).update(
+                status='resolved', resolved_at=timezone.now()
+            )
+    return len(created), resolved
+
+
+__all__ = [
+    'desired_alerts',
+    'reconcile_alerts',
+]
@@ -0,0 +1,221 @@
+"""Stock take sessions: collect physical counts, review variances, apply in bulk.
+
+Counts are entered on the form or uploaded as a CSV or XLSX sheet. Each row
+names the consumable by ``id``, ``item_code`` or ``item_name`` and gives the
+``counted`` quantity, with optional ``notes``. Counts are upserted into the
+open session, so a sheet can be uploaded again after a recount.
+
+Each count keeps the system quantity at the time it was taken
+(``expected_quantity``). Applying a session adjusts every item by
+``counted - expected``, not to the counted figure, so usage or purchases
+recorded between counting and applying are kept. The counted items are
+locked, moved with one ``bulk_update`` and get one ledger adjustment each
+from one ``bulk_create``, all in a single transaction. The on-hand quantity
+stays equal to the ledger total, as it does after ``ledger.record_movement``.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+COUNT_COLUMNS = ('counted', 'physical_count', 'quantity', 'count')
+KEY_COLUMNS = ('id', 'item_code', 'item_name')
+
+
+class StockTakeError(Exception):
+    pass
+
+
+def _header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def read_count_file(upload):
+    """Rows of an uploaded CSV or XLSX count sheet as dicts keyed by lower-case header."""
+    name = upload.name.lower()
+    if name.endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(upload, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_header(cell) for cell in next(rows, ())]
+        records = [dict(zip(header, row)) for row in rows if any(cell not in (None, '') for cell in row)]
+        workbook.close()
+        return records
+    if name.endswith('.csv'):
+        text = io.TextIOWrapper(upload, encoding='utf-8-sig')
+        reader = csv.DictReader(text)
+        return [{_header(key): value for key, value in row.items()} for row in reader if any(row.values())]
+    raise StockTakeError('Upload a .csv or .xlsx file')
+
+
+def match_counts(records):
+    """Resolve sheet rows to ``{consumable_id: (counted, notes)}``; returns ``(counts, errors)``.
+
+    Ids, item codes and names are looked up with one query each.
+    """
+    from clinic.models_financial import ConsumableInventory
+
+    if records and not any(column in records[0] for column in COUNT_COLUMNS):
+        raise StockTakeError(f"The sheet needs a count column ({', '.join(COUNT_COLUMNS)})")
+    if records and not any(column in records[0] for column in KEY_COLUMNS):
+        raise StockTakeError(f"The sheet needs a column naming the item ({', '.join(KEY_COLUMNS)})")
+    ids = set()
+    for row in records:
+        try:
+            ids.add(int(row.get('id') or 0))
+        except (TypeError, ValueError):
+            pass
+    known_ids = set(ConsumableInventory.objects.filter(pk__in=ids).values_list('id', flat=True)) if ids else set()
+    codes = {str(row['item_code']).strip() for row in records if row.get('item_code')}
+    names = {str(row['item_name']).strip().lower() for row in records if row.get('item_name') and not row.get('id')}
+    by_code = dict(ConsumableInventory.objects.filter(item_code__in=codes).values_list('item_code', 'id')) if codes else {}
+    by_name = {}
+    if names:
+        for pk, item_name in ConsumableInventory.objects.values_list('id', 'item_name'):
+            by_name.setdefault(item_name.strip().lower(), pk)
+
+    counts = {}
+    errors = []
+    for line, row in enumerate(records, start=2):
+        raw = next((row[column] for column in COUNT_COLUMNS if row.get(column) not in (None, '')), None)
+        if raw is None:
+            continue
+        try:
+            counted = Decimal(str(raw).strip())
+        except InvalidOperation:
+            errors.append(f"Row {line}: '{raw}' is not a number")
+            continue
+        if counted < 0:
+            errors.append(f"Row {line}: count cannot be negative")
+            continue
+        if row.get('id'):
+            try:
+                consumable_id = int(row['id'])
+            except (TypeError, ValueError):
+                consumable_id = None
+            if consumable_id not in known_ids:
+                consumable_id = None
+        elif row.get('item_code'):
+            consumable_id = by_code.get(str(row['item_code']).strip())
+        else:
+            consumable_id = by_name.get(str(row.get('item_name') or '').strip().lower())
+        if consumable_id is None:
+            label = row.get('id') or row.get('item_code') or row.get('item_name') or '?'
+            errors.append(f"Row {line}: no consumable matches '{label}'")
+            continue
+        counts[consumable_id] = (counted, str(row.get('notes') or '')[:255])
+    return counts, errors
+
+
+def save_counts(session, counts):
+    """Upsert ``{consumable_id: (counted, notes)}`` into ``session``; returns how many were saved."""
+    from clinic.models_financial import ConsumableInventory, StockTakeCount
+
+    if session.status != session.STATUS_OPEN:
+        raise StockTakeError('This stock take is no longer open')
+    if any(counted < 0 for counted, _notes in counts.values()):
+        raise StockTakeError('Counts cannot be negative')
+    expected = dict(
+        ConsumableInventory.objects.filter(pk__in=counts).values_list('id', 'quantity_in_stock')
+    )
+    now = timezone.now()
+    rows = StockTakeCount.objects.bulk_create([
+        StockTakeCount(
+            session=session,
+            consumable_id=consumable_id,
+            expected_quantity=expected[consumable_id],
+            counted_quantity=counted,
+            notes=notes,
+            counted_at=now,
+        )
+        for consumable_id, (counted, notes) in counts.items()
+        if consumable_id in expected
+    ], update_conflicts=True, unique_fields=['session', 'consumable'],
+        update_fields=['expected_quantity', 'counted_quantity', 'notes', 'counted_at'])
+    return len(rows)
+
+
+def variances(session):
+    """Counted items with their variance from the stock at count time and its value, largest first.
+
+    ``moved`` is how much the stock changed since the item was counted;
+    applying keeps those changes.
+    """
+    rows = []
+    total_value = Decimal('0')
+    for count in session.counts.select_related('consumable'):
+        consumable = count.consumable
+        difference = count.counted_quantity - count.expected_quantity
+        value = difference * consumable.average_unit_cost
+        total_value += value
+        rows.append({
+            'count': count,
+            'consumable': consumable,
+            'system_quantity': count.expected_quantity,
+            'moved': consumable.quantity_in_stock - count.expected_quantity,
+            'difference': difference,
+            'value': value,
+        })
+    rows.sort(key=lambda row: abs(row['value']), reverse=True)
+    return rows, total_value
+
+
+def apply_session(session_id, performed_by=None):
+    """Adjust every counted item by its variance and record the adjustments; returns items changed."""
+    from clinic.models_financial import (
+        ConsumableInventory, ConsumableMovement, StockTakeCount, StockTakeSession,
+    )
+
+    with transaction.atomic():
+        session = StockTakeSession.objects.select_for_update().get(pk=session_id)
+        if session.status != StockTakeSession.STATUS_OPEN:
+            raise StockTakeError('This stock take has already been applied or cancelled')
+        counts = {
+            consumable_id: (counted - expected, notes)
+            for consumable_id, counted, expected, notes in StockTakeCount.objects.filter(
+                session=session
+            ).values_list('consumable_id', 'counted_quantity', 'expected_quantity', 'notes')
+        }
+        consumables = ConsumableInventory.objects.select_for_update().filter(pk__in=counts).order_by('id')
+
+        now = timezone.now()
+        changed = []
+        movements = []
+        for consumable in consumables:
+            difference, notes = counts[consumable.id]
+            if difference == 0:
+                continue
+            consumable.quantity_in_stock += difference
+            consumable.updated_at = now
+            changed.append(consumable)
+            movements.append(ConsumableMovement(
+                consumable=consumable,
+                movement_type=ConsumableMovement.MOVEMENT_ADJUSTMENT,
+                quantity=difference,
+                unit_cost=consumable.average_unit_cost,
+                value=(difference * consumable.average_unit_cost).quantize(Decimal('0.01')),
+                occurred_at=now,
+                performed_by=performed_by,
+                notes=f"Stock take #{session.pk}: {notes}" if notes else f"Stock take #{session.pk}",
+            ))
+        ConsumableInventory.objects.bulk_update(changed, ['quantity_in_stock', 'updated_at'], batch_size=500)
+        ConsumableMovement.objects.bulk_create(movements, batch_size=500)
+
+        session.status = StockTakeSession.STATUS_APPLIED
+        session.applied_by = performed_by
+        session.applied_at = now
+        session.save(update_fields=['status', 'applied_by', 'applied_at'])
+    return len(changed)
+
+
+__all__ = [
+    'StockTakeError',
+    'apply_session',
+    'match_counts',
+    'read_count_file',
+    'save_counts',
+    'variances',
+]
@@ -0,0 +1,170 @@
+"""Deep-zoom tile pyramids for radiograph attachments.
+
+Panoramic X-rays and CBCT slices are too large to download and decode in
+full just to zoom into one tooth. Each X-ray image attachment is cut into
+256px JPEG tiles at every zoom level (Deep Zoom layout: level ``max_level``
+is full resolution, each level below halves it, level 0 is 1x1) under
+``<dir>/tiles/<attachment id>/<version>/<level>/<col>_<row>.jpg``. The viewer
+then only fetches the tiles in view. Tiling runs on the image worker pool
+after upload.
+
+Every build gets a fresh ``version``, which is also part of the tile URLs.
+Tiles are served as immutable, so a rebuilt pyramid must not reuse the
+URLs of the one it replaces; the old tiles are deleted once the new
+pyramid is stored.
+"""
+import io
+import logging
+import math
+import posixpath
+import uuid
+
+from django.core.files.base import ContentFile
+
+from .images import is_image, run_in_background
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+TILE_FORMAT = 'jpg'
+TILE_QUALITY = 85
+TILED_FILE_TYPES = ('xray',)
+
+
+def wants_tiles(attachment, force=False):
+    return (
+        attachment.file_type in TILED_FILE_TYPES
+        and bool(attachment.file)
+        and is_image(attachment.file.name)
+        and (force or (attachment.tile_pyramid or {}).get('source') != attachment.file.name)
+    )
+
+
+def tile_directory(attachment, version):
+    return posixpath.join(posixpath.dirname(attachment.file.name), 'tiles', str(attachment.pk), version)
+
+
+def pyramid_version(pyramid):
+    # Pyramids built before versioning live directly under tiles/<id>/
+    return (pyramid or {}).get('version', '0')
+
+
+def tile_name(pyramid, level, col, row):
+    return posixpath.join(pyramid['directory'], str(level), f"{col}_{row}.{pyramid['format']}")
+
+
+def level_size(pyramid, level):
+    scale = 2 ** (pyramid['max_level'] - level)
+    return math.ceil(pyramid['width'] / scale), math.ceil(pyramid['height'] / scale)
+
+
+def tile_grid(pyramid, level):
+    width, height = level_size(pyramid, level)
+    return math.ceil(width / pyramid['tile_size']), math.ceil(height / pyramid['tile_size'])
+
+
+def has_tile(pyramid, level, col, row):
+    if not pyramid or not 0 <= level <= pyramid['max_level']:
+        return False
+    cols, rows = tile_grid(pyramid, level)
+    return 0 <= col < cols and 0 <= row < rows
+
+
+def _grayscale_or_rgb(image):
+    if image.mode in ('I;16', 'I;16B', 'I;16L', 'I'):
+        # 16-bit radiographs: scale to 8 bits before JPEG encoding
+        image = image.convert('I').point(lambda value: value * (1 / 256)).convert('L')
+    if image.mode in ('1', 'LA'):
+        image = image.convert('L')
+    elif image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    return image
+
+
+def build_pyramid(attachment):
+    """Cut every zoom level of ``attachment`` into tiles; returns the ``tile_pyramid`` value."""
+    from PIL import Image, ImageOps
+
+    storage = attachment.file.storage
+    with storage.open(attachment.file.name, 'rb') as original:
+        with Image.open(original) as source:
+            image = _grayscale_or_rgb(ImageOps.exif_transpose(source))
+            image.load()
+
+    version = uuid.uuid4().hex[:12]
+    pyramid = {
+        'source': attachment.file.name,
+        'version': version,
+        'directory': tile_directory(attachment, version),
+        'width': image.width,
+        'height': image.height,
+        'tile_size': TILE_SIZE,
+        'format': TILE_FORMAT,
+        'max_level': math.ceil(math.log2(max(image.width, image.height, 1))),
+    }
+    for level in range(pyramid['max_level'], -1, -1):
+        size = level_size(pyramid, level)
+        if image.size != size:
+            image = image.resize(size, Image.Resampling.LANCZOS)
+        cols, rows = tile_grid(pyramid, level)
+        for col in range(cols):
+            for row in range(rows):
+                left, top = col * TILE_SIZE, row * TILE_SIZE
+                tile = image.crop((left, top, min(left + TILE_SIZE, size[0]), min(top + TILE_SIZE, size[1])))
+                buffer = io.BytesIO()
+                tile.save(buffer, 'JPEG', quality=TILE_QUALITY)
+                storage.save(tile_name(pyramid, level, col, row), ContentFile(buffer.getvalue()))
+    return pyramid
+
+
+def delete_pyramid(pyramid, storage):
+    if not pyramid or 'max_level' not in pyramid:
+        return
+    for level in range(pyramid['max_level'] + 1):
+        cols, rows = tile_grid(pyramid, level)
+        for col in range(cols):
+            for row in range(rows):
+                try:
+                    storage.delete(tile_name(pyramid, level, col, row))
+                except OSError:
+                    pass
+
+
+def tile_now(attachment_id, force=False):
+    """Build and store the pyramid of one attachment; ``force`` rebuilds an existing one."""
+    from clinic.models_medical_records import MedicalRecordAttachment
+
+    attachment = MedicalRecordAttachment.objects.filter(pk=attachment_id).first()
+    if attachment is None or not wants_tiles(attachment, force):
+        return None
+    try:
+        pyramid = build_pyramid(attachment)
+    except Exception:
+        logger.exception("Could not tile attachment %s", attachment_id)
+        return None
+    stored = MedicalRecordAttachment.objects.filter(
+        pk=attachment_id, file=attachment.file.name
+    ).update(tile_pyramid=pyramid)
+    # Drop whichever pyramid is no longer referenced
+    delete_pyramid(attachment.tile_pyramid if stored else pyramid, attachment.file.storage)
+    return pyramid if stored else None
+
+
+def schedule_tiles(attachment):
+    """Build the tile pyramid of ``attachment`` in the background once the transaction commits."""
+    run_in_background(tile_now, attachment.pk)
+
+
+__all__ = [
+    'TILED_FILE_TYPES',
+    'TILE_SIZE',
+    'build_pyramid',
+    'delete_pyramid',
+    'has_tile',
+    'pyramid_version',
+    'schedule_tiles',
+    'tile_grid',
+    'tile_name',
+    'tile_now',
+    'wants_tiles',
+]
@@ -0,0 +1,188 @@
+# clinic/views_attachments.py
+"""
+Medical record attachments: resumable chunked upload, ranged download and
+the deep-zoom radiograph viewer.
+
+Upload protocol:
+  1. POST   visit/<id>/attachments/uploads/  {filename, size, file_type, description}
+            (optional ``sha256`` of the whole file, verified once the last chunk arrives)
+  2. PUT    attachments/uploads/<upload_id>/  raw chunk body, ``Content-Range: bytes a-b/size``
+            (optional ``X-Chunk-SHA256``); repeat until ``complete``
+  3. GET    attachments/uploads/<upload_id>/  current ``offset`` to resume after a failure
+"""
+
+import json
+import re
+
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_http_methods
+
+from .models import Visit
+from .models_medical_records import ATTACHMENT_FILE_TYPES, AttachmentUpload, MedicalRecord, MedicalRecordAttachment
+from .utils import attachments, tiles
+from .views_doctor import _ensure_visit_access, _require_doctor_user
+
+_SHA256 = re.compile(r'^[0-9a-fA-F]{64}$')
+
+
+def _upload_state(upload):
+    data = {
+        'success': True,
+        'upload_id': str(upload.id),
+        'url': reverse('doctor-attachment-upload', args=[upload.id]),
+        'offset': upload.received,
+        'size': upload.size,
+        'chunk_size': attachments.chunk_size(),
+        'complete': upload.completed,
+    }
+    if upload.completed:
+        data['attachment'] = {
+            'id': upload.attachment_id,
+            'url': reverse('doctor-attachment-download', args=[upload.attachment_id]),
+        }
+    return data
+
+
+@login_required
+@require_http_methods(["POST"])
+def start_attachment_upload(request, visit_id):
+    visit = get_object_or_404(Visit, id=visit_id)
+    clinic_user = _require_doctor_user(request)
+    _ensure_visit_access(visit, clinic_user, request)
+
+    try:
+        payload = json.loads(request.body or b"{}")
+        filename = str(payload["filename"]).strip()
+        size = int(payload["size"])
+        checksum = str(payload.get("sha256") or '').strip()
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"success": False, "error": "filename and size are required"}, status=400)
+
+    file_type = payload.get("file_type") or 'document'
+    if not filename or (checksum and not _SHA256.match(checksum)) or file_type not in dict(ATTACHMENT_FILE_TYPES):
+        return JsonResponse({"success": False, "error": "Invalid upload metadata"}, status=400)
+    if size <= 0 or size > attachments.max_size():
+        return JsonResponse({"success": False, "error": f"Files are limited to {attachments.max_size()} bytes"}, status=413)
+
+    medical_record, _ = MedicalRecord.objects.get_or_create(visit=visit)
+    upload = AttachmentUpload.objects.create(
+        medical_record=medical_record,
+        uploaded_by=clinic_user,
+        filename=filename[:255],
+        file_type=file_type,
+        description=str(payload.get("description") or '')[:255],
+        size=size,
+        checksum=checksum.lower(),
+    )
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PUT", "DELETE"])
+def attachment_upload(request, upload_id):
+    upload = get_object_or_404(AttachmentUpload.objects.select_related('medical_record__visit'), id=upload_id)
+    clinic_user = _require_doctor_user(request)
+    _ensure_visit_access(upload.medical_record.visit, clinic_user, request)
+
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+
+    if request.method == "DELETE":
+        if not upload.completed:
+            attachments.delete_part(upload)
+            upload.delete()
+        return JsonResponse({"success": True})
+
+    if upload.completed:
+        return JsonResponse(_upload_state(upload))
+
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().select_related('medical_record').get(id=upload.id)
+        if upload.completed:
+            return JsonResponse(_upload_state(upload))
+        try:
+            start, end = attachments.parse_content_range(request.headers.get('Content-Range'), upload.size)
+            upload.received = attachments.append_chunk(
+                upload, request, start, end, request.headers.get('X-Chunk-SHA256')
+            )
+            if upload.received == upload.size:
+                upload.attachment = attachments.complete_upload(upload)
+        except attachments.UploadError as error:
+            upload.save(update_fields=['received', 'updated_at'])
+            return JsonResponse({"success": False, "error": str(error), "offset": upload.received}, status=error.status)
+        upload.save(update_fields=['received', 'attachment', 'updated_at'])
+
+    return JsonResponse(_upload_state(upload), status=201 if upload.completed else 200)
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def download_attachment(request, attachment_id):
+    attachment = get_object_or_404(
+        MedicalRecordAttachment.objects.select_related('medical_record__visit'), id=attachment_id
+    )
+    clinic_user = _require_doctor_user(request)
+    _ensure_visit_access(attachment.medical_record.visit, clinic_user, request)
+
+    return attachments.ranged_file_response(
+        request,
+        attachment.file,
+        etag=attachments.attachment_etag(attachment),
+        last_modified=attachment.uploaded_at.timestamp(),
+    )
+
+
+def _get_attachment(request, attachment_id):
+    attachment = get_object_or_404(
+        MedicalRecordAttachment.objects.select_related('medical_record__visit__patient'), id=attachment_id
+    )
+    clinic_user = _require_doctor_user(request)
+    _ensure_visit_access(attachment.medical_record.visit, clinic_user, request)
+    return clinic_user, attachment
+
+
+@login_required
+def radiograph_viewer(request, attachment_id):
+    clinic_user, attachment = _get_attachment(request, attachment_id)
+    pyramid = attachment.tile_pyramid or {}
+
+    context = {
+        'clinic_user': clinic_user,
+        'attachment': attachment,
+        'visit': attachment.medical_record.visit,
+        'tile_source': {
+            'width': pyramid['width'],
+            'height': pyramid['height'],
+            'tileSize': pyramid['tile_size'],
+            'maxLevel': pyramid['max_level'],
+            # ".../tiles/<version>/0/0_0.jpg" -> ".../tiles/<version>"; the viewer appends "/<level>/<col>_<row>.jpg"
+            'tilesUrl': reverse(
+                'doctor-attachment-tile', args=[attachment.id, tiles.pyramid_version(pyramid), 0, 0, 0]
+            ).rsplit('/', 2)[0],
+        } if pyramid.get('max_level') is not None else None,
+    }
+    return render(request, 'doctor/radiograph_viewer.html', context)
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def radiograph_tile(request, attachment_id, version, level, col, row):
+    """One JPEG tile; a rebuild gets a new ``version``, so browsers may keep tiles for a year."""
+    _, attachment = _get_attachment(request, attachment_id)
+    pyramid = attachment.tile_pyramid or {}
+    if version != tiles.pyramid_version(pyramid) or not tiles.has_tile(pyramid, level, col, row):
+        raise Http404("No such tile")
+
+    storage = attachment.file.storage
+    try:
+        tile = storage.open(tiles.tile_name(pyramid, level, col, row), 'rb')
+    except FileNotFoundError:
+        raise Http404("No such tile")
+    response = FileResponse(tile, content_type='image/jpeg')
+    patch_cache_control(response, private=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
@@ -615,3 +615,84 @@ def cashier_print_prescription(request, prescription_id):
         'print_date': timezone.now(),
     }
     return render(request, 'doctor/prescription_print.html', context)
+
+
+@login_required(login_url='/cashier/login/')
+@require_http_methods(["GET", "POST"])
+def print_queue(request):
+    """Select many invoices and prescriptions and print them as one PDF"""
+    if not hasattr(request.user, 'clinicuser') or request.user.clinicuser.role != 'cashier':
+        messages.error(request, 'Access denied. Cashier role required.')
+        return redirect('cashier_login')
+
+    from django.http import HttpResponse
+    from django.utils.dateparse import parse_date
+    from .models import Prescription
+    from .utils.pdf import generate_batch_pdf_bytes
+
+    if request.method == 'POST':
+        invoice_ids = [int(pk) for pk in request.POST.getlist('invoice_ids') if pk.isdigit()]
+        prescription_ids = [int(pk) for pk in request.POST.getlist('prescription_ids') if pk.isdigit()]
+        if not invoice_ids and not prescription_ids:
+            messages.error(request, 'Select at least one document to print.')
+            return redirect('cashier_print_queue')
+
+        # Two queries per document type regardless of how many are selected
+        invoices = Invoice.objects.filter(id__in=invoice_ids).select_related(
+            'visit__patient'
+        ).prefetch_related('visit__billing_items__tariff').order_by('created_at')
+        prescriptions = Prescription.objects.filter(id__in=prescription_ids).select_related(
+            'patient', 'doctor__user'
+        ).prefetch_related('items__inventory_item').order_by('created_at')
+
+        pdf = generate_batch_pdf_bytes(invoices, prescriptions)
+        response = HttpResponse(pdf, content_type='application/pdf')
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+        response['Content-Disposition'] = f'inline; filename="print-queue-{stamp}.pdf"'
+        return response
+
+    try:
+        selected_date = parse_date(request.GET.get('date', '')) or timezone.localdate()
+    except ValueError:
+        # Well formed but impossible, e.g. 2026-02-30
+        selected_date = timezone.localdate()
+    invoices = Invoice.objects.filter(created_at__date=selected_date).select_related(
+        'visit__patient'
+    ).order_by('created_at')
+    prescriptions = Prescription.objects.filter(created_at__date=selected_date).select_related(
+        'patient', 'doctor__user'
+    ).annotate(item_count=Count('items')).order_by('created_at')
+
+    context = {
+        'selected_date': selected_date,
+        'invoices': invoices,
+        'prescriptions': prescriptions,
+    }
+    return render(request, 'cashier/print_queue.html', context)
+
+
+@login_required(login_url='/cashier/login/')
+def thermal_receipt(request, visit_id):
+    """Fixed-width receipt for thermal printers (?format=text|escpos, ?width=32|42|48)"""
+    if not hasattr(request.user, 'clinicuser') or request.user.clinicuser.role != 'cashier':
+        messages.error(request, 'Access denied. Cashier role required.')
+        return redirect('cashier_login')
+
+    from django.http import HttpResponse
+    from .utils.receipts import PRINTER_COLUMNS, receipt_columns, render_escpos, render_text
+
+    invoice = get_object_or_404(Invoice.objects.select_related('visit__patient'), visit_id=visit_id)
+    billing_items = invoice.visit.billing_items.select_related('tariff')
+    payments = invoice.payment_set.order_by('paid_at', 'id')
+
+    width = request.GET.get('width', '')
+    width = int(width) if width.isdigit() and int(width) in PRINTER_COLUMNS else receipt_columns()
+
+    if request.GET.get('format') == 'escpos':
+        data = render_escpos(invoice, width=width, billing_items=billing_items, payments=payments)
+        response = HttpResponse(data, content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="receipt-{invoice.receipt_number or invoice.id}.bin"'
+        return response
+
+    text = render_text(invoice, width=width, billing_items=billing_items, payments=payments)
+    return HttpResponse(text, content_type='text/plain; charset=utf-8')
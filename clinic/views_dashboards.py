@@ -7,12 +7,13 @@ from datetime import timedelta, datetime
 from clinic.models import (
     Patient, Visit, WaitingQueueEntry, Appointment, 
     Invoice, BillingItem, Department, ClinicUser, TariffAct,
-    PharmacyStock, PharmacyDispense, Prescription, PrescriptionItem,
+    PharmacyStock, PharmacyDispense, PharmacyDailyDispense, Prescription, PrescriptionItem,
     InventoryItem, StockMovement
 )
 from clinic.models_financial import (
     FixedAsset, ConsumableInventory, ConsumableUsage
 )
+from clinic.utils.stock import CRITICAL_STOCK_LEVEL, EXPIRY_WARNING_DAYS, LOW_STOCK_LEVEL, stock_summary
 
 # Admin Dashboard
 def admin_dashboard(request):
@@ -183,34 +184,35 @@ def cashier_dashboard(request):
 def pharmacy_dashboard(request):
     today = timezone.now().date()
     
-    # Total stock items
-    total_medicines = PharmacyStock.objects.count()
+    # Stock counts in one aggregate query
+    summary = stock_summary(today=today)
+    total_medicines = summary['total_items']
     
     # Low stock items (less than 10 units)
     low_stock_items = PharmacyStock.objects.filter(
-        qty_available__lte=10
+        qty_available__lte=LOW_STOCK_LEVEL
     ).select_related('item').order_by('qty_available')[:10]
-    low_stock_count = low_stock_items.count()
+    low_stock_count = summary['low_stock_count']
     
     # Expired or expiring soon (within 30 days)
-    expiry_threshold = today + timedelta(days=30)
+    expiry_threshold = today + timedelta(days=EXPIRY_WARNING_DAYS)
     expired_items = PharmacyStock.objects.filter(
         expiry_date__lte=expiry_threshold,
         expiry_date__isnull=False
     ).select_related('item').order_by('expiry_date')[:10]
-    expired_count = expired_items.count()
+    expired_count = summary['expiring_count'] + summary['expired_count']
     
     # Today's dispensing activity
     today_dispensing = PharmacyDispense.objects.filter(
         dispensed_at__date=today
-    ).select_related('prescription', 'prescription__patient', 'pharmacy_stock', 'pharmacy_stock__item')
-    today_dispensed = today_dispensing.count()
+    ).select_related('prescription', 'prescription__patient', 'item').order_by('-dispensed_at')
+    today_dispensed = PharmacyDailyDispense.objects.filter(date=timezone.localdate()).aggregate(total=Sum('quantity'))['total'] or 0
     
     # Pending prescriptions (prescriptions not fully dispensed)
     pending_prescriptions = Prescription.objects.filter(
         visit__status__in=['in_progress', 'closed'],
-        prescription_type='clinic'
-    ).select_related('patient', 'doctor', 'visit').order_by('-created_at')[:10]
+        dispense_status=Prescription.STATUS_PENDING
+    ).select_related('patient', 'doctor', 'visit').order_by('created_at', 'id')[:10]
     
     # Recent prescriptions
     recent_prescriptions = Prescription.objects.select_related(
@@ -219,7 +221,7 @@ def pharmacy_dashboard(request):
     
     # Stock alerts - items that are both low stock and expiring
     critical_items = PharmacyStock.objects.filter(
-        Q(qty_available__lte=5) | Q(expiry_date__lte=expiry_threshold, expiry_date__isnull=False)
+        Q(qty_available__lte=CRITICAL_STOCK_LEVEL) | Q(expiry_date__lte=expiry_threshold, expiry_date__isnull=False)
     ).select_related('item').distinct()[:10]
     
     context = {
@@ -1,5 +1,6 @@
 # clinic/views_doctor.py
 
+import json
 from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
@@ -7,6 +8,7 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods
 
@@ -24,6 +26,8 @@ from clinic.models import (
     Department,
 )
 from clinic.models_medical_records import MedicalRecord, HMISClassification
+from clinic.utils import reference_data
+from clinic.utils.stock import InsufficientStock, reserve_prescription
 
 
 COMPLETED_STATUSES = ['completed', 'awaiting_payment']
@@ -194,28 +198,37 @@ def visit_detail(request, visit_id):
     triage, _ = Triage.objects.get_or_create(visit=visit)
     medical_record, _ = MedicalRecord.objects.get_or_create(visit=visit)
 
+    # A full save from a form opened before the latest autosave is refused
+    stale = False
     if request.method == "POST" and 'save_medical_record' in request.POST:
-        medical_record.chief_complaint = request.POST.get("chief_complaint", "")
-        medical_record.history_presenting_illness = request.POST.get("history_present_illness", "")
-        medical_record.past_medical_history = request.POST.get("past_medical_history", "")
-
         social_family = request.POST.get("social_family_history", "")
-        medical_record.social_history = social_family
-        medical_record.family_history = social_family
-
-        medical_record.review_of_systems = request.POST.get("review_systems", "")
-        medical_record.general_examination = request.POST.get("general_examination", "")
-        medical_record.specialty_examination = request.POST.get("specialty_examination", "")
-        medical_record.investigations = request.POST.get("investigations", "")
-        medical_record.diagnosis = request.POST.get("diagnosis", "")
-        medical_record.treatment_plan = request.POST.get("treatment_plan", "")
-        medical_record.hmis_classification = request.POST.get("hmis_classification", "")
-        medical_record.idsr_disease = request.POST.get("idsr_classification", "")
-
-        medical_record.save()
+        with transaction.atomic():
+            medical_record = MedicalRecord.objects.select_for_update().get(pk=medical_record.pk)
+            try:
+                stale = int(request.POST.get("record_version", "")) != medical_record.version
+            except ValueError:
+                stale = True
+            if not stale:
+                # Only columns whose value actually changed are written.
+                medical_record.apply_changes({
+                    "chief_complaint": request.POST.get("chief_complaint", ""),
+                    "history_presenting_illness": request.POST.get("history_present_illness", ""),
+                    "past_medical_history": request.POST.get("past_medical_history", ""),
+                    "social_history": social_family,
+                    "family_history": social_family,
+                    "review_of_systems": request.POST.get("review_systems", ""),
+                    "general_examination": request.POST.get("general_examination", ""),
+                    "specialty_examination": request.POST.get("specialty_examination", ""),
+                    "investigations": request.POST.get("investigations", ""),
+                    "diagnosis": request.POST.get("diagnosis", ""),
+                    "treatment_plan": request.POST.get("treatment_plan", ""),
+                    "hmis_classification": request.POST.get("hmis_classification", ""),
+                    "idsr_disease": request.POST.get("idsr_classification", ""),
+                })
 
-        messages.success(request, 'Medical record saved successfully!')
-        return redirect("doctor-visit-detail", visit_id=visit_id)
+        if not stale:
+            messages.success(request, 'Medical record saved successfully!')
+            return redirect("doctor-visit-detail", visit_id=visit_id)
 
     billing_items = visit.billing_items.select_related("tariff").all()
     private_total = sum((item.price_private_snapshot or Decimal('0')) * item.qty for item in billing_items)
@@ -224,13 +237,13 @@ def visit_detail(request, visit_id):
         for item in billing_items
     )
 
-    tariffs = TariffAct.objects.filter(active=True).order_by('name')
-    pharmacy_stock = PharmacyStock.objects.select_related('item').filter(qty_available__gt=0).order_by('item__name')
+    tariffs = reference_data.active_tariffs()
+    pharmacy_stock = reference_data.pharmacy_stock()
     prescriptions = visit.prescriptions.select_related('doctor').prefetch_related('items__inventory_item').order_by('-created_at')
-    departments = Department.objects.all().order_by('name')
-    peer_doctors = ClinicUser.objects.filter(role='doctor').exclude(id=clinic_user.id).select_related('user', 'department').order_by('user__first_name', 'user__last_name')
-    hmis_classifications = HMISClassification.objects.all()
-    idsr_choices = MedicalRecord._meta.get_field('idsr_disease').choices
+    departments = reference_data.departments()
+    peer_doctors = reference_data.peer_doctors(clinic_user)
+    hmis_classifications = reference_data.hmis_classifications()
+    idsr_choices = reference_data.idsr_choices()
     appointments = (
         Appointment.objects.filter(patient=patient)
         .select_related('doctor__user', 'department')
@@ -249,6 +262,7 @@ def visit_detail(request, visit_id):
         "patient": patient,
         "triage": triage,
         "medical_record": medical_record,
+        "record_conflict": stale,
         "billing_items": billing_items,
         "tariffs": tariffs,
         "pharmacy_stock": pharmacy_stock,
@@ -261,6 +275,7 @@ def visit_detail(request, visit_id):
         "peer_doctors": peer_doctors,
         "hmis_classifications": hmis_classifications,
         "idsr_choices": idsr_choices,
+        "reference_versions": reference_data.versions(),
         "appointments": appointments,
         "certificates": certificates,
         "transfer_history": transfer_history,
@@ -268,6 +283,48 @@ def visit_detail(request, visit_id):
     return render(request, "doctor/visit_detail.html", context)
 
 
+@login_required
+@require_http_methods(["PATCH", "POST"])
+def autosave_medical_record(request, visit_id):
+    """Persist only the changed medical record fields.
+
+    Expects ``{"version": <int>, "fields": {<field>: <value>}}`` and answers 409
+    with the current values when the record moved on since ``version``.
+    """
+    visit = get_object_or_404(Visit, id=visit_id)
+    clinic_user = _require_doctor_user(request)
+    _ensure_visit_access(visit, clinic_user, request)
+
+    try:
+        payload = json.loads(request.body or b"{}")
+        version = int(payload["version"])
+        fields = payload.get("fields") or {}
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"success": False, "error": "Invalid autosave payload"}, status=400)
+
+    if not isinstance(fields, dict):
+        return JsonResponse({"success": False, "error": "Invalid autosave payload"}, status=400)
+    unknown = sorted(set(fields) - set(MedicalRecord.EDITABLE_FIELDS))
+    if unknown:
+        return JsonResponse({"success": False, "error": f"Unknown fields: {', '.join(unknown)}"}, status=400)
+    if any(value is not None and not isinstance(value, str) for value in fields.values()):
+        return JsonResponse({"success": False, "error": "Field values must be strings"}, status=400)
+
+    with transaction.atomic():
+        MedicalRecord.objects.get_or_create(visit=visit)
+        medical_record = MedicalRecord.objects.select_for_update().get(visit=visit)
+        if medical_record.version != version:
+            return JsonResponse({
+                "success": False,
+                "error": "conflict",
+                "version": medical_record.version,
+                "fields": {field: getattr(medical_record, field) for field in fields},
+            }, status=409)
+        changed = medical_record.apply_changes(fields)
+
+    return JsonResponse({"success": True, "version": medical_record.version, "saved": changed})
+
+
 @login_required
 @require_http_methods(["POST"])
 def add_act(request, visit_id):
@@ -385,6 +442,7 @@ def save_prescription(request, visit_id):
                 patient=patient,
                 doctor=clinic_user,
                 prescription_type='written',
+                dispense_status=Prescription.STATUS_EXTERNAL,
                 instructions=instructions,
             )
             messages.success(request, 'Written prescription saved successfully!')
@@ -405,6 +463,9 @@ def save_prescription(request, visit_id):
                         messages.error(request, 'No medicines in cart')
                         return _redirect_after_doctor_action(request, visit_id)
                     
+                    stock_ids = [medicine_data.get('id') for medicine_data in medicines_data]
+                    stocks = PharmacyStock.objects.select_related('item').in_bulk(stock_ids)
+
                     with transaction.atomic():
                         # Create one prescription for all medicines
                         prescription = Prescription.objects.create(
@@ -416,28 +477,18 @@ def save_prescription(request, visit_id):
                         )
                         
                         # Add each medicine as a prescription item
+                        items = []
                         for medicine_data in medicines_data:
-                            stock_id = medicine_data.get('id')
+                            stock = stocks.get(int(medicine_data.get('id')))
+                            if stock is None:
+                                raise PharmacyStock.DoesNotExist('Selected medicine is no longer available in stock')
                             quantity = int(medicine_data.get('quantity', 1))
                             dosage = medicine_data.get('dosage', '').strip()
                             frequency = medicine_data.get('frequency', '').strip()
                             duration = medicine_data.get('duration', '').strip()
                             instructions = medicine_data.get('instructions', '').strip()
                             
-                            stock = (
-                                PharmacyStock.objects.select_for_update()
-                                .select_related('item')
-                                .get(id=stock_id)
-                            )
-                            
-                            if stock.qty_available < quantity:
-                                messages.error(
-                                    request,
-                                    f"Not enough stock for {stock.item.name}. Available: {stock.qty_available}",
-                                )
-                                raise ValueError("Insufficient stock")
-                            
-                            PrescriptionItem.objects.create(
+                            items.append(PrescriptionItem(
                                 prescription=prescription,
                                 inventory_item=stock.item,
                                 custom_name=stock.item.name,
@@ -447,15 +498,16 @@ def save_prescription(request, visit_id):
                                 duration=duration,
                                 instructions=instructions,
                                 dosage_instructions=f"{dosage} {frequency} {duration}".strip(),
-                            )
-                            
-                            stock.qty_available -= quantity
-                            stock.save(update_fields=['qty_available'])
+                            ))
+                        
+                        PrescriptionItem.objects.bulk_create(items)
+                        # Hold the stock until the pharmacy dispenses it
+                        reserve_prescription(prescription, items=items)
                         
                         messages.success(request, f'Prescription with {len(medicines_data)} medicine(s) recorded successfully!')
                         return _redirect_after_doctor_action(request, visit_id)
                         
-                except (json.JSONDecodeError, ValueError, PharmacyStock.DoesNotExist) as e:
+                except (json.JSONDecodeError, ValueError, TypeError, PharmacyStock.DoesNotExist, InsufficientStock) as e:
                     messages.error(request, f'Error processing prescription: {str(e)}')
                     return _redirect_after_doctor_action(request, visit_id)
             
@@ -475,18 +527,7 @@ def save_prescription(request, visit_id):
 
             try:
                 with transaction.atomic():
-                    stock = (
-                        PharmacyStock.objects.select_for_update()
-                        .select_related('item')
-                        .get(id=stock_id)
-                    )
-
-                    if stock.qty_available < quantity:
-                        messages.error(
-                            request,
-                            f"Not enough stock for {stock.item.name}. Available: {stock.qty_available}",
-                        )
-                        return _redirect_after_doctor_action(request, visit_id)
+                    stock = PharmacyStock.objects.select_related('item').get(id=stock_id)
 
                     prescription = Prescription.objects.create(
                         visit=visit,
@@ -496,7 +537,7 @@ def save_prescription(request, visit_id):
                         instructions=instructions or dosage,
                     )
 
-                    PrescriptionItem.objects.create(
+                    item = PrescriptionItem.objects.create(
                         prescription=prescription,
                         inventory_item=stock.item,
                         custom_name=stock.item.name,
@@ -508,14 +549,16 @@ def save_prescription(request, visit_id):
                         dosage_instructions=f"{dosage} {frequency} {duration}".strip(),
                     )
 
-                    stock.qty_available -= quantity
-                    stock.save(update_fields=['qty_available'])
+                    reserve_prescription(prescription, items=[item])
 
                 messages.success(request, 'Clinic store prescription recorded successfully!')
                 return _redirect_after_doctor_action(request, visit_id)
             except PharmacyStock.DoesNotExist:
                 messages.error(request, 'Selected medicine is no longer available in stock')
                 return _redirect_after_doctor_action(request, visit_id)
+            except InsufficientStock as e:
+                messages.error(request, str(e))
+                return _redirect_after_doctor_action(request, visit_id)
 
         messages.error(request, 'Please select a prescription type to continue')
         return _redirect_after_doctor_action(request, visit_id)
@@ -6,12 +6,19 @@ from django.contrib.auth import update_session_auth_hash
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
 from django.utils.timezone import localtime
+from django.db import transaction
 from django.db.models import Q, Count
 from datetime import datetime, timedelta
 from decimal import Decimal
 from collections import defaultdict
 from .models import *
 from .models_medical_records import *
+from .utils import reference_data
+from .utils.attachments import file_sha256, ranged_file_response
+from .utils.certificates import ensure_certificate_pdf
+from .utils.clinical_search import search_medical_records
+from .utils.dashboard_cache import get_dashboard_snapshot, get_dashboard_version
+from .utils.images import is_image
 import pandas as pd
 def load_tariff_from_csv(insurance=None):
     """Load tariff acts and prices for all insurances from CSV."""
@@ -56,10 +63,6 @@ def load_tariff_from_csv(insurance=None):
                 tariff['selected_price'] = price_private
             tariffs.append(tariff)
     return tariffs
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-import io
 
 COMPLETED_STATUSES = ['completed', 'awaiting_payment']
 
@@ -76,164 +79,86 @@ def _redirect_after_workspace_action(request, visit_id, default='doctor_dashboar
     return redirect(default)
 
 
-@login_required(login_url='/doctor/login/')
-def doctor_dashboard_enhanced(request):
-    """Enhanced doctor dashboard showing only their patients"""
-    # Check if user has doctor role
-    if not request.user.is_authenticated:
-        messages.error(request, 'Please login to access the doctor dashboard.')
-        return redirect('doctor-login')
-    
-    if not hasattr(request.user, 'clinicuser'):
-        messages.error(request, 'Your account is not associated with a clinic user.')
-        return redirect('doctor-login')
-    
-    clinic_user = request.user.clinicuser
-    
-    if clinic_user.role != 'doctor':
-        messages.error(request, 'Access denied. Doctor role required.')
-        return redirect('doctor-login')
-    
-    current_moment = timezone.now()
-    today = current_moment.date()
+MEDICAL_SECTIONS = [
+    {'name': 'chief_complaint', 'label': 'Chief complain', 'rows': 3},
+    {'name': 'history_presenting_illness', 'label': 'History of presenting illness', 'rows': 4},
+    {'name': 'past_medical_history', 'label': 'Past medical history', 'rows': 3},
+    {'name': 'past_dental_history', 'label': 'Past dental history', 'rows': 3},
+    {'name': 'current_medications', 'label': 'Current medications', 'rows': 3},
+    {'name': 'allergies', 'label': 'Allergies', 'rows': 2},
+    {'name': 'social_history', 'label': 'Social history', 'rows': 3},
+    {'name': 'family_history', 'label': 'Family history', 'rows': 3},
+    {'name': 'review_of_systems', 'label': 'Review of system', 'rows': 4},
+    {'name': 'general_examination', 'label': 'General medical & dental examination', 'rows': 4},
+    {'name': 'oral_examination', 'label': 'Dental specialty examination', 'rows': 4},
+    {'name': 'specialty_examination', 'label': 'Medical specialty examination', 'rows': 4},
+    {'name': 'investigations', 'label': 'Investigations (lab & radiographs)', 'rows': 4},
+    {'name': 'diagnosis', 'label': 'Diagnosis', 'rows': 3},
+    {'name': 'treatment_plan', 'label': 'Treatment plan', 'rows': 4},
+]
+
+
+def _build_dashboard_snapshot(clinic_user, today):
+    """Compute the cacheable part of the doctor dashboard (counts, charts, calendar, lists)."""
     week_ago = today - timedelta(days=7)
-    
-    # Get doctor's patients (from visits)
-    my_visits_today = Visit.objects.filter(
-        doctor=clinic_user,
-        created_at__date=today
-    ).select_related('patient', 'department').order_by('-created_at')
-    
-    # Get all active visits for this doctor (base query without slice for statistics)
-    # Include 'open' status which is set when reception creates a visit
-    active_visits_query = (
+
+    my_visits_today = list(
         Visit.objects.filter(
             doctor=clinic_user,
-            status__in=['open', 'waiting', 'in_consultation']
-        )
-        .select_related('patient', 'department', 'triage', 'medical_record')
-        .prefetch_related(
-            'billing_items__tariff',
-            'prescriptions__doctor',
-            'prescriptions__items__inventory_item',
-            'certificates',
-            'medical_record__attachments'
-        )
-        .order_by('-created_at')
+            created_at__date=today
+        ).select_related('patient', 'department').order_by('-created_at')
     )
-    
-    # Statistics (calculated before slicing)
-    total_patients_today = my_visits_today.count()
-    completed_today = my_visits_today.filter(status__in=COMPLETED_STATUSES).count()
-    
+    total_patients_today = len(my_visits_today)
+    completed_today = sum(1 for visit in my_visits_today if visit.status in COMPLETED_STATUSES)
+
     # Waiting count includes 'open' (newly assigned) and 'waiting' status
-    waiting_count = active_visits_query.filter(status__in=['open', 'waiting']).count()
-    in_consultation_count = active_visits_query.filter(status='in_consultation').count()
-    
+    active_counts = Visit.objects.filter(
+        doctor=clinic_user,
+        status__in=['open', 'waiting', 'in_consultation']
+    ).aggregate(
+        waiting=Count('id', filter=Q(status__in=['open', 'waiting'])),
+        in_consultation=Count('id', filter=Q(status='in_consultation')),
+    )
+    waiting_count = active_counts['waiting']
+    in_consultation_count = active_counts['in_consultation']
+
     # Weekly statistics
     weekly_visits_queryset = list(
         Visit.objects.filter(
             doctor=clinic_user,
             created_at__date__gte=week_ago
-        ).select_related('patient')
+        ).only('id', 'patient_id', 'status', 'created_at')
     )
     total_weekly = len(weekly_visits_queryset)
     weekly_completed = sum(1 for visit in weekly_visits_queryset if visit.status in COMPLETED_STATUSES)
-    
-    # Revenue statistics - sum of private and insurance amounts from paid invoices
-    total_revenue_today = 0
-    try:
-        from django.db.models import Sum
-        invoices_today = Invoice.objects.filter(
-            visit__doctor=clinic_user,
-            created_at__date=today,
-            paid=True
-        )
-        # Calculate total from private and insurance amounts
-        for invoice in invoices_today:
-            total_revenue_today += (invoice.total_private or 0) + (invoice.total_insurance or 0)
-    except Exception as e:
-        print(f"Revenue calculation error: {e}")
-        pass
-    
-    # Now slice for display
-    active_visits = list(active_visits_query[:20])
 
-    patient_ids = [visit.patient_id for visit in active_visits]
-    appointments_map = defaultdict(list)
-
-    if patient_ids:
-        patient_appointments = (
-            Appointment.objects.filter(patient_id__in=patient_ids)
-            .select_related('doctor__user', 'department')
-            .order_by('-scheduled_at')
-        )
-        for appt in patient_appointments:
-            appointments_map[appt.patient_id].append(appt)
+    # Revenue statistics - paid invoice totals from the daily KPI rollup
+    total_revenue_today = DoctorDailyStats.summarize(clinic_user, today, today)['revenue']
 
-    for visit in active_visits:
-        try:
-            record = visit.medical_record
-        except MedicalRecord.DoesNotExist:
-            record = None
-        if not record:
-            record = MedicalRecord(visit=visit)
-        setattr(visit, 'cached_medical_record', record)
-
-        try:
-            triage = visit.triage
-        except Triage.DoesNotExist:
-            triage = None
-        if not triage:
-            triage = Triage(visit=visit)
-        setattr(visit, 'cached_triage', triage)
-
-        setattr(visit, 'cached_appointments', appointments_map.get(visit.patient_id, []))
-
-        billing_items = list(visit.billing_items.all())
-        setattr(visit, 'cached_billing_items', billing_items)
-
-        private_total = sum(((item.price_private_snapshot or Decimal('0')) * item.qty) for item in billing_items)
-        insurance_total = sum(
-            ((item.price_insurance_snapshot or item.price_private_snapshot or Decimal('0')) * item.qty)
-            for item in billing_items
-        )
-        setattr(visit, 'billing_snapshot', {
-            'private_total': private_total,
-            'insurance_total': insurance_total,
-            'grand_total': private_total + insurance_total,
-        })
-    
     # Get patients with pending medical records
-    pending_records = Visit.objects.filter(
-        doctor=clinic_user,
-        status='in_consultation'
-    ).exclude(
-        id__in=MedicalRecord.objects.values_list('visit_id', flat=True)
-    ).select_related('patient')[:10]
-    
+    pending_records = list(
+        Visit.objects.filter(
+            doctor=clinic_user,
+            status='in_consultation'
+        ).exclude(
+            id__in=MedicalRecord.objects.values_list('visit_id', flat=True)
+        ).select_related('patient')[:10]
+    )
+
     # Recent appointments
     my_appointments = list(
         Appointment.objects.filter(
             doctor=clinic_user,
             scheduled_at__gte=today
-        ).select_related('patient', 'doctor__user', 'department').order_by('scheduled_at')[:10]
+        ).select_related('patient', 'doctor__user', 'doctor__department', 'department').order_by('scheduled_at')[:10]
     )
-    
-    # Recent medical records
-    recent_records = MedicalRecord.objects.filter(
-        visit__doctor=clinic_user
-    ).select_related('visit', 'visit__patient').order_by('-created_at')[:5]
-    
-    # Shared reference data for forms
-    # Do not set tariff_acts from DB here. Only set in billing_sheet view from CSV loader.
-    pharmacy_stock = PharmacyStock.objects.select_related('item').filter(qty_available__gt=0).order_by('item__name')[:120]
-    departments = Department.objects.all().order_by('name')
-    peer_doctors = ClinicUser.objects.filter(role='doctor').exclude(id=clinic_user.id).select_related('user', 'department').order_by('user__first_name', 'user__last_name')
-    hmis_classifications = HMISClassification.objects.all()
-    idsr_choices = MedicalRecord._meta.get_field('idsr_disease').choices
 
-    next_appointment = my_appointments[0] if my_appointments else None
+    # Recent medical records
+    recent_records = list(
+        MedicalRecord.objects.filter(
+            visit__doctor=clinic_user
+        ).select_related('visit', 'visit__patient').order_by('-created_at')[:5]
+    )
 
     hourly_total = defaultdict(int)
     hourly_completed = defaultdict(int)
@@ -302,26 +227,6 @@ def doctor_dashboard_enhanced(request):
             'gradient': gradient,
         })
 
-    progress_lookup = {
-        'completed': 100,
-        'awaiting_payment': 100,
-        'in_consultation': 72,
-        'waiting': 38,
-        'open': 24,
-    }
-    patient_progress_list = []
-    for visit in active_visits[:7]:
-        patient = visit.patient
-        full_name = f"{patient.first_name or ''} {patient.last_name or ''}".strip()
-        if not full_name:
-            full_name = f"Visit #{visit.id}"
-        status_label = visit.get_status_display() if hasattr(visit, 'get_status_display') else visit.status.replace('_', ' ').title()
-        patient_progress_list.append({
-            'name': full_name,
-            'status': status_label,
-            'progress': progress_lookup.get(visit.status, 50),
-        })
-
     appointment_dates = {appt.scheduled_at.date(): appt for appt in my_appointments}
 
     focus_week_start = today - timedelta(days=today.weekday())
@@ -361,35 +266,8 @@ def doctor_dashboard_enhanced(request):
         'weekdays': ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'],
     }
 
-    medical_sections = [
-        {'name': 'chief_complaint', 'label': 'Chief complain', 'rows': 3},
-        {'name': 'history_presenting_illness', 'label': 'History of presenting illness', 'rows': 4},
-        {'name': 'past_medical_history', 'label': 'Past medical history', 'rows': 3},
-        {'name': 'past_dental_history', 'label': 'Past dental history', 'rows': 3},
-        {'name': 'current_medications', 'label': 'Current medications', 'rows': 3},
-        {'name': 'allergies', 'label': 'Allergies', 'rows': 2},
-        {'name': 'social_history', 'label': 'Social history', 'rows': 3},
-        {'name': 'family_history', 'label': 'Family history', 'rows': 3},
-        {'name': 'review_of_systems', 'label': 'Review of system', 'rows': 4},
-        {'name': 'general_examination', 'label': 'General medical & dental examination', 'rows': 4},
-        {'name': 'oral_examination', 'label': 'Dental specialty examination', 'rows': 4},
-        {'name': 'specialty_examination', 'label': 'Medical specialty examination', 'rows': 4},
-        {'name': 'investigations', 'label': 'Investigations (lab & radiographs)', 'rows': 4},
-        {'name': 'diagnosis', 'label': 'Diagnosis', 'rows': 3},
-        {'name': 'treatment_plan', 'label': 'Treatment plan', 'rows': 4},
-    ]
-
-    # Get doctor's display name
-    doctor_name = clinic_user.user.get_full_name() or clinic_user.user.username
-    
-    context = {
-        'clinic_user': clinic_user,
-        'doctor_name': doctor_name,
-        'doctor_department': clinic_user.department,
-        'today': today,
-        'current_moment': current_moment,
+    return {
         'my_visits_today': my_visits_today,
-        'active_visits': active_visits,
         'pending_records': pending_records,
         'total_patients_today': total_patients_today,
         'completed_today': completed_today,
@@ -400,23 +278,156 @@ def doctor_dashboard_enhanced(request):
         'weekly_completed': weekly_completed,
         'total_revenue_today': total_revenue_today,
         'recent_records': recent_records,
-        'pharmacy_stock': pharmacy_stock,
-        'departments': departments,
-        'peer_doctors': peer_doctors,
-        'hmis_classifications': hmis_classifications,
-        'idsr_choices': idsr_choices,
-        'medical_sections': medical_sections,
         'health_curve': health_curve,
         'appointments_trend': appointments_trend,
         'new_patients_trend': new_patients_trend,
         'new_patients_week_total': new_patients_week_total,
         'patient_overview': patient_overview,
-        'patient_progress_list': patient_progress_list,
         'hospital_management': hospital_management,
         'calendar_weeks': calendar_weeks,
         'calendar_meta': calendar_meta,
         'calendar_focus_week': calendar_focus_week,
-        'next_appointment': next_appointment,
+        'next_appointment': my_appointments[0] if my_appointments else None,
+    }
+
+
+@login_required(login_url='/doctor/login/')
+def doctor_dashboard_enhanced(request):
+    """Enhanced doctor dashboard showing only their patients"""
+    # Check if user has doctor role
+    if not request.user.is_authenticated:
+        messages.error(request, 'Please login to access the doctor dashboard.')
+        return redirect('doctor-login')
+    
+    if not hasattr(request.user, 'clinicuser'):
+        messages.error(request, 'Your account is not associated with a clinic user.')
+        return redirect('doctor-login')
+    
+    clinic_user = request.user.clinicuser
+    
+    if clinic_user.role != 'doctor':
+        messages.error(request, 'Access denied. Doctor role required.')
+        return redirect('doctor-login')
+    
+    current_moment = timezone.now()
+    today = timezone.localdate(current_moment)
+
+    # Counts, charts and calendar are served from a per-doctor snapshot that
+    # signals invalidate whenever the underlying visits/invoices change.
+    snapshot = get_dashboard_snapshot(
+        clinic_user.id, today, lambda: _build_dashboard_snapshot(clinic_user, today)
+    )
+    
+    # Get all active visits for this doctor
+    # Include 'open' status which is set when reception creates a visit
+    active_visits = list(
+        Visit.objects.filter(
+            doctor=clinic_user,
+            status__in=['open', 'waiting', 'in_consultation']
+        )
+        .select_related('patient', 'department', 'triage', 'medical_record')
+        .prefetch_related(
+            'billing_items__tariff',
+            'prescriptions__doctor',
+            'prescriptions__items__inventory_item',
+            'certificates',
+            'medical_record__attachments'
+        )
+        .order_by('-created_at')[:20]
+    )
+
+    patient_ids = [visit.patient_id for visit in active_visits]
+    appointments_map = defaultdict(list)
+
+    if patient_ids:
+        patient_appointments = (
+            Appointment.objects.filter(patient_id__in=patient_ids)
+            .select_related('doctor__user', 'department')
+            .order_by('-scheduled_at')
+        )
+        for appt in patient_appointments:
+            appointments_map[appt.patient_id].append(appt)
+
+    for visit in active_visits:
+        try:
+            record = visit.medical_record
+        except MedicalRecord.DoesNotExist:
+            record = None
+        if not record:
+            record = MedicalRecord(visit=visit)
+        setattr(visit, 'cached_medical_record', record)
+
+        try:
+            triage = visit.triage
+        except Triage.DoesNotExist:
+            triage = None
+        if not triage:
+            triage = Triage(visit=visit)
+        setattr(visit, 'cached_triage', triage)
+
+        setattr(visit, 'cached_appointments', appointments_map.get(visit.patient_id, []))
+
+        billing_items = list(visit.billing_items.all())
+        setattr(visit, 'cached_billing_items', billing_items)
+
+        private_total = sum(((item.price_private_snapshot or Decimal('0')) * item.qty) for item in billing_items)
+        insurance_total = sum(
+            ((item.price_insurance_snapshot or item.price_private_snapshot or Decimal('0')) * item.qty)
+            for item in billing_items
+        )
+        setattr(visit, 'billing_snapshot', {
+            'private_total': private_total,
+            'insurance_total': insurance_total,
+            'grand_total': private_total + insurance_total,
+        })
+    
+    # Shared reference data for forms
+    # Do not set tariff_acts from DB here. Only set in billing_sheet view from CSV loader.
+    pharmacy_stock = reference_data.pharmacy_stock(limit=120)
+    departments = reference_data.departments()
+    peer_doctors = reference_data.peer_doctors(clinic_user)
+    hmis_classifications = reference_data.hmis_classifications()
+    idsr_choices = reference_data.idsr_choices()
+
+    progress_lookup = {
+        'completed': 100,
+        'awaiting_payment': 100,
+        'in_consultation': 72,
+        'waiting': 38,
+        'open': 24,
+    }
+    patient_progress_list = []
+    for visit in active_visits[:7]:
+        patient = visit.patient
+        full_name = f"{patient.first_name or ''} {patient.last_name or ''}".strip()
+        if not full_name:
+            full_name = f"Visit #{visit.id}"
+        status_label = visit.get_status_display() if hasattr(visit, 'get_status_display') else visit.status.replace('_', ' ').title()
+        patient_progress_list.append({
+            'name': full_name,
+            'status': status_label,
+            'progress': progress_lookup.get(visit.status, 50),
+        })
+
+    # Get doctor's display name
+    doctor_name = clinic_user.user.get_full_name() or clinic_user.user.username
+    
+    context = {
+        **snapshot,
+        'clinic_user': clinic_user,
+        'doctor_name': doctor_name,
+        'doctor_department': clinic_user.department,
+        'today': today,
+        'current_moment': current_moment,
+        'active_visits': active_visits,
+        'pharmacy_stock': pharmacy_stock,
+        'departments': departments,
+        'peer_doctors': peer_doctors,
+        'hmis_classifications': hmis_classifications,
+        'idsr_choices': idsr_choices,
+        'medical_sections': MEDICAL_SECTIONS,
+        'patient_progress_list': patient_progress_list,
+        'dashboard_version': get_dashboard_version(clinic_user.id),
     }
     
     return render(request, 'doctor/dashboard_enhanced_clean.html', context)
@@ -448,75 +459,75 @@ def medical_record_form(request, visit_id):
     # Get HMIS classifications
     hmis_classifications = HMISClassification.objects.all()
     
+    # A save from a form opened before the latest autosave is refused
+    stale = False
     if request.method == 'POST':
-        # Create or update triage
-        if not triage:
-            triage = Triage(visit=visit, recorded_by=clinic_user)
-        
-        # Update triage fields
-        temp = request.POST.get('temperature_c')
-        pulse = request.POST.get('pulse')
-        bp = request.POST.get('blood_pressure')
-        symptoms = request.POST.get('symptoms')
+        with transaction.atomic():
+            MedicalRecord.objects.get_or_create(visit=visit)
+            medical_record = MedicalRecord.objects.select_for_update().get(visit=visit)
+            try:
+                stale = int(request.POST.get('record_version', '')) != medical_record.version
+            except ValueError:
+                stale = True
+            if not stale:
+                # Create or update triage
+                if not triage:
+                    triage = Triage(visit=visit, recorded_by=clinic_user)
+                
+                # Update triage fields
+                temp = request.POST.get('temperature_c')
+                pulse = request.POST.get('pulse')
+                bp = request.POST.get('blood_pressure')
+                symptoms = request.POST.get('symptoms')
+                
+                if temp:
+                    triage.temperature_c = float(temp)
+                if pulse:
+                    triage.pulse = int(pulse)
+                if bp:
+                    triage.blood_pressure = bp
+                if symptoms:
+                    triage.symptoms = symptoms
+                
+                triage.save()
+                
+                # Write only the fields that changed
+                medical_record.apply_changes({
+                    field: request.POST.get(field, '') for field in MedicalRecord.EDITABLE_FIELDS
+                })
+                
+                # Handle file uploads
+                if 'attachments' in request.FILES:
+                    file_type = request.POST.get('file_type', '')
+                    for file in request.FILES.getlist('attachments'):
+                        attachment = MedicalRecordAttachment(
+                            medical_record=medical_record,
+                            file=file,
+                            file_type=file_type if file_type in dict(ATTACHMENT_FILE_TYPES) else (
+                                'photo' if is_image(file.name) else 'document'
+                            ),
+                            description=request.POST.get('file_description', ''),
+                            uploaded_by=clinic_user,
+                            size=file.size,
+                            checksum=file_sha256(file),
+                        )
+                        file.seek(0)
+                        attachment.save()
         
-        if temp:
-            triage.temperature_c = float(temp)
-        if pulse:
-            triage.pulse = int(pulse)
-        if bp:
-            triage.blood_pressure = bp
-        if symptoms:
-            triage.symptoms = symptoms
-        
-        triage.save()
-        
-        # Create or update medical record
-        if not medical_record:
-            medical_record = MedicalRecord(visit=visit)
-        
-        # Update all fields
-        medical_record.chief_complaint = request.POST.get('chief_complaint', '')
-        medical_record.history_presenting_illness = request.POST.get('history_presenting_illness', '')
-        medical_record.past_medical_history = request.POST.get('past_medical_history', '')
-        medical_record.past_dental_history = request.POST.get('past_dental_history', '')
-        medical_record.current_medications = request.POST.get('current_medications', '')
-        medical_record.allergies = request.POST.get('allergies', '')
-        medical_record.social_history = request.POST.get('social_history', '')
-        medical_record.family_history = request.POST.get('family_history', '')
-        medical_record.review_of_systems = request.POST.get('review_of_systems', '')
-        medical_record.general_examination = request.POST.get('general_examination', '')
-        medical_record.oral_examination = request.POST.get('oral_examination', '')
-        medical_record.specialty_examination = request.POST.get('specialty_examination', '')
-        medical_record.investigations = request.POST.get('investigations', '')
-        medical_record.diagnosis = request.POST.get('diagnosis', '')
-        medical_record.treatment_plan = request.POST.get('treatment_plan', '')
-        medical_record.hmis_classification = request.POST.get('hmis_classification', '')
-        medical_record.idsr_disease = request.POST.get('idsr_disease', '')
-        
-        medical_record.save()
-        
-        # Handle file uploads
-        if 'attachments' in request.FILES:
-            for file in request.FILES.getlist('attachments'):
-                attachment = MedicalRecordAttachment(
-                    medical_record=medical_record,
-                    file=file,
-                    file_type=request.POST.get('file_type', 'document'),
-                    description=request.POST.get('file_description', ''),
-                    uploaded_by=clinic_user
-                )
-                attachment.save()
-        
-        messages.success(request, 'Medical record and triage saved successfully!')
-        return redirect('doctor_dashboard_enhanced')
+        if not stale:
+            messages.success(request, 'Medical record and triage saved successfully!')
+            return redirect('doctor_dashboard_enhanced')
     
     context = {
         'clinic_user': clinic_user,
         'visit': visit,
         'medical_record': medical_record,
+        'record_conflict': stale,
         'triage': triage,
+        'attachments': medical_record.attachments.all() if medical_record else [],
         'hmis_classifications': hmis_classifications,
         'idsr_diseases': MedicalRecord._meta.get_field('idsr_disease').choices,
+        'attachment_file_types': ATTACHMENT_FILE_TYPES,
     }
     
     return render(request, 'doctor/medical_record_form.html', context)
@@ -676,8 +687,8 @@ def generate_medical_certificate(request, visit_id):
             valid_until=valid_until
         )
         
-        # Generate PDF
-        return generate_certificate_pdf(certificate)
+        # Render once on issue and serve the stored PDF
+        return generate_certificate_pdf(request, certificate)
     
     # GET - show form
     context = {
@@ -688,230 +699,42 @@ def generate_medical_certificate(request, visit_id):
     return render(request, 'doctor/medical_certificate_form.html', context)
 
 
-def generate_certificate_pdf(certificate):
-    """Generate PDF for medical certificate"""
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Add decorative border
-    p.setStrokeColorRGB(0.48, 0.23, 0.93)  # Purple color
-    p.setLineWidth(3)
-    p.rect(0.5*inch, 0.5*inch, width - 1*inch, height - 1*inch, stroke=1, fill=0)
-    
-    # Inner border
-    p.setStrokeColorRGB(0.48, 0.23, 0.93)
-    p.setLineWidth(1)
-    p.rect(0.6*inch, 0.6*inch, width - 1.2*inch, height - 1.2*inch, stroke=1, fill=0)
-    
-    # Try to add logo (if exists)
-    try:
-        from pathlib import Path
-        logo_path = Path(__file__).resolve().parent.parent / 'static' / 'images' / 'logo.png'
-        if logo_path.exists():
-            p.drawImage(str(logo_path), 1*inch, height - 1.5*inch, width=1*inch, height=1*inch, preserveAspectRatio=True, mask='auto')
-    except:
-        pass
-    
-    # Header with clinic name
-    p.setFillColorRGB(0.48, 0.23, 0.93)  # Purple color
-    p.setFont("Helvetica-Bold", 24)
-    p.drawCentredString(width/2, height - 1*inch, "NORA DENTAL CLINIC")
-    
-    # Tagline
-    p.setFillColorRGB(0.4, 0.4, 0.4)
-    p.setFont("Helvetica-Oblique", 11)
-    p.drawCentredString(width/2, height - 1.3*inch, "Excellence in Dental Care")
-    
-    # Address and contact info
-    p.setFillColorRGB(0, 0, 0)
-    p.setFont("Helvetica", 10)
-    p.drawCentredString(width/2, height - 1.6*inch, "KG 123 Street, Kigali, Rwanda")
-    p.drawCentredString(width/2, height - 1.8*inch, "Tel: +250 788 123 456 | Email: info@noradental.rw | www.noradental.rw")
-    
-    # Horizontal line
-    p.setStrokeColorRGB(0.48, 0.23, 0.93)
-    p.setLineWidth(2)
-    p.line(1*inch, height - 2*inch, width - 1*inch, height - 2*inch)
-    
-    # Certificate Title with background
-    p.setFillColorRGB(0.48, 0.23, 0.93)
-    p.rect(1.5*inch, height - 2.5*inch, width - 3*inch, 0.4*inch, stroke=0, fill=1)
-    
-    p.setFillColorRGB(1, 1, 1)  # White text
-    p.setFont("Helvetica-Bold", 16)
-    cert_title = certificate.get_certificate_type_display().upper()
-    p.drawCentredString(width/2, height - 2.4*inch, cert_title)
-    
-    # Certificate Number
-    p.setFillColorRGB(0.4, 0.4, 0.4)
-    p.setFont("Helvetica", 9)
-    p.drawCentredString(width/2, height - 2.7*inch, f"Certificate No: CERT-{certificate.id:06d}")
-    
-    # Date
-    p.setFillColorRGB(0, 0, 0)
-    p.setFont("Helvetica", 11)
-    p.drawString(1*inch, height - 3.1*inch, f"Issue Date: {certificate.issue_date.strftime('%d %B %Y')}")
-    
-    # Patient details section
-    y = height - 3.6*inch
-    p.setFillColorRGB(0.48, 0.23, 0.93)
-    p.setFont("Helvetica-Bold", 13)
-    p.drawString(1*inch, y, "PATIENT INFORMATION")
-    
-    # Underline
-    p.setStrokeColorRGB(0.48, 0.23, 0.93)
-    p.setLineWidth(1)
-    p.line(1*inch, y - 0.05*inch, 3*inch, y - 0.05*inch)
-    
-    p.setFillColorRGB(0, 0, 0)
-    p.setFont("Helvetica", 11)
-    y -= 0.35*inch
-    p.drawString(1*inch, y, f"Full Name:")
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2.2*inch, y, f"{certificate.patient.first_name} {certificate.patient.last_name}")
-    
-    p.setFont("Helvetica", 11)
-    y -= 0.25*inch
-    p.drawString(1*inch, y, f"Age:")
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2.2*inch, y, f"{certificate.patient.age} years")
-    
-    p.setFont("Helvetica", 11)
-    y -= 0.25*inch
-    p.drawString(1*inch, y, f"Gender:")
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2.2*inch, y, f"{certificate.patient.gender or 'N/A'}")
-    
-    p.setFont("Helvetica", 11)
-    y -= 0.25*inch
-    p.drawString(1*inch, y, f"ID/Passport:")
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2.2*inch, y, f"{certificate.patient.national_id or 'N/A'}")
-    
-    # Medical information section
-    y -= 0.5*inch
-    p.setFillColorRGB(0.48, 0.23, 0.93)
-    p.setFont("Helvetica-Bold", 13)
-    p.drawString(1*inch, y, "MEDICAL INFORMATION")
-    
-    # Underline
-    p.setStrokeColorRGB(0.48, 0.23, 0.93)
-    p.setLineWidth(1)
-    p.line(1*inch, y - 0.05*inch, 3.2*inch, y - 0.05*inch)
-    
-    p.setFillColorRGB(0, 0, 0)
-    p.setFont("Helvetica-Bold", 11)
-    y -= 0.35*inch
-    p.drawString(1*inch, y, "Diagnosis:")
-    
-    p.setFont("Helvetica", 11)
-    y -= 0.25*inch
-    # Word wrap diagnosis
-    lines = []
-    current_line = ""
-    for word in certificate.diagnosis.split():
-        if len(current_line + word) < 75:
-            current_line += word + " "
-        else:
-            lines.append(current_line)
-            current_line = word + " "
-    if current_line:
-        lines.append(current_line)
-    
-    for line in lines:
-        p.drawString(1.2*inch, y, line.strip())
-        y -= 0.2*inch
-    
-    if certificate.recommendations:
-        y -= 0.1*inch
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(1*inch, y, "Recommendations:")
-        
-        p.setFont("Helvetica", 11)
-        y -= 0.25*inch
-        # Word wrap recommendations
-        lines = certificate.recommendations.split('\n')
-        for line in lines:
-            if len(line) > 75:
-                words = line.split()
-                current_line = ""
-                for word in words:
-                    if len(current_line + word) < 75:
-                        current_line += word + " "
-                    else:
-                        p.drawString(1.2*inch, y, current_line.strip())
-                        y -= 0.2*inch
-                        current_line = word + " "
-                if current_line:
-                    p.drawString(1.2*inch, y, current_line.strip())
-                    y -= 0.2*inch
-            else:
-                p.drawString(1.2*inch, y, line)
-                y -= 0.2*inch
-    
-    if certificate.duration_days:
-        y -= 0.1*inch
-        p.setFont("Helvetica-Bold", 11)
-        p.drawString(1*inch, y, f"Duration of Leave: {certificate.duration_days} days")
-        y -= 0.25*inch
-        p.setFont("Helvetica", 11)
-        p.drawString(1*inch, y, f"Valid Until: {certificate.valid_until.strftime('%d %B %Y')}")
-    
-    # Doctor signature section
-    y = 2.5*inch
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(4.5*inch, y, "Authorized By:")
-    
-    y -= 0.5*inch
-    p.setStrokeColorRGB(0, 0, 0)
-    p.setLineWidth(1)
-    p.line(4.5*inch, y, 7*inch, y)
-    
-    y -= 0.25*inch
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(4.5*inch, y, f"Dr. {certificate.doctor.user.get_full_name()}")
-    
-    y -= 0.2*inch
-    p.setFont("Helvetica", 10)
-    p.drawString(4.5*inch, y, f"Medical License No: [License]")
-    
-    y -= 0.2*inch
-    p.drawString(4.5*inch, y, f"Signature & Official Stamp")
-    
-    # QR Code placeholder (optional)
-    p.setStrokeColorRGB(0.7, 0.7, 0.7)
-    p.setLineWidth(1)
-    p.rect(1*inch, 1.5*inch, 0.8*inch, 0.8*inch, stroke=1, fill=0)
-    p.setFont("Helvetica", 7)
-    p.drawString(1*inch, 1.35*inch, "QR Code")
-    
-    # Footer with verification info
-    p.setFillColorRGB(0.48, 0.23, 0.93)
-    p.setFont("Helvetica-Bold", 9)
-    p.drawCentredString(width/2, 1*inch, "CERTIFICATE VERIFICATION")
-    
-    p.setFillColorRGB(0, 0, 0)
-    p.setFont("Helvetica-Oblique", 8)
-    p.drawCentredString(width/2, 0.85*inch, "This is an official medical document issued by Nora Dental Clinic")
-    p.drawCentredString(width/2, 0.7*inch, f"Verify online at: www.noradental.rw/verify/{certificate.id}")
-    
-    p.showPage()
-    p.save()
-    
-    buffer.seek(0)
-    
-    # Update certificate as printed
-    certificate.printed = True
-    certificate.printed_at = timezone.now()
-    certificate.save()
-    
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="medical_certificate_{certificate.id}.pdf"'
+def generate_certificate_pdf(request, certificate):
+    """Serve the stored certificate PDF, rendering it only if its content changed"""
+    ensure_certificate_pdf(certificate)
     
+    response = ranged_file_response(
+        request,
+        certificate.pdf_file,
+        etag=f'"{certificate.content_hash}"',
+        last_modified=certificate.rendered_at.timestamp(),
+        filename=f"medical_certificate_{certificate.id}.pdf",
+        as_attachment=True,
+    )
+    # Only a full download counts as printing; 304 revalidations and Range
+    # chunks must not write, and printed_at keeps the first print time
+    if response.status_code == 200:
+        MedicalCertificate.objects.filter(pk=certificate.pk, printed=False).update(
+            printed=True, printed_at=timezone.now()
+        )
     return response
 
 
+@login_required(login_url='/doctor/login/')
+def certificate_pdf(request, certificate_id):
+    """Download (or reprint) an issued medical certificate"""
+    if not hasattr(request.user, 'clinicuser') or request.user.clinicuser.role != 'doctor':
+        messages.error(request, 'Access denied. Doctor role required.')
+        return redirect('doctor-login')
+    
+    certificate = get_object_or_404(
+        MedicalCertificate.objects.select_related('patient', 'doctor__user'),
+        id=certificate_id,
+        visit__doctor=request.user.clinicuser,
+    )
+    return generate_certificate_pdf(request, certificate)
+
+
 @login_required(login_url='/doctor/login/')
 def transfer_patient(request, visit_id):
     """Transfer patient to another doctor/department"""
@@ -1126,6 +949,52 @@ def in_consultation_list(request):
     return render(request, 'doctor/in_consultation.html', context)
 
 
+def _medical_record_search(request, medical_records, clinic_wide=False):
+    """Apply the search form (q, date range, HMIS code, doctor) and paginate."""
+    from django.core.paginator import Paginator
+    from django.utils.dateparse import parse_date
+
+    try:
+        date_from = parse_date(request.GET.get('date_from') or '')
+        date_to = parse_date(request.GET.get('date_to') or '')
+    except ValueError:
+        messages.error(request, 'Invalid date. Use YYYY-MM-DD.')
+        date_from = date_to = None
+
+    doctor = None
+    if clinic_wide and request.GET.get('doctor', '').isdigit():
+        doctor = ClinicUser.objects.filter(id=request.GET['doctor'], role='doctor').first()
+
+    query = request.GET.get('q', '').strip()
+    hmis_code = request.GET.get('hmis', '').strip()
+    results = search_medical_records(
+        medical_records,
+        query=query,
+        doctor=doctor,
+        date_from=date_from,
+        date_to=date_to,
+        hmis_code=hmis_code,
+    )
+    page_obj = Paginator(results, 25).get_page(request.GET.get('page'))
+
+    filters = request.GET.copy()
+    filters.pop('page', None)
+
+    return {
+        'medical_records': page_obj,
+        'page_obj': page_obj,
+        'total_records': page_obj.paginator.count,
+        'query': query,
+        'date_from': date_from,
+        'date_to': date_to,
+        'hmis_code': hmis_code,
+        'selected_doctor': doctor,
+        'filter_querystring': filters.urlencode(),
+        'hmis_classifications': reference_data.hmis_classifications(),
+        'clinic_wide': clinic_wide,
+    }
+
+
 @login_required(login_url='/doctor/login/')
 def medical_records_list(request):
     """View all medical records created by this doctor"""
@@ -1138,11 +1007,30 @@ def medical_records_list(request):
     # Get all medical records for this doctor's patients
     medical_records = MedicalRecord.objects.filter(
         visit__doctor=clinic_user
-    ).select_related('visit', 'visit__patient').order_by('-created_at')
+    ).select_related('visit', 'visit__patient')
     
     context = {
-        'medical_records': medical_records,
+        **_medical_record_search(request, medical_records),
+        'clinic_user': clinic_user,
+    }
+    return render(request, 'doctor/medical_records_list.html', context)
+
+
+@login_required(login_url='/doctor/login/')
+def clinical_search(request):
+    """Clinic-wide full-text search over medical records"""
+    if not hasattr(request.user, 'clinicuser') or request.user.clinicuser.role not in ('doctor', 'admin'):
+        messages.error(request, 'Access denied. Doctor role required.')
+        return redirect('doctor-login')
+
+    clinic_user = request.user.clinicuser
+
+    medical_records = MedicalRecord.objects.select_related('visit', 'visit__patient', 'visit__doctor__user')
+
+    context = {
+        **_medical_record_search(request, medical_records, clinic_wide=True),
         'clinic_user': clinic_user,
+        'doctors': reference_data.doctors(),
     }
     return render(request, 'doctor/medical_records_list.html', context)
 
@@ -1154,72 +1042,65 @@ def my_statistics(request):
         messages.error(request, 'Access denied. Doctor role required.')
         return redirect('doctor-login')
     
-    from django.db.models import Sum, Avg, Count
-    from django.db.models.functions import TruncDate
+    from django.db.models import Count
+    from django.utils.dateparse import parse_date
     import json
     
     clinic_user = request.user.clinicuser
-    today = timezone.now().date()
+    today = timezone.localdate()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # Overall statistics
-    total_patients = Visit.objects.filter(doctor=clinic_user).count()
-    total_completed = Visit.objects.filter(doctor=clinic_user, status__in=COMPLETED_STATUSES).count()
-    total_revenue = 0
-    try:
-        invoices = Invoice.objects.filter(visit__doctor=clinic_user, paid=True)
-        for inv in invoices:
-            total_revenue += (inv.total_private or 0) + (inv.total_insurance or 0)
-    except:
-        pass
-    
+    # Counts and revenue come from the per-doctor daily rollup (one row per day)
+    overall = DoctorDailyStats.summarize(clinic_user)
+    today_stats = DoctorDailyStats.summarize(clinic_user, today, today)
+    weekly_stats = DoctorDailyStats.summarize(clinic_user, week_ago)
+    monthly_stats = DoctorDailyStats.summarize(clinic_user, month_ago)
+
+    total_patients = overall['visits']
+    total_completed = overall['completed_visits']
+    total_revenue = overall['revenue']
+
     # Today's stats
-    today_patients = Visit.objects.filter(doctor=clinic_user, created_at__date=today).count()
-    today_completed = Visit.objects.filter(
-        doctor=clinic_user,
-        created_at__date=today,
-        status__in=COMPLETED_STATUSES,
-    ).count()
-    
+    today_patients = today_stats['visits']
+    today_completed = today_stats['completed_visits']
+
     # Weekly stats
-    weekly_patients = Visit.objects.filter(doctor=clinic_user, created_at__date__gte=week_ago).count()
-    weekly_completed = Visit.objects.filter(
-        doctor=clinic_user,
-        created_at__date__gte=week_ago,
-        status__in=COMPLETED_STATUSES,
-    ).count()
-    
+    weekly_patients = weekly_stats['visits']
+    weekly_completed = weekly_stats['completed_visits']
+
     # Monthly stats
-    monthly_patients = Visit.objects.filter(doctor=clinic_user, created_at__date__gte=month_ago).count()
-    monthly_completed = Visit.objects.filter(
-        doctor=clinic_user,
-        created_at__date__gte=month_ago,
-        status__in=COMPLETED_STATUSES,
-    ).count()
-    
+    monthly_patients = monthly_stats['visits']
+    monthly_completed = monthly_stats['completed_visits']
+
+    # Custom range (?start=YYYY-MM-DD&end=YYYY-MM-DD)
+    try:
+        range_start = parse_date(request.GET.get('start') or '')
+        range_end = parse_date(request.GET.get('end') or '')
+    except ValueError:
+        messages.error(request, 'Invalid date range. Use YYYY-MM-DD.')
+        range_start = range_end = None
+    range_stats = None
+    if range_start or range_end:
+        range_stats = DoctorDailyStats.summarize(clinic_user, range_start, range_end)
+
     # Daily patient count for last 30 days (for graph)
-    daily_stats = Visit.objects.filter(
+    daily_stats = DoctorDailyStats.objects.filter(
         doctor=clinic_user,
-        created_at__date__gte=month_ago
-    ).annotate(date=TruncDate('created_at')).values('date').annotate(
-        total=Count('id')
-    ).order_by('date')
-    
+        date__gte=month_ago,
+        visits__gt=0,
+    ).values('date', 'visits').order_by('date')
+
     dates = [stat['date'].strftime('%Y-%m-%d') for stat in daily_stats]
-    counts = [stat['total'] for stat in daily_stats]
+    counts = [stat['visits'] for stat in daily_stats]
     
     # Status distribution
     status_distribution = Visit.objects.filter(doctor=clinic_user).values('status').annotate(
         count=Count('id')
     ).order_by('-count')
     
-    # Most common diagnoses
-    top_diagnoses = MedicalRecord.objects.filter(
-        visit__doctor=clinic_user
-    ).values('diagnosis').annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]
+    # Most common diagnoses, grouped by normalized key (monthly rollup)
+    top_diagnoses = DoctorDiagnosisMonthly.top(clinic_user, limit=10)
     
     # Calculate completion rate
     completion_rate = (total_completed * 100 / total_patients) if total_patients > 0 else 0
@@ -1237,10 +1118,13 @@ def my_statistics(request):
         'weekly_completed': weekly_completed,
         'monthly_patients': monthly_patients,
         'monthly_completed': monthly_completed,
+        'range_start': range_start,
+        'range_end': range_end,
+        'range_stats': range_stats,
         'dates_json': json.dumps(dates),
         'counts_json': json.dumps(counts),
         'status_distribution': list(status_distribution),
-        'top_diagnoses': list(top_diagnoses),
+        'top_diagnoses': top_diagnoses,
     }
     return render(request, 'doctor/my_statistics.html', context)
 
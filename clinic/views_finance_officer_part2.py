@@ -7,16 +7,21 @@ Store Management, Expenses, Profit/Loss, Balance Sheet
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import Sum, Count, Q, F, DecimalField, Value
 from datetime import datetime, timedelta, date
+from decimal import Decimal
 from django.contrib import messages
 from django.http import JsonResponse
 
-from clinic.models import Invoice, ClinicUser, Department, Payment
+from clinic.models import Invoice, ClinicUser, Department, Payment, InventoryItem
 from clinic.models_financial import (
     Expense, Purchase, FixedAsset, ConsumableInventory, 
-    ConsumableUsage, FinancialPeriod, StockAlert
+    ConsumableUsage, ConsumableMovement, FinancialPeriod, StockAlert
 )
+from clinic.utils.ledger import inventory_value_as_of, record_movement
+from clinic.utils.stock import receive_batch
+from clinic.utils.stock_alerts import reconcile_alerts
 
 
 def is_finance_officer(user):
@@ -216,15 +221,46 @@ def purchase_create(request):
             messages.error(request, 'User profile not found')
             return redirect('purchase_list')
         
+        # Medicines stocked by the pharmacy are linked explicitly and get a batch
+        medicine = None
+        error = None
+        try:
+            quantity = Decimal(request.POST.get('quantity') or 0)
+        except ArithmeticError:
+            quantity = None
+        if quantity is None or not quantity.is_finite() or quantity < 0:
+            error = 'Enter a valid quantity.'
+        try:
+            purchase_date = parse_date(request.POST.get('purchase_date') or '')
+        except ValueError:
+            purchase_date = None
+        if purchase_date is None:
+            error = 'Enter a valid purchase date.'
+        inventory_item_id = request.POST.get('inventory_item')
+        if inventory_item_id and error is None:
+            if request.POST.get('purchase_type') != 'medicine':
+                error = 'Only medicine purchases can be linked to a pharmacy item.'
+            else:
+                medicine = InventoryItem.objects.filter(
+                    pk=inventory_item_id if inventory_item_id.isdigit() else None, category='medicine'
+                ).first()
+                if medicine is None:
+                    error = 'Select a valid pharmacy item.'
+                elif quantity != int(quantity):
+                    error = 'Pharmacy batches are counted in whole units; enter a whole quantity.'
+        if error:
+            messages.error(request, error)
+            return render(request, 'finance/purchase_form.html', _purchase_form_context(request.POST))
+        
         purchase = Purchase.objects.create(
             purchase_type=request.POST.get('purchase_type'),
             item_name=request.POST.get('item_name'),
             supplier_name=request.POST.get('supplier_name'),
             supplier_contact=request.POST.get('supplier_contact'),
-            quantity=request.POST.get('quantity'),
+            quantity=quantity,
             unit=request.POST.get('unit'),
-            price_per_unit=request.POST.get('price_per_unit'),
-            purchase_date=request.POST.get('purchase_date'),
+            price_per_unit=Decimal(request.POST.get('price_per_unit') or 0),
+            purchase_date=purchase_date,
             expiry_date=request.POST.get('expiry_date') if request.POST.get('expiry_date') else None,
             entered_by=clinic_user,
             department_id=request.POST.get('department') if request.POST.get('department') else None,
@@ -250,33 +286,56 @@ def purchase_create(request):
                 }
             )
             
-            # Update stock
-            consumable.quantity_in_stock += purchase.quantity
             consumable.last_entry_date = purchase.purchase_date
             if purchase.expiry_date:
                 consumable.expiry_date = purchase.expiry_date
+            consumable.save(update_fields=['last_entry_date', 'expiry_date', 'updated_at'])
             
-            # Update average cost
-            total_value = (consumable.quantity_in_stock - purchase.quantity) * consumable.average_unit_cost
-            total_value += purchase.total_cost
-            consumable.average_unit_cost = total_value / consumable.quantity_in_stock
-            consumable.save()
+            # Receive the stock through the ledger; this also moves the average cost.
+            # Backdated purchases are dated on the purchase day so as-of
+            # valuations and month-end snapshots include them from then on.
+            occurred_at = None
+            if purchase_date < timezone.localdate():
+                occurred_at = timezone.make_aware(datetime.combine(purchase_date, datetime.min.time()))
+            record_movement(
+                consumable,
+                purchase.quantity,
+                ConsumableMovement.MOVEMENT_IN,
+                unit_cost=purchase.price_per_unit,
+                occurred_at=occurred_at,
+                purchase=purchase,
+                performed_by=clinic_user,
+            )
             
             # Link purchase to inventory
-            purchase.inventory_item_id = consumable.id
-            purchase.save()
+            purchase.consumable = consumable
+            update_fields = ['consumable']
+            
+            if medicine is not None:
+                receive_batch(
+                    medicine,
+                    int(purchase.quantity),
+                    purchase.price_per_unit,
+                    expiry_date=purchase.expiry_date,
+                    batch_number=purchase.invoice_number,
+                )
+                purchase.inventory_item = medicine
+                update_fields.append('inventory_item')
+            purchase.save(update_fields=update_fields)
         
         messages.success(request, 'Purchase registered successfully')
         return redirect('purchase_list')
     
-    departments = Department.objects.all()
-    
-    context = {
+    return render(request, 'finance/purchase_form.html', _purchase_form_context())
+
+
+def _purchase_form_context(form_data=None):
+    return {
         'purchase_types': Purchase.PURCHASE_TYPE_CHOICES,
-        'departments': departments,
+        'departments': Department.objects.all(),
+        'pharmacy_items': InventoryItem.objects.filter(category='medicine').order_by('name'),
+        'form_data': form_data or {},
     }
-    
-    return render(request, 'finance/purchase_form.html', context)
 
 
 # ==================== INVENTORY MANAGEMENT ====================
@@ -360,11 +419,11 @@ def consumable_create(request):
             item_code=request.POST.get('item_code'),
             category=request.POST.get('category'),
             unit=request.POST.get('unit'),
-            quantity_in_stock=request.POST.get('quantity_in_stock', 0),
-            minimum_stock_level=request.POST.get('minimum_stock_level', 0),
+            quantity_in_stock=Decimal(request.POST.get('quantity_in_stock') or 0),
+            minimum_stock_level=Decimal(request.POST.get('minimum_stock_level') or 0),
             expiry_date=request.POST.get('expiry_date') if request.POST.get('expiry_date') else None,
             department_id=request.POST.get('department') if request.POST.get('department') else None,
-            average_unit_cost=request.POST.get('average_unit_cost', 0),
+            average_unit_cost=Decimal(request.POST.get('average_unit_cost') or 0),
             notes=request.POST.get('notes'),
         )
         
@@ -510,13 +569,16 @@ def profit_loss_statement(request):
     consumable_usage = ConsumableUsage.objects.filter(
         usage_date__gte=start_date,
         usage_date__lte=end_date
-    ).select_related('consumable')
-    
-    cogs = sum(
-        usage.quantity_used * usage.consumable.average_unit_cost 
-        for usage in consumable_usage
     )
     
+    cogs = consumable_usage.aggregate(
+        total=Sum(
+            F('quantity_used') * F('consumable__average_unit_cost'),
+            default=0,
+            output_field=DecimalField()
+        )
+    )['total'] or 0
+    
     # GROSS PROFIT
     gross_profit = total_revenue - cogs
     gross_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
@@ -593,7 +655,7 @@ def balance_sheet(request):
     if as_of_date:
         as_of_date = datetime.strptime(as_of_date, '%Y-%m-%d').date()
     else:
-        as_of_date = timezone.now().date()
+        as_of_date = timezone.localdate()
     
     # ASSETS
     # Current Assets
@@ -614,9 +676,8 @@ def balance_sheet(request):
         total=Sum('total_insurance', default=0, output_field=DecimalField())
     )['total'] or 0
     
-    # Inventory (Consumables)
-    consumables = ConsumableInventory.objects.all()
-    inventory_value = sum(item.total_value() for item in consumables)
+    # Inventory (Consumables), valued from the stock ledger as of the date
+    inventory_value = inventory_value_as_of(as_of_date)
     
     total_current_assets = cash_balance + accounts_receivable + inventory_value
     
@@ -738,79 +799,8 @@ def stock_alert_list(request):
 @user_passes_test(is_finance_officer)
 def check_and_create_alerts(request):
     """Check inventory and create alerts for low stock and expiring items"""
-    today = timezone.now().date()
-    alerts_created = 0
-    
-    # Check for low stock
-    low_stock_items = ConsumableInventory.objects.filter(
-        quantity_in_stock__lte=F('minimum_stock_level')
-    )
-    
-    for item in low_stock_items:
-        # Check if alert already exists
-        existing = StockAlert.objects.filter(
-            consumable=item,
-            alert_type='low_stock',
-            status='active'
-        ).exists()
-        
-        if not existing:
-            if item.quantity_in_stock == 0:
-                StockAlert.objects.create(
-                    alert_type='out_of_stock',
-                    consumable=item,
-                    message=f"{item.item_name} is OUT OF STOCK"
-                )
-            else:
-                StockAlert.objects.create(
-                    alert_type='low_stock',
-                    consumable=item,
-                    message=f"{item.item_name} is below minimum stock level. Current: {item.quantity_in_stock} {item.unit}"
-                )
-            alerts_created += 1
-    
-    # Check for expiring items (within 30 days)
-    expiring_date = today + timedelta(days=30)
-    expiring_items = ConsumableInventory.objects.filter(
-        expiry_date__lte=expiring_date,
-        expiry_date__gte=today
-    )
-    
-    for item in expiring_items:
-        existing = StockAlert.objects.filter(
-            consumable=item,
-            alert_type='expiring_soon',
-            status='active'
-        ).exists()
-        
-        if not existing:
-            days_until_expiry = (item.expiry_date - today).days
-            StockAlert.objects.create(
-                alert_type='expiring_soon',
-                consumable=item,
-                message=f"{item.item_name} expires in {days_until_expiry} days ({item.expiry_date})"
-            )
-            alerts_created += 1
-    
-    # Check for expired items
-    expired_items = ConsumableInventory.objects.filter(
-        expiry_date__lt=today
-    )
-    
-    for item in expired_items:
-        existing = StockAlert.objects.filter(
-            consumable=item,
-            alert_type='expired',
-            status='active'
-        ).exists()
-        
-        if not existing:
-            StockAlert.objects.create(
-                alert_type='expired',
-                consumable=item,
-                message=f"{item.item_name} has EXPIRED (Expiry: {item.expiry_date})"
-            )
-            alerts_created += 1
+    # Same reconciliation the reconcile_stock_alerts command runs on a schedule
+    alerts_created, alerts_resolved = reconcile_alerts()
     
-    messages.success(request, f'{alerts_created} new alerts created')
+    messages.success(request, f'{alerts_created} new alerts created, {alerts_resolved} resolved')
     return redirect('stock_alert_list')
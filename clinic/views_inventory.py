@@ -4,6 +4,7 @@
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
@@ -475,51 +476,101 @@ def inventory_add_equipment_view(request):
 @login_required(login_url='/dashboard/inventory/login/')
 def inventory_stock_take_view(request):
     """Perform stock take/inventory count"""
+    from clinic.models_financial import StockTakeSession
+    from clinic.utils.stock_take import StockTakeError, match_counts, read_count_file, save_counts
     
-    # Get all consumable items for stock take
-    all_consumables = ConsumableInventory.objects.all().order_by('item_name')
+    clinic_user = getattr(request.user, 'clinicuser', None)
+    session = StockTakeSession.objects.filter(status=StockTakeSession.STATUS_OPEN).first()
     
     if request.method == 'POST':
+        action = request.POST.get('action', 'save')
+        
+        if action == 'start':
+            if session is None:
+                session = StockTakeSession.objects.create(started_by=clinic_user)
+                messages.success(request, f'Stock take #{session.pk} started.')
+            return redirect('inventory_stock_take')
+        
+        if session is None:
+            messages.error(request, 'Start a stock take first.')
+            return redirect('inventory_stock_take')
+        
+        if action == 'cancel':
+            session.status = StockTakeSession.STATUS_CANCELLED
+            session.save(update_fields=['status'])
+            messages.success(request, f'Stock take #{session.pk} cancelled; stock was not changed.')
+            return redirect('inventory_stock_take')
+        
         try:
-            updated_count = 0
-            # Process each item's physical count
-            for consumable in all_consumables:
-                physical_count_key = f'physical_count_{consumable.id}'
-                notes_key = f'notes_{consumable.id}'
-                
-                if physical_count_key in request.POST and request.POST[physical_count_key]:
-                    physical_count = float(request.POST[physical_count_key])
-                    notes = request.POST.get(notes_key, '')
-                    
-                    # Calculate difference
-                    difference = physical_count - consumable.quantity_in_stock
-                    
-                    # Update stock quantity
-                    consumable.quantity_in_stock = physical_count
-                    consumable.save()
-                    
-                    # Record stock movement if there's a difference
-                    if difference != 0:
-                        StockMovement.objects.create(
-                            consumable=consumable,
-                            movement_type='adjustment',
-                            quantity=abs(difference),
-                            notes=f'Stock take adjustment: {notes}' if notes else 'Stock take adjustment',
-                            performed_by=request.user
+            if action == 'upload':
+                if 'count_file' not in request.FILES:
+                    raise StockTakeError('Choose a CSV or XLSX file to upload')
+                counts, errors = match_counts(read_count_file(request.FILES['count_file']))
+            else:
+                counts, errors = {}, []
+                for key, value in request.POST.items():
+                    if key.startswith('physical_count_') and value.strip():
+                        consumable_id = int(key[len('physical_count_'):])
+                        counted = Decimal(value)
+                        if counted < 0:
+                            raise StockTakeError('Counts cannot be negative')
+                        counts[consumable_id] = (
+                            counted, request.POST.get(f'notes_{consumable_id}', '').strip()[:255]
                         )
-                        updated_count += 1
-            
-            messages.success(request, f'Stock take completed! {updated_count} items updated.')
-            return redirect('inventory_stock')
-        except Exception as e:
-            messages.error(request, f'Error completing stock take: {str(e)}')
+            saved = save_counts(session, counts)
+        except (StockTakeError, ValueError, ArithmeticError) as e:
+            messages.error(request, f'Error recording counts: {str(e)}')
+            return redirect('inventory_stock_take')
+        
+        for error in errors[:20]:
+            messages.warning(request, error)
+        messages.success(request, f'{saved} counts recorded. Review the variances before applying.')
+        return redirect('inventory_stock_take_preview', session_id=session.pk)
+    
+    # Get all consumable items for stock take, with counts already recorded
+    all_consumables = ConsumableInventory.objects.all().order_by('item_name')
+    counted = {}
+    if session is not None:
+        counted = {count.consumable_id: count for count in session.counts.all()}
+    for consumable in all_consumables:
+        consumable.stock_take_count = counted.get(consumable.id)
     
     context = {
+        'session': session,
         'all_consumables': all_consumables,
+        'counted_total': len(counted),
     }
     return render(request, 'inventory/stock_take.html', context)
 
 
+@login_required(login_url='/dashboard/inventory/login/')
+def inventory_stock_take_preview(request, session_id):
+    """Review stock take variances and apply them"""
+    from django.shortcuts import get_object_or_404
+    from clinic.models_financial import StockTakeSession
+    from clinic.utils.stock_take import StockTakeError, apply_session, variances
+    
+    session = get_object_or_404(StockTakeSession, pk=session_id)
+    
+    if request.method == 'POST':
+        try:
+            changed = apply_session(session.pk, performed_by=getattr(request.user, 'clinicuser', None))
+        except StockTakeError as e:
+            messages.error(request, str(e))
+            return redirect('inventory_stock_take_preview', session_id=session.pk)
+        messages.success(request, f'Stock take completed! {changed} items updated.')
+        return redirect('inventory_stock')
+    
+    rows, total_value = variances(session)
+    context = {
+        'session': session,
+        'rows': rows,
+        'total_value': total_value,
+        'changed_count': sum(1 for row in rows if row['difference']),
+    }
+    return render(request, 'inventory/stock_take_preview.html', context)
+
+
 @login_required(login_url='/dashboard/inventory/login/')
 def inventory_maintenance_log_view(request):
     """View and add maintenance log entries"""
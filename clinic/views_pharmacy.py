@@ -2,6 +2,7 @@
 """Pharmacy management dashboard"""
 
 from django.shortcuts import render, redirect
+from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.http import require_http_methods
@@ -62,30 +63,29 @@ def pharmacy_dashboard(request):
     from django.utils import timezone
     from datetime import timedelta
     
-    # Get all medicines from pharmacy stock
-    all_medicines = PharmacyStock.objects.select_related('item').all()
+    from clinic.models import PharmacyDailyDispense
+    from clinic.utils.stock import LOW_STOCK_LEVEL, stock_summary
+    from django.db.models import Sum
     
-    # Low stock medicines (less than 10)
-    low_stock_medicines = all_medicines.filter(qty_available__lt=10)
+    summary = stock_summary()
     
-    # Expiring soon (within 30 days)
-    today = timezone.now().date()
-    expiry_threshold = today + timedelta(days=30)
-    expiring_medicines = all_medicines.filter(
-        expiry_date__lte=expiry_threshold,
-        expiry_date__isnull=False
-    )
+    # Medicines running low across all their batches
+    low_stock_medicines = InventoryItem.objects.filter(
+        category='medicine', qty_on_hand__lt=LOW_STOCK_LEVEL
+    ).order_by('qty_on_hand', 'name')
     
     # Get pending prescriptions
     pending_prescriptions = Prescription.objects.filter(
-        prescription_type='clinic'
-    ).select_related('patient', 'doctor', 'visit')[:10]
+        dispense_status=Prescription.STATUS_PENDING
+    ).select_related('patient', 'doctor', 'visit').order_by('created_at', 'id')[:10]
     
     context = {
-        'total_medicines': all_medicines.count(),
-        'low_stock_count': low_stock_medicines.count(),
-        'expired_count': expiring_medicines.count(),
-        'today_dispensed': 0,  # TODO: Implement dispensing tracking
+        'total_medicines': summary['total_items'],
+        'low_stock_count': summary['low_stock_count'],
+        'expired_count': summary['expiring_count'] + summary['expired_count'],
+        'today_dispensed': PharmacyDailyDispense.objects.filter(
+            date=timezone.localdate()
+        ).aggregate(total=Sum('quantity'))['total'] or 0,
         'low_stock_medications': low_stock_medicines[:5],
         'recent_prescriptions': pending_prescriptions,
         'pending_prescriptions': pending_prescriptions,
@@ -108,62 +108,27 @@ def pharmacy_medications(request):
 @login_required
 def pharmacy_prescriptions(request):
     """View prescriptions"""
-    from clinic.models import Prescription
-    
-    # Get all prescriptions
-    all_prescriptions = Prescription.objects.select_related(
-        'patient', 'doctor', 'doctor__user', 'visit'
-    ).prefetch_related('items__inventory_item').order_by('-created_at')
-    
-    # Filter by status
-    pending_prescriptions = all_prescriptions.filter(prescription_type='clinic')
-    completed_prescriptions = all_prescriptions.filter(prescription_type='written')
-    
-    # Count statistics
-    total_count = all_prescriptions.count()
-    pending_count = pending_prescriptions.count()
-    completed_count = completed_prescriptions.count()
-    
-    context = {
-        'all_prescriptions': all_prescriptions,
-        'pending_prescriptions': pending_prescriptions,
-        'completed_prescriptions': completed_prescriptions,
-        'total_count': total_count,
-        'pending_count': pending_count,
-        'completed_count': completed_count,
-        'prescriptions': all_prescriptions,  # For backward compatibility
-    }
-    
-    return render(request, 'pharmacy/prescriptions.html', context)
+    return pharmacy_prescriptions_view(request)
 
 
 @login_required
 def pharmacy_medicines_view(request):
     """View and manage medicines"""
-    from clinic.models import InventoryItem, PharmacyStock
-    
-    # Get all medicines from inventory with pharmacy stock
-    medicine_items = InventoryItem.objects.filter(category='medicine').prefetch_related('pharmacy_stocks')
-    
-    # Build medicines list with stock information
-    medicines_data = []
-    for item in medicine_items:
-        # Get the most recent pharmacy stock for this item
-        stock = item.pharmacy_stocks.first()
-        if stock:
-            medicines_data.append(stock)
-        else:
-            # Create a default stock entry if none exists
-            stock = PharmacyStock.objects.create(
-                item=item,
-                qty_available=0,
-                unit_price=item.unit_cost
-            )
-            medicines_data.append(stock)
+    from clinic.models import InventoryItem
+    from django.db.models import Count, Max, Min, Q
+    
+    # One row per medicine with its batches aggregated; qty_on_hand is kept
+    # current by the stock signals, missing batches by create_missing_pharmacy_stock
+    medicines = InventoryItem.objects.filter(category='medicine').annotate(
+        batch_count=Count('pharmacy_stocks'),
+        unit_price=Max('pharmacy_stocks__unit_price'),
+        next_expiry=Min('pharmacy_stocks__expiry_date', filter=Q(pharmacy_stocks__qty_available__gt=0)),
+    ).order_by('name')
+    medicines = list(medicines)
     
     context = {
-        'medicines': medicines_data,
-        'total_count': len(medicines_data),
+        'medicines': medicines,
+        'total_count': len(medicines),
     }
     
     return render(request, 'pharmacy/medicines.html', context)
@@ -173,6 +138,7 @@ def pharmacy_medicines_view(request):
 def pharmacy_stock_view(request):
     """View and manage stock"""
     from clinic.models import PharmacyStock
+    from clinic.utils.stock import CRITICAL_STOCK_LEVEL, EXPIRY_WARNING_DAYS, LOW_STOCK_LEVEL, stock_summary
     from django.utils import timezone
     from datetime import timedelta
     
@@ -180,33 +146,25 @@ def pharmacy_stock_view(request):
     all_stock = PharmacyStock.objects.select_related('item').all().order_by('item__name')
     
     # Filter low stock items (≤10 units)
-    low_stock_items = all_stock.filter(qty_available__lte=10)
+    low_stock_items = all_stock.filter(qty_available__lte=LOW_STOCK_LEVEL)
     
     # Filter critical stock (≤5 units)
-    critical_stock = all_stock.filter(qty_available__lte=5)
+    critical_stock = all_stock.filter(qty_available__lte=CRITICAL_STOCK_LEVEL)
     
     # Filter out of stock
     out_of_stock = all_stock.filter(qty_available=0)
     
     # Filter expiring items (next 30 days)
-    today = timezone.now().date()
-    expiring_date = today + timedelta(days=30)
+    today = timezone.localdate()
+    expiring_date = today + timedelta(days=EXPIRY_WARNING_DAYS)
     expiring_items = all_stock.filter(
         expiry_date__isnull=False,
         expiry_date__lte=expiring_date,
         expiry_date__gte=today
     )
     
-    # Calculate statistics
-    total_items = all_stock.count()
-    low_stock_count = low_stock_items.count()
-    critical_count = critical_stock.count()
-    out_of_stock_count = out_of_stock.count()
-    expiring_count = expiring_items.count()
-    in_stock_count = all_stock.filter(qty_available__gt=10).count()
-    
-    # Calculate total stock value
-    total_value = sum(item.qty_available * item.unit_price for item in all_stock)
+    # All counts and the total stock value in one aggregate query
+    summary = stock_summary(today=today)
     
     context = {
         'all_stock': all_stock,
@@ -214,13 +172,7 @@ def pharmacy_stock_view(request):
         'critical_stock': critical_stock,
         'out_of_stock': out_of_stock,
         'expiring_items': expiring_items,
-        'total_items': total_items,
-        'low_stock_count': low_stock_count,
-        'critical_count': critical_count,
-        'out_of_stock_count': out_of_stock_count,
-        'expiring_count': expiring_count,
-        'in_stock_count': in_stock_count,
-        'total_value': total_value,
+        **summary,
     }
     
     return render(request, 'pharmacy/stock.html', context)
@@ -236,36 +188,51 @@ def pharmacy_dispensing_view(request):
 def pharmacy_prescriptions_view(request):
     """View prescriptions"""
     from clinic.models import Prescription
+    from clinic.utils.keyset import InvalidCursor, keyset_page
+    from django.db.models import Count, Q
     from django.utils import timezone
     from datetime import timedelta
     
-    # Get all prescriptions
-    all_prescriptions = Prescription.objects.select_related(
-        'patient', 'doctor', 'doctor__user', 'visit'
-    ).prefetch_related('items__inventory_item').order_by('-created_at')
-    
-    # Filter by status
-    pending_prescriptions = all_prescriptions.filter(prescription_type='clinic')
-    completed_prescriptions = all_prescriptions.filter(prescription_type='written')
+    page_size = 25
     
-    # Get today's prescriptions (last 24 hours)
+    # Counts for the summary cards in one aggregate
     today_start = timezone.now() - timedelta(hours=24)
-    today_prescriptions = all_prescriptions.filter(created_at__gte=today_start)
+    counts = Prescription.objects.aggregate(
+        total_count=Count('id'),
+        pending_count=Count('id', filter=Q(dispense_status=Prescription.STATUS_PENDING)),
+        completed_count=Count('id', filter=Q(dispense_status=Prescription.STATUS_DISPENSED)),
+        today_count=Count('id', filter=Q(created_at__gte=today_start)),
+    )
+    
+    prescriptions = Prescription.objects.select_related(
+        'patient', 'doctor', 'doctor__user', 'visit', 'dispensed_by__user'
+    ).annotate(item_count=Count('items'))
     
-    # Count statistics
-    total_count = all_prescriptions.count()
-    pending_count = pending_prescriptions.count()
-    completed_count = completed_prescriptions.count()
-    today_count = today_prescriptions.count()
+    # Each list is keyset-paginated on its own index; oldest pending first
+    try:
+        pending_prescriptions, pending_cursor = keyset_page(
+            prescriptions.filter(dispense_status=Prescription.STATUS_PENDING),
+            'created_at', request.GET.get('pending_cursor'), page_size, descending=False
+        )
+        completed_prescriptions, history_cursor = keyset_page(
+            prescriptions.filter(dispense_status=Prescription.STATUS_DISPENSED),
+            'dispensed_at', request.GET.get('history_cursor'), page_size
+        )
+        all_prescriptions, all_cursor = keyset_page(
+            prescriptions, 'created_at', request.GET.get('cursor'), page_size
+        )
+    except InvalidCursor:
+        messages.error(request, 'Invalid page link.')
+        return redirect('pharmacy_prescriptions')
     
     context = {
         'all_prescriptions': all_prescriptions,
         'pending_prescriptions': pending_prescriptions,
         'completed_prescriptions': completed_prescriptions,
-        'total_count': total_count,
-        'pending_count': pending_count,
-        'completed_count': completed_count,
-        'today_count': today_count,
+        'next_cursor': all_cursor,
+        'next_pending_cursor': pending_cursor,
+        'next_history_cursor': history_cursor,
+        **counts,
     }
     
     return render(request, 'pharmacy/prescriptions.html', context)
@@ -274,7 +241,42 @@ def pharmacy_prescriptions_view(request):
 @login_required
 def pharmacy_reports_view(request):
     """Pharmacy reports"""
-    return render(request, 'pharmacy/reports.html', {})
+    from clinic.models import InventoryItem, PharmacyDailyDispense
+    from clinic.utils.stock import LOW_STOCK_LEVEL
+    from django.db.models import DateField, Sum
+    from django.db.models.functions import TruncMonth
+    from django.utils import timezone
+    from datetime import timedelta
+    
+    # All figures come from the (item, date) rollup, read by date range
+    today = timezone.localdate()
+    start = today - timedelta(days=29)
+    last_30_days = PharmacyDailyDispense.objects.filter(date__gte=start, date__lte=today)
+    totals = last_30_days.aggregate(quantity=Sum('quantity'), value=Sum('value'))
+    
+    year_start = (today.replace(day=1) - timedelta(days=335)).replace(day=1)
+    monthly_value = (
+        PharmacyDailyDispense.objects.filter(date__gte=year_start)
+        .annotate(month=TruncMonth('date', output_field=DateField()))
+        .values('month')
+        .annotate(quantity=Sum('quantity'), value=Sum('value'))
+        .order_by('-month')
+    )
+    
+    medicines = InventoryItem.objects.filter(category='medicine')
+    
+    context = {
+        'date_range': f"{start:%d %b %Y} - {today:%d %b %Y}",
+        'dispensed_today': PharmacyDailyDispense.objects.filter(date=today).aggregate(total=Sum('quantity'))['total'] or 0,
+        'total_dispensed': totals['quantity'] or 0,
+        'total_value': totals['value'] or 0,
+        'total_medicines': medicines.count(),
+        'low_stock_count': medicines.filter(qty_on_hand__lte=LOW_STOCK_LEVEL).count(),
+        'most_dispensed': PharmacyDailyDispense.top_items(start=start, end=today),
+        'monthly_value': monthly_value,
+    }
+    
+    return render(request, 'pharmacy/reports.html', context)
 
 
 @login_required
@@ -312,13 +314,14 @@ def pharmacy_prescription_detail(request, prescription_id):
                 'id': prescription.id,
                 'prescription_id': f"#{prescription.id:05d}",
                 'patient_name': f"{prescription.patient.first_name} {prescription.patient.last_name}",
-                'patient_id': prescription.patient.patient_id,
+                'patient_id': prescription.patient.id,
                 'doctor_name': prescription.doctor.user.get_full_name(),
                 'date': prescription.created_at.strftime('%B %d, %Y'),
                 'time': prescription.created_at.strftime('%I:%M %p'),
                 'type': prescription.prescription_type.title(),
+                'status': prescription.get_dispense_status_display(),
                 'items': items,
-                'notes': prescription.notes or 'No additional notes'
+                'notes': prescription.instructions or 'No additional notes'
             }
         }
         return JsonResponse(data)
@@ -349,7 +352,8 @@ def pharmacy_print_prescription(request, prescription_id):
 @login_required
 def pharmacy_dispense_prescription(request, prescription_id):
     """Dispense a prescription"""
-    from clinic.models import Prescription, PharmacyStock, Dispense
+    from clinic.models import Prescription
+    from clinic.utils.stock import InsufficientStock, dispense_prescription
     from django.http import JsonResponse
     from django.db import transaction
     from django.utils import timezone
@@ -359,56 +363,36 @@ def pharmacy_dispense_prescription(request, prescription_id):
     
     try:
         with transaction.atomic():
-            prescription = Prescription.objects.select_related('patient').prefetch_related(
-                'items__inventory_item'
-            ).get(id=prescription_id)
+            # Lock the prescription so two pharmacists cannot dispense it at once
+            prescription = Prescription.objects.select_for_update(of=('self',)).select_related(
+                'patient'
+            ).prefetch_related('items__inventory_item').get(id=prescription_id)
             
             # Check if already dispensed
-            if prescription.prescription_type != 'clinic':
+            if prescription.dispense_status != Prescription.STATUS_PENDING:
                 return JsonResponse({
                     'success': False,
                     'error': 'This prescription has already been dispensed'
                 }, status=400)
             
-            # Dispense each item
-            dispensed_items = []
-            insufficient_stock = []
-            
-            for item in prescription.items.all():
-                # Find available stock
-                stock = PharmacyStock.objects.filter(
-                    item=item.inventory_item,
-                    qty_available__gte=item.quantity
-                ).first()
-                
-                if not stock:
-                    insufficient_stock.append(item.inventory_item.name)
-                    continue
-                
-                # Create dispense record
-                dispense = Dispense.objects.create(
-                    prescription=prescription,
-                    pharmacy_stock=stock,
-                    quantity_dispensed=item.quantity,
-                    dispensed_by=request.user,
-                    dispensed_at=timezone.now()
+            # Split each line across batches, earliest expiry first
+            try:
+                dispense_prescription(
+                    prescription,
+                    items=prescription.items.all(),
+                    dispensed_by=getattr(request.user, 'clinicuser', None),
                 )
-                
-                # Update stock
-                stock.qty_available -= item.quantity
-                stock.save()
-                
-                dispensed_items.append(item.inventory_item.name)
-            
-            if insufficient_stock:
+            except InsufficientStock as e:
                 return JsonResponse({
                     'success': False,
-                    'error': f'Insufficient stock for: {", ".join(insufficient_stock)}'
+                    'error': f'Insufficient stock for: {", ".join(item.name for item, _, _ in e.shortages)}'
                 }, status=400)
+            dispensed_items = [item.display_name() for item in prescription.items.all()]
             
-            # Update prescription type to mark as dispensed
-            prescription.prescription_type = 'written'
-            prescription.save()
+            prescription.dispense_status = Prescription.STATUS_DISPENSED
+            prescription.dispensed_at = timezone.now()
+            prescription.dispensed_by = getattr(request.user, 'clinicuser', None)
+            prescription.save(update_fields=['dispense_status', 'dispensed_at', 'dispensed_by', 'updated_at'])
             
             return JsonResponse({
                 'success': True,
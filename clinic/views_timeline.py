@@ -0,0 +1,197 @@
+# clinic/views_timeline.py
+"""
+Patient longitudinal timeline API.
+Visits, medical records, prescriptions, billing, certificates and transfers
+merged into one stream, paginated by visit with an opaque cursor.
+"""
+
+import base64
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+
+from .models import BillingItem, Patient, Prescription, PrescriptionItem, Visit
+from .models_medical_records import MedicalCertificate, MedicalRecord, PatientTransfer
+
+TIMELINE_PAGE_SIZE = 20
+TIMELINE_MAX_PAGE_SIZE = 100
+
+# Clinical entries (records, prescriptions, certificates) are limited to these roles
+CLINICAL_ROLES = ('doctor', 'admin')
+TIMELINE_ROLES = CLINICAL_ROLES + ('reception',)
+
+
+def _encode_cursor(visit):
+    raw = json.dumps([visit.created_at.isoformat(), visit.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    created_at, visit_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    created_at = parse_datetime(created_at)
+    if created_at is None:
+        raise ValueError('Invalid cursor timestamp')
+    return created_at, int(visit_id)
+
+
+def _user_name(clinic_user):
+    if not clinic_user:
+        return None
+    return clinic_user.user.get_full_name() or clinic_user.user.username
+
+
+def _event(kind, timestamp, visit_id, **data):
+    return {'type': kind, 'timestamp': timestamp.isoformat() if timestamp else None, 'visit_id': visit_id, 'data': data}
+
+
+@login_required
+def patient_timeline(request, patient_id):
+    """Chronological patient history, newest first.
+
+    ``?cursor=`` continues from the previous page's ``next_cursor``; ``?limit=``
+    sets the number of visits per page. Each page runs one query per entity
+    type regardless of how long the patient's history is.
+    """
+    clinic_user = getattr(request.user, 'clinicuser', None)
+    if not request.user.is_superuser and (not clinic_user or clinic_user.role not in TIMELINE_ROLES):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    clinical = request.user.is_superuser or clinic_user.role in CLINICAL_ROLES
+
+    patient = get_object_or_404(Patient, id=patient_id)
+
+    try:
+        limit = min(int(request.GET.get('limit', TIMELINE_PAGE_SIZE)), TIMELINE_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a positive integer'}, status=400)
+
+    visits = (
+        Visit.objects.filter(patient=patient)
+        .select_related('department', 'doctor__user', 'invoice')
+        .order_by('-created_at', '-id')
+    )
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            created_at, visit_id = _decode_cursor(cursor)
+        except (ValueError, TypeError, json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        visits = visits.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=visit_id))
+
+    page = list(visits[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    visit_ids = [visit.id for visit in page]
+
+    events = []
+    billing_by_visit = {}
+    if visit_ids:
+        for item in BillingItem.objects.filter(visit_id__in=visit_ids).select_related('tariff'):
+            billing_by_visit.setdefault(item.visit_id, []).append(item)
+
+        transfers = PatientTransfer.objects.filter(visit_id__in=visit_ids).select_related(
+            'from_doctor__user', 'to_doctor__user', 'from_department', 'to_department'
+        )
+        for transfer in transfers:
+            events.append(_event(
+                'transfer', transfer.transferred_at, transfer.visit_id,
+                from_doctor=_user_name(transfer.from_doctor),
+                to_doctor=_user_name(transfer.to_doctor),
+                from_department=transfer.from_department.name if transfer.from_department else None,
+                to_department=transfer.to_department.name if transfer.to_department else None,
+                reason=transfer.reason,
+                accepted=transfer.accepted,
+            ))
+
+        if clinical:
+            for record in MedicalRecord.objects.filter(visit_id__in=visit_ids):
+                events.append(_event(
+                    'medical_record', record.created_at, record.visit_id,
+                    id=record.id,
+                    updated_at=record.updated_at.isoformat(),
+                    chief_complaint=record.chief_complaint,
+                    diagnosis=record.diagnosis,
+                    treatment_plan=record.treatment_plan,
+                    hmis_classification=record.hmis_classification,
+                    idsr_disease=record.idsr_disease,
+                ))
+
+            prescriptions = (
+                Prescription.objects.filter(visit_id__in=visit_ids)
+                .select_related('doctor__user')
+                .prefetch_related(Prefetch('items', queryset=PrescriptionItem.objects.select_related('inventory_item')))
+            )
+            for prescription in prescriptions:
+                events.append(_event(
+                    'prescription', prescription.created_at, prescription.visit_id,
+                    id=prescription.id,
+                    prescription_type=prescription.prescription_type,
+                    doctor=_user_name(prescription.doctor),
+                    instructions=prescription.instructions,
+                    items=[
+                        {
+                            'name': item.inventory_item.name if item.inventory_item else item.custom_name,
+                            'quantity': item.quantity,
+                            'dosage': item.dosage,
+                            'frequency': item.frequency,
+                            'duration': item.duration,
+                        }
+                        for item in prescription.items.all()
+                    ],
+                ))
+
+            certificates = MedicalCertificate.objects.filter(visit_id__in=visit_ids).select_related('doctor__user')
+            for certificate in certificates:
+                events.append(_event(
+                    'certificate', certificate.created_at, certificate.visit_id,
+                    id=certificate.id,
+                    certificate_type=certificate.certificate_type,
+                    doctor=_user_name(certificate.doctor),
+                    diagnosis=certificate.diagnosis,
+                    duration_days=certificate.duration_days,
+                    valid_until=certificate.valid_until.isoformat() if certificate.valid_until else None,
+                ))
+
+    for visit in page:
+        events.append(_event(
+            'visit', visit.created_at, visit.id,
+            status=visit.status,
+            department=visit.department.name if visit.department else None,
+            doctor=_user_name(visit.doctor),
+        ))
+
+        invoice = getattr(visit, 'invoice', None)
+        items = billing_by_visit.get(visit.id, [])
+        if items or invoice:
+            events.append(_event(
+                'billing', invoice.created_at if invoice else visit.created_at, visit.id,
+                items=[
+                    {
+                        'act': item.tariff.name,
+                        'qty': item.qty,
+                        'price_private': str(item.price_private_snapshot),
+                        'price_insurance': str(item.price_insurance_snapshot) if item.price_insurance_snapshot is not None else None,
+                    }
+                    for item in items
+                ],
+                invoice={
+                    'id': invoice.id,
+                    'total_private': str(invoice.total_private),
+                    'total_insurance': str(invoice.total_insurance),
+                    'paid': invoice.paid,
+                    'paid_at': invoice.paid_at.isoformat() if invoice.paid_at else None,
+                } if invoice else None,
+            ))
+
+    events.sort(key=lambda event: event['timestamp'] or '', reverse=True)
+
+    return JsonResponse({
+        'patient': {'id': patient.id, 'name': f"{patient.first_name} {patient.last_name}".strip()},
+        'results': events,
+        'next_cursor': _encode_cursor(page[-1]) if has_more else None,
+    })
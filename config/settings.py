@@ -77,6 +77,17 @@ TEMPLATES = [{
     },
 }]
 
+# Always serve templates through the cached loader outside DEBUG, so compiled
+# templates (and their {% cache %} fragments) are reused across requests.
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
@@ -90,6 +101,16 @@ DATABASES = {
     }
 }
 
+# Shared cache for dashboard snapshots. The default local-memory cache is per
+# process, which is fine for the single waitress process; point CACHE_BACKEND
+# at a shared backend (e.g. redis) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'nora-clinic'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -114,6 +135,20 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Chunked attachment uploads: partial files live here until the checksum matches
+ATTACHMENT_UPLOAD_DIR = BASE_DIR / 'media' / 'uploads' / 'partial'
+ATTACHMENT_CHUNK_SIZE = 5 * 1024 * 1024
+ATTACHMENT_MAX_SIZE = 200 * 1024 * 1024
+
+# Thumbnails/previews are rendered by a background thread after upload
+IMAGE_DERIVATIVE_WORKERS = 1
+
+# Characters per line on the cashier thermal printer (32 for 58mm paper, 42 for 80mm)
+RECEIPT_PRINTER_COLUMNS = 42
+
+# Minutes a clinic prescription holds its stock before the pharmacy must dispense it
+STOCK_RESERVATION_MINUTES = 240
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
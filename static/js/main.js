@@ -265,3 +265,205 @@ function validateForm(formId) {
     
     return isValid;
 }
+
+// ============================================================================
+// Medical Record Autosave
+// ============================================================================
+// Forms with data-autosave-url send only the fields that changed since the
+// last successful save, together with the record version they were based on.
+// Only inputs with data-field take part; it names the model field(s) they
+// map to (comma separated).
+
+function initMedicalRecordAutosave(form) {
+    const url = form.dataset.autosaveUrl;
+    const status = form.querySelector('[data-autosave-status]');
+    const versionInput = form.querySelector('input[name="record_version"]');
+    let version = parseInt(form.dataset.version || '1', 10);
+    let timer = null;
+    let inFlight = false;
+    let stopped = false;
+
+    const inputs = Array.from(form.querySelectorAll('[data-field]'));
+    const fieldsOf = input => input.dataset.field.split(',');
+    const saved = new Map(inputs.map(input => [input, input.value]));
+
+    function setStatus(text) {
+        if (status) status.textContent = text;
+    }
+
+    function changedFields() {
+        const fields = {};
+        inputs.forEach(input => {
+            if (saved.get(input) !== input.value) {
+                fieldsOf(input).forEach(field => { fields[field] = input.value; });
+            }
+        });
+        return fields;
+    }
+
+    async function flush() {
+        if (inFlight || stopped) return;
+        const fields = changedFields();
+        if (!Object.keys(fields).length) return;
+
+        const snapshot = new Map(inputs.map(input => [input, input.value]));
+        inFlight = true;
+        setStatus('Saving...');
+        try {
+            const response = await fetch(url, {
+                method: 'PATCH',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value,
+                },
+                body: JSON.stringify({ version, fields }),
+            });
+            const data = await response.json();
+            if (response.status === 409) {
+                stopped = true;
+                setStatus('This record was changed in another tab. Reload to see the latest version.');
+                return;
+            }
+            if (!response.ok || !data.success) {
+                setStatus(data.error || 'Autosave failed');
+                return;
+            }
+            version = data.version;
+            if (versionInput) versionInput.value = version;
+            snapshot.forEach((value, input) => saved.set(input, value));
+            setStatus('All changes saved');
+        } catch (error) {
+            setStatus('Offline - changes not saved yet');
+        } finally {
+            inFlight = false;
+        }
+        // Pick up anything typed while the request was running.
+        if (Object.keys(changedFields()).length) schedule();
+    }
+
+    function schedule() {
+        clearTimeout(timer);
+        timer = setTimeout(flush, 2000);
+    }
+
+    inputs.forEach(input => {
+        input.addEventListener(input.tagName === 'SELECT' ? 'change' : 'input', schedule);
+    });
+}
+
+/**
+ * Resumable chunked upload for file inputs with data-chunked-upload-url.
+ * Files are sent in chunks with their SHA-256 so a dropped connection (or a
+ * page reload followed by re-selecting the file) resumes where it stopped.
+ * Without WebCrypto the input is left alone and the form posts the files.
+ */
+function initChunkedUpload(input) {
+    const form = input.closest('form');
+    const status = form.querySelector('[data-upload-status]');
+    const csrfToken = () => form.querySelector('[name=csrfmiddlewaretoken]').value;
+    const fileType = form.querySelector('[name=file_type]') || { value: '' };
+    const description = form.querySelector('[name=file_description]') || { value: '' };
+
+    function setStatus(text) {
+        if (status) status.textContent = text;
+    }
+
+    async function sha256(blob) {
+        const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function requestJson(url, options) {
+        const response = await fetch(url, options);
+        const data = await response.json();
+        return { response, data };
+    }
+
+    // Only chunks are hashed in the browser (WebCrypto cannot digest a file
+    // incrementally); the server computes the whole-file SHA-256 on completion.
+    async function startOrResume(file) {
+        const key = `attachment-upload:${input.dataset.chunkedUploadUrl}:${file.name}:${file.size}:${file.lastModified}`;
+        const saved = localStorage.getItem(key);
+        if (saved) {
+            const { response, data } = await requestJson(saved, {});
+            if (response.ok && !data.complete) return { key, state: data };
+        }
+        const { response, data } = await requestJson(input.dataset.chunkedUploadUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                file_type: fileType.value || (file.type.startsWith('image/') ? 'photo' : 'document'),
+                description: description.value,
+            }),
+        });
+        if (!response.ok) throw new Error(data.error || 'Upload could not be started');
+        localStorage.setItem(key, data.url);
+        return { key, state: data };
+    }
+
+    async function upload(file) {
+        let { key, state } = await startOrResume(file);
+        let failures = 0;
+        while (!state.complete) {
+            const start = state.offset;
+            const chunk = file.slice(start, Math.min(start + state.chunk_size, file.size));
+            setStatus(`Uploading ${file.name}: ${Math.floor(start * 100 / file.size)}%`);
+            try {
+                const { response, data } = await requestJson(state.url, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Range': `bytes ${start}-${start + chunk.size - 1}/${file.size}`,
+                        'X-Chunk-SHA256': await sha256(chunk),
+                        'X-CSRFToken': csrfToken(),
+                    },
+                    body: chunk,
+                });
+                if (response.ok) {
+                    state = data;
+                    failures = 0;
+                } else if (response.status === 409 || response.status === 422) {
+                    state = { ...state, offset: data.offset };
+                    failures += 1;
+                } else {
+                    throw new Error(data.error || 'Upload failed');
+                }
+            } catch (error) {
+                failures += 1;
+                if (failures > 5) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                const { data } = await requestJson(state.url, {});
+                state = data;
+            }
+            if (failures > 5) throw new Error('Upload keeps failing, please try again');
+        }
+        localStorage.removeItem(key);
+        return state;
+    }
+
+    input.addEventListener('change', async () => {
+        if (!window.crypto || !crypto.subtle) return;
+        const files = Array.from(input.files);
+        let done = 0;
+        try {
+            for (const file of files) {
+                await upload(file);
+                done += 1;
+            }
+            input.value = '';
+            setStatus(`${files.length} file(s) uploaded`);
+        } catch (error) {
+            // Leave only the files that did not make it for the normal form post.
+            const remaining = new DataTransfer();
+            files.slice(done).forEach(file => remaining.items.add(file));
+            input.files = remaining.files;
+            setStatus(`${error.message}. Remaining files will be sent when the form is saved.`);
+        }
+    });
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('form[data-autosave-url]').forEach(initMedicalRecordAutosave);
+    document.querySelectorAll('input[type=file][data-chunked-upload-url]').forEach(initChunkedUpload);
+});